@@ -12,6 +12,21 @@ class ApiserverSettings(BaseSettings):
     client_id: str = None
     client_secret: str = None
     server_metadata_url: str = None
+    cache_size: int = 10000
+    storage_threads: int = 8
+    storage_backend: str = "json"
+    sqlite_path: str = None
+    shard_depth: int = 0
+    wal_checkpoint_size: int = 4 * 1024 * 1024
+    segment_path: str = None
+    segment_size: int = 64 * 1024 * 1024
+    segment_fsync: bool = True
+    compaction_interval: float = 60.0
+    changelog_path: str = None
+    change_retention: float = 7 * 24 * 60 * 60
+    event_queue_size: int = 1000
+    event_heartbeat: float = 15.0
+    gzip_minimum_size: int = 1000
 
     class Config:
         env_prefix: str = "datacatalog_apiserver_"
@@ -1,22 +1,26 @@
 """
 Main module of data catalog api
 """
+import base64
+import hashlib
+import json
 import logging
 import os
 from datetime import timedelta, datetime
 from enum import Enum
-from typing import Dict, List
+from typing import Any, Dict, List, Optional, Tuple, Union
 from functools import wraps
 
-from fastapi import FastAPI, HTTPException, Query, status
+from fastapi import FastAPI, HTTPException, Query, Response, status
 from fastapi.param_functions import Depends
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 
 from authlib.integrations.starlette_client import OAuth
 
 from pydantic import UUID4
+from starlette.background import BackgroundTask
 from starlette.responses import RedirectResponse
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.requests import Request
@@ -24,10 +28,17 @@ from starlette.requests import Request
 from apiserver.security.user import Secret
 
 from .config import ApiserverSettings
+from .responses import CompressionMiddleware, FastJSONResponse
 from .security import (ACCESS_TOKEN_EXPIRES_MINUTES, JsonDBInterface, Token,
                        User, authenticate_user, create_access_token,
                        get_current_user)
-from .storage import JsonFileStorageAdapter, LocationData, LocationDataType, EncryptedJsonFileStorageAdapter
+from .storage import (JsonFileStorageAdapter, LocationData, LocationDataType, EncryptedJsonFileStorageAdapter, CachedStorageAdapter, AsyncStorageAdapter,
+                      QueryFilters, QueryPage, BatchOperation, BatchResult, DeleteResult, DeleteStatus, MultiGetResult, SqliteStorageAdapter, EncryptedSqliteStorageAdapter,
+                      SegmentStorageAdapter, EncryptedSegmentStorageAdapter, ChangeLog, ChangeFeed, ChangesExpired,
+                      ChangeTrackingStorageAdapter, ChangeBroadcaster, event_stream, ImportResult,
+                      SnapshotStorageAdapter, RestoreResult)
+from .storage.BulkTransfer import import_lines, iter_export, iter_gunzip, iter_lines, iter_snapshot, restore_lines
+from .storage.ChangeLog import DEFAULT_CHANGELOG_FILENAME
 
 log = logging.getLogger(__name__)
 
@@ -63,7 +74,8 @@ app.add_middleware(CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Snapshot-Seq"]
 )
 
 # if env variable is set, get config .env filepath from it, else use default
@@ -72,13 +84,40 @@ dotenv_file_path = os.getenv(DOTENV_FILE_PATH_VARNAME, DOTENV_FILE_PATH_DEFAULT)
 
 settings = ApiserverSettings(_env_file=dotenv_file_path)
 
+app.add_middleware(CompressionMiddleware, minimum_size=settings.gzip_minimum_size)
+
+STORAGE_BACKENDS = {
+    "json": (JsonFileStorageAdapter, EncryptedJsonFileStorageAdapter),
+    "sqlite": (SqliteStorageAdapter, EncryptedSqliteStorageAdapter),
+    "segments": (SegmentStorageAdapter, EncryptedSegmentStorageAdapter)
+}
+
+if settings.storage_backend not in STORAGE_BACKENDS:
+    raise Exception(f"Unknown storage backend {settings.storage_backend}, use one of {list(STORAGE_BACKENDS)}.")
+plain_adapter, encrypted_adapter = STORAGE_BACKENDS[settings.storage_backend]
+log.debug("Using %s storage backend.", settings.storage_backend)
+
 if settings.encryption_key is not None and settings.encryption_key:
     log.debug("Using encrypted secrets backend.")
     # let the error break the server (clearly an encrypted backed is requested, 
     # fallback to non encrypted is not good)
-    adapter = EncryptedJsonFileStorageAdapter(settings)
+    adapter = encrypted_adapter(settings)
 else:
-    adapter = JsonFileStorageAdapter(settings)
+    adapter = plain_adapter(settings)
+
+if settings.cache_size > 0:
+    log.debug("Caching up to %d objects in memory.", settings.cache_size)
+    adapter = CachedStorageAdapter(adapter, settings.cache_size)
+
+changelog = ChangeLog(settings.changelog_path or os.path.join(settings.json_storage_path, DEFAULT_CHANGELOG_FILENAME),
+                      settings.change_retention)
+adapter = ChangeTrackingStorageAdapter(adapter, changelog)
+broadcaster = ChangeBroadcaster(changelog, settings.event_queue_size)
+# outermost, so a snapshot sees every write before it reaches the change log
+adapter = SnapshotStorageAdapter(adapter, changelog)
+
+# the routes only use the storage through this, so blocking I/O stays off the event loop
+async_adapter = AsyncStorageAdapter(adapter, settings.storage_threads)
 
 userdb = JsonDBInterface(settings)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=ReservedPaths.TOKEN)
@@ -96,11 +135,11 @@ oauth.register(
 
 log.info("Loaded the following settings: data directory = %s | userdb location = %s", settings.json_storage_path, settings.userdb_path)
 
-def my_user(token=Depends(oauth2_scheme)):
-    return get_current_user(token, userdb)
+async def my_user(token=Depends(oauth2_scheme)):
+    return await async_adapter.run(get_current_user, token, userdb)
 
-def my_auth(form_data: OAuth2PasswordRequestForm = Depends()):
-    return authenticate_user(userdb, form_data.username, form_data.password)
+async def my_auth(form_data: OAuth2PasswordRequestForm = Depends()):
+    return await async_adapter.run(authenticate_user, userdb, form_data.username, form_data.password)
 
 def secrets_required(func):
     @wraps(func)
@@ -111,6 +150,63 @@ def secrets_required(func):
         return await func(*args, **kwargs)
     return wrapper
 
+def encode_cursor(entry) -> str:
+    """encode the last returned (name, id) pair as opaque cursor for the next page"""
+    return base64.urlsafe_b64encode(json.dumps(list(entry)).encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        name, oid = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (str(name), str(oid))
+    except (TypeError, ValueError):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid cursor")
+
+def parse_fields(fields: str) -> List[Tuple[str, Optional[str]]]:
+    """split the comma separated fields of a listing (name, url, metadata or metadata.<key>) into (field, key) pairs"""
+    parsed = []
+    for field in fields.split(","):
+        field = field.strip()
+        if not field:
+            continue
+        attribute, dot, key = field.partition(".")
+        if attribute not in ("name", "url", "metadata") or (dot and (attribute != "metadata" or not key)):
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, f"Unknown field {field}")
+        parsed.append((attribute, key or None))
+    if not parsed:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "No fields given")
+    return parsed
+
+def project(oid: str, data: LocationData, fields: List[Tuple[str, Optional[str]]]) -> Dict[str, Any]:
+    """the requested fields of the object with its id; metadata keys the object does not have are left out"""
+    projected: Dict[str, Any] = {"oid": oid}
+    for attribute, key in fields:
+        if attribute != "metadata":
+            projected[attribute] = getattr(data, attribute)
+            continue
+        metadata = projected.setdefault("metadata", {})
+        if key is None:
+            metadata.update(data.metadata or {})
+        elif key in (data.metadata or {}):
+            metadata[key] = data.metadata[key]
+    return projected
+
+def make_etag(*versions) -> str:
+    """weak etag from the given version tokens; weak, as the body may be encoded differently"""
+    return 'W/"' + hashlib.sha1(repr(versions).encode()).hexdigest() + '"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """weak comparison of the etag with the If-None-Match header of the request"""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    return any((tag[2:] if tag.startswith('W/') else tag) == opaque for tag in (t.strip() for t in header.split(',')))
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
 @app.get("/sso_login")
 async def sso_login(request: Request):
     """redirect to keycloak for login, obtain keycloak token via cookie"""
@@ -136,13 +232,13 @@ async def sso_token(request: Request):
     email = user['email']
 
 
-    if userdb.get(persistent_identifier) is None:
+    if await async_adapter.run(userdb.get, persistent_identifier) is None:
         # check if user should be added
         access_group = "datacat_write"
-        userdb.add_external_auth_user(persistent_identifier, email)
+        await async_adapter.run(userdb.add_external_auth_user, persistent_identifier, email)
 
             
-    datacat_user = userdb.get(persistent_identifier)
+    datacat_user = await async_adapter.run(userdb.get, persistent_identifier)
 
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRES_MINUTES)
     access_token = create_access_token(
@@ -196,11 +292,10 @@ async def get_types(request: Request = None, element_numbers: bool = False):
     accept_json = "application/json"
     accept_html = "text/html"
     default_return = [{element.value: "/" + element.value} for element in LocationDataType]
-    element_number_return = [{element.value : len(adapter.get_list(element))} for element in LocationDataType]
     redirect_return = RedirectResponse(url='/index.html')
 
     if (element_numbers):
-        return element_number_return
+        return [{element.value : await async_adapter.count(element)} for element in LocationDataType]
 
     # uses first of json and html that is in the accept header; returns json if neither is found
     json_pos = accept_header.find(accept_json)
@@ -218,8 +313,43 @@ async def get_types(request: Request = None, element_numbers: bool = False):
     return default_return
 
 
-@app.get("/{location_data_type}", response_model=List[List[str]])
-async def list_datasets(location_data_type: LocationDataType, search: str = None, name: str = None, url: str = None, has_key: List[str] = Query(default=None), page: int = None, page_size: int = 25, element_numbers: bool = False):
+@app.get("/_snapshot")
+@secrets_required
+async def create_snapshot(since: int = None, user: User = Depends(my_user)):
+    """
+    stream a consistent snapshot of all objects with their users and stored (i.e. encrypted) secrets, as of the
+    moment of the request, as gzip compressed newline delimited json; writes continue meanwhile. With since
+    (the X-Snapshot-Seq of an earlier snapshot), only the objects changed since then and the ids of deleted
+    objects are included. Answers 410 if the changes since then are no longer retained\n
+    since: \n
+    """
+    try:
+        snapshot = await async_adapter.begin_snapshot(since)
+    except ChangesExpired as ex:
+        raise HTTPException(status.HTTP_410_GONE, str(ex))
+    log.debug("Authenticed User: '%s' took snapshot %d", user.username, snapshot.seq)
+    headers = {'X-Snapshot-Seq': str(snapshot.seq),
+               'Content-Disposition': f'attachment; filename="snapshot-{snapshot.seq}.ndjson.gz"'}
+    # also run when the client disconnects, the stream is then abandoned without being closed
+    return StreamingResponse(iter_snapshot(async_adapter, snapshot), media_type="application/gzip", headers=headers,
+                             background=BackgroundTask(snapshot.close))
+
+
+@app.post("/_restore", response_model=RestoreResult)
+@secrets_required
+async def restore_snapshot(request: Request, user: User = Depends(my_user)):
+    """
+    restore a snapshot (the gzip compressed body, read and stored in batches while it is uploaded), replacing
+    objects with the same ids; incremental snapshots have to be restored in order after the full one. Returns
+    the numbers of restored, deleted and failed objects, the first errors by line number and whether the
+    snapshot was read completely
+    """
+    log.debug("Authenticed User: '%s' restored a snapshot", user.username)
+    return await restore_lines(async_adapter, iter_lines(iter_gunzip(request.stream())), user.username)
+
+
+@app.get("/{location_data_type}", response_model=Union[List[List[str]], List[Dict[str, Any]]])
+async def list_datasets(location_data_type: LocationDataType, request: Request, search: str = None, name: str = None, url: str = None, has_key: List[str] = Query(default=None), page: int = None, page_size: int = 25, cursor: str = None, element_numbers: bool = False, fields: str = None):
     """
     list id and name of all matching registered datasets for the specified type\n
     name: has to be contained in the name of the object\n
@@ -228,76 +358,137 @@ async def list_datasets(location_data_type: LocationDataType, search: str = None
     search: has to contain this term in any field of the object (name, url, metadata key or metadata value)\n
     page: \n
     page_size: \n
+    cursor: continue after the last element of a previous page, taken from its X-Next-Cursor header; page then counts from there\n
     element_numbers: \n
+    fields: comma separated fields to return with the id of every object instead of the [name, id] pairs, from name, url, metadata and metadata.<key>\n
+    The response carries an ETag, a request with a matching If-None-Match header is answered with 304
     """
-    datasets = adapter.get_list(location_data_type)
-
-    if name:
-        tmpset = []
-        for element in datasets:
-            if name.lower() in element[0].lower():
-                tmpset.append(element)
-        datasets = tmpset
-
-    if url:
-        tmpset = []
-        for element in datasets:
-            if url.lower() in adapter.get_details(location_data_type, element[1]).url.lower():
-                tmpset.append(element)
-        datasets = tmpset
-    
-    if has_key:
-        tmpset = []
-        for element in datasets:
-            if set(has_key).issubset(set(adapter.get_details(location_data_type, element[1]).metadata.keys())):
-                tmpset.append(element)
-        datasets = tmpset
-
-    if search:
-        tmpset = []
-        for element in datasets:
-            if search.lower() in element[0].lower():
-                tmpset.append(element)
-                continue
-            details = adapter.get_details(location_data_type, element[1])
-            if search.lower() in details.url.lower():
-                tmpset.append(element)
-                continue
-            metadata_match = False
-            for key, value  in details.metadata.items():
-                if search.casefold() in key.casefold() or search.casefold() in value.casefold():
-                    metadata_match = True
-                    break
-            if metadata_match:
-                tmpset.append(element)
-                continue
-
-            
-        datasets = tmpset
-
+    projection = parse_fields(fields) if fields else None
+    headers = {}
+    # taken before the listing, so a concurrent change leads to a new etag on the next request
+    generation = await async_adapter.get_generation(location_data_type)
+    if generation is not None:
+        etag = make_etag(location_data_type.value, generation, request.url.query)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        headers['ETag'] = etag
+    filters = QueryFilters(name=name, url=url, has_key=has_key, search=search)
+
+    # the (name, id) pairs come straight from the storage, so they are encoded without validation
     if (element_numbers):
-        return [[location_data_type.value, str(len(datasets))]]
-
-    sorted_datasets = sorted(datasets, key=lambda x: (x[0], x[1]))
-
-    if (page):
-        # get page_size elements at index (page-1) * page_size
-        index = (page - 1) * page_size
-        if index >= len(sorted_datasets):
-            return []
-        elif index + page_size > len(sorted_datasets):
-            return sorted_datasets[index:]
-        else:
-            return sorted_datasets[index:index+page_size]
+        return FastJSONResponse([[location_data_type.value, str(await async_adapter.count(location_data_type, filters))]], headers=headers)
+
+    if not (page or cursor):
+        datasets = await async_adapter.query(location_data_type, filters)
     else:
-        return sorted_datasets
-    
+        query_page = QueryPage(number=page or 1, size=page_size, after=decode_cursor(cursor) if cursor else None)
+        datasets = await async_adapter.query(location_data_type, filters, page=query_page)
+        if datasets and len(datasets) == page_size:
+            headers['X-Next-Cursor'] = encode_cursor(datasets[-1])
+
+    if projection is None:
+        return FastJSONResponse(datasets, headers=headers)
+    if all(attribute == "name" for attribute, _ in projection):
+        return FastJSONResponse([{"oid": oid, "name": name} for name, oid in datasets], headers=headers)
+    # one batched load of the listed objects, served from the cache if it has them
+    objects = await async_adapter.get_many(location_data_type, [oid for _, oid in datasets])
+    return FastJSONResponse([project(oid, objects[oid], projection) for _, oid in datasets if oid in objects], headers=headers)
+
+
+@app.get("/{location_data_type}/_keys", response_model=Dict[str, int])
+async def list_metadata_keys(location_data_type: LocationDataType):
+    """list all metadata keys used by objects of the specified type, with the number of objects using each key"""
+    return await async_adapter.get_key_counts(location_data_type)
+
+
+@app.get("/{location_data_type}/_facets", response_model=Dict[str, Dict[str, int]])
+async def list_facets(location_data_type: LocationDataType, keys: List[str] = Query(), search: str = None, name: str = None, url: str = None, has_key: List[str] = Query(default=None)):
+    """
+    count the objects of the specified type per value of each of the given metadata keys, optionally only
+    those matching the filters of the listing\n
+    keys: the metadata keys to count the values of, can be given multiple times\n
+    search: \n
+    name: \n
+    url: \n
+    has_key: \n
+    """
+    filters = QueryFilters(name=name, url=url, has_key=has_key, search=search)
+    return await async_adapter.get_facets(location_data_type, keys, filters)
+
+
+@app.get("/{location_data_type}/_changes", response_model=ChangeFeed)
+async def list_changes(location_data_type: LocationDataType, since: int = None, limit: int = Query(default=1000, ge=1)):
+    """
+    list up to limit changes (create, update, delete, secrets) of the specified type after the sequence number since,
+    in order; pass the returned last_seq as since of the next request. Without since, only the current
+    sequence number is returned. Answers 410 if the changes since then are no longer retained\n
+    since: \n
+    limit: \n
+    """
+    try:
+        return await async_adapter.run(changelog.changes, location_data_type, since, limit)
+    except ChangesExpired as ex:
+        raise HTTPException(status.HTTP_410_GONE, str(ex))
+
+
+@app.get("/{location_data_type}/_events")
+async def stream_changes(location_data_type: LocationDataType, request: Request, since: int = None):
+    """
+    stream the changes of the specified type as server-sent events, as they happen; the id of every event
+    is its sequence number, the event type its action and the data the change as listed by _changes.
+    Changes after since (or the Last-Event-ID header of a reconnecting client) are sent first.
+    Clients that do not keep up get an overflow event and are disconnected\n
+    since: \n
+    """
+    last_event_id = request.headers.get('last-event-id')
+    if last_event_id:
+        try:
+            since = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid Last-Event-ID")
+    # subscribe before reading the replay, so no change is lost in between
+    subscription = broadcaster.subscribe(location_data_type)
+    replay = []
+    if since is not None:
+        try:
+            replay = (await async_adapter.run(changelog.changes, location_data_type, since)).changes
+        except ChangesExpired as ex:
+            broadcaster.unsubscribe(subscription)
+            raise HTTPException(status.HTTP_410_GONE, str(ex))
+    return StreamingResponse(event_stream(broadcaster, subscription, replay, settings.event_heartbeat),
+                             media_type="text/event-stream", headers={'Cache-Control': 'no-cache'})
+
+
+@app.get("/{location_data_type}/_export")
+async def export_datasets(location_data_type: LocationDataType):
+    """
+    stream all objects of the specified type with their full details as newline delimited json,
+    one object with its oid per line, sorted by name and id
+    """
+    return StreamingResponse(iter_export(async_adapter, location_data_type), media_type="application/x-ndjson")
+
+
+@app.post("/{location_data_type}/_multiget", response_model=MultiGetResult)
+async def get_multiple_datasets(location_data_type: LocationDataType, dataset_ids: List[UUID4]):
+    """returns all information about every requested dataset that exists, by id, and the ids of those that do not"""
+    oids = list(dict.fromkeys(str(oid) for oid in dataset_ids))
+    found = await async_adapter.get_many(location_data_type, oids)
+    return MultiGetResult(found=found, missing=[oid for oid in oids if oid not in found])
 
 
 @app.get("/{location_data_type}/{dataset_id}", response_model=LocationData)
-async def get_specific_dataset(location_data_type: LocationDataType, dataset_id: UUID4):
-    """returns all information about a specific dataset, identified by id"""
-    return adapter.get_details(location_data_type, str(dataset_id))
+async def get_specific_dataset(location_data_type: LocationDataType, dataset_id: UUID4, request: Request, response: Response):
+    """
+    returns all information about a specific dataset, identified by id. The response carries
+    an ETag, a request with a matching If-None-Match header is answered with 304
+    """
+    version = await async_adapter.get_version(location_data_type, str(dataset_id))
+    if version is not None:
+        etag = make_etag(location_data_type.value, str(dataset_id), version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response.headers['ETag'] = etag
+    return await async_adapter.get_details(location_data_type, str(dataset_id))
 
 @app.post("/{location_data_type}")
 async def add_dataset(location_data_type: LocationDataType,
@@ -305,7 +496,37 @@ async def add_dataset(location_data_type: LocationDataType,
                       user: User = Depends(my_user)):
     """register a new dataset, the response will contain the new dataset and its id"""
     log.debug("Authenticed User: '%s' created new /%s", user.username, location_data_type.value)
-    return adapter.add_new(location_data_type, dataset, user.username)
+    return await async_adapter.add_new(location_data_type, dataset, user.username)
+
+
+@app.post("/{location_data_type}/_batch", response_model=List[BatchResult])
+async def apply_batch(location_data_type: LocationDataType,
+                      operations: List[BatchOperation],
+                      user: User = Depends(my_user)):
+    """
+    apply a list of create, update and delete operations in one transaction; either all
+    operations are applied or none. Every object may only be changed once per batch.
+    Returns the id and new data (not for deletions) for every operation, in order
+    """
+    log.debug("Authenticed User: '%s' applied a batch of %d operations to /%s", user.username, len(operations), location_data_type.value)
+    results = await async_adapter.apply_batch(location_data_type, operations, user.username)
+    return [BatchResult(action=op.action, oid=oid, data=data) for op, (oid, data) in zip(operations, results)]
+
+
+@app.post("/{location_data_type}/_import", response_model=ImportResult)
+async def import_datasets(location_data_type: LocationDataType,
+                          request: Request,
+                          upsert: bool = False,
+                          user: User = Depends(my_user)):
+    """
+    create an object for every line of a newline delimited json body (e.g. from _export), which is read and
+    stored in batches while it is uploaded. With upsert, an existing object with the same name is updated
+    instead. Invalid lines are skipped; returns the numbers of created, updated and failed objects and the
+    first errors by line number\n
+    upsert: \n
+    """
+    log.debug("Authenticed User: '%s' imported into /%s", user.username, location_data_type.value)
+    return await import_lines(async_adapter, location_data_type, iter_lines(request.stream()), user.username, upsert)
 
 
 @app.put("/{location_data_type}/{dataset_id}")
@@ -314,28 +535,22 @@ async def update_specific_dataset(location_data_type: LocationDataType,
                                   user: User = Depends(my_user)):
     """update the information about a specific dataset, identified by id"""
     log.debug("Authenticed User: '%s' modified /%s/%s", user.username, location_data_type.value, dataset_id)
-    return adapter.update_details(location_data_type, str(dataset_id), dataset, user.username)
-
-@app.delete("/{location_data_type}")
+    return await async_adapter.update_details(location_data_type, str(dataset_id), dataset, user.username)
 
+@app.delete("/{location_data_type}", response_model=List[DeleteResult])
 async def delete_multiple_datasets(location_data_type: LocationDataType,
                                   dataset_ids: List[UUID4],
                                   user: User = Depends(my_user)
                                   ):
     """
-    Attempts deletion of every sent dataset. If it fails for any of the sent datasets (for example due to a not found error), the attempts for the other datasets will still be made. 
-    This may result in an incomplete delete and may return error codes. 
+    delete every sent dataset that exists in one batch. Returns the status of every
+    sent id, in order: deleted, or not_found if there was no such dataset
     """
     log.debug("Authenticed User: '%s' deleted multiple %s objects: %s", user.username, location_data_type.value, str(dataset_ids))
-    other_error = False
-    for oid in dataset_ids:
-        try:
-            adapter.delete(location_data_type, str(oid), user.username)
-        except:
-            other_error = True
-    if other_error:
-        raise HTTPException(500, "Some error occured during the bulk deletion. Some, None or all elements may have been deleted") # TODO better error identification and message
-    return JSONResponse({'message':'Bulk deletion successful.'})
+    oids = list(dict.fromkeys(str(oid) for oid in dataset_ids))
+    deleted = set(await async_adapter.delete_many(location_data_type, oids, user.username))
+    return [DeleteResult(oid=oid, status=DeleteStatus.DELETED if oid in deleted else DeleteStatus.NOT_FOUND)
+            for oid in oids]
 
 @app.delete("/{location_data_type}/{dataset_id}")
 async def delete_specific_dataset(location_data_type: LocationDataType,
@@ -344,7 +559,7 @@ async def delete_specific_dataset(location_data_type: LocationDataType,
     """delete a specific dataset"""
     # TODO: 404 is the right answer? 204 could also be the right one
     log.debug("Authenticed User: '%s' deleted /%s/%s", user.username, location_data_type.value, dataset_id)
-    return adapter.delete(location_data_type, str(dataset_id), user.username)
+    return await async_adapter.delete(location_data_type, str(dataset_id), user.username)
 
 @app.get("/{location_data_type}/{dataset_id}/secrets")
 @secrets_required
@@ -353,7 +568,7 @@ async def list_dataset_secrets(location_data_type: LocationDataType,
                                   user: User = Depends(my_user)):
     """list the secrets of a specific dataset"""
     log.debug("Authenticed User: '%s' listed the secrets of /%s/%s", user.username, location_data_type.value, dataset_id)
-    return adapter.list_secrets(location_data_type, dataset_id, user)
+    return await async_adapter.list_secrets(location_data_type, dataset_id, user)
 
 @app.get("/{location_data_type}/{dataset_id}/secrets/{key}")
 @secrets_required
@@ -363,7 +578,7 @@ async def get_dataset_secret(location_data_type: LocationDataType,
                                   user: User = Depends(my_user)):
     """get the secret of a specific dataset"""
     log.debug("Authenticed User: '%s' listed the secret %s of /%s/%s", user.username, key, location_data_type.value, dataset_id)
-    return adapter.get_secret(location_data_type, dataset_id, key, user)
+    return await async_adapter.get_secret(location_data_type, dataset_id, key, user)
 
 # differs from .../secrets by also returning the values in a dict
 @app.get("/{location_data_type}/{dataset_id}/secrets_values")
@@ -371,7 +586,7 @@ async def get_dataset_secret(location_data_type: LocationDataType,
 async def list_dataset_secrets(location_data_type: LocationDataType, dataset_id: UUID4, user: User = Depends(my_user)):
     """list the secrets and valuesof a specific dataset"""
     log.debug("Authenticed User: '%s' listed the secrets (key and value) of /%s/%s", user.username, location_data_type.value, dataset_id)
-    return adapter.get_secret_values(location_data_type, dataset_id, user)
+    return await async_adapter.get_secret_values(location_data_type, dataset_id, user)
 
 
 @app.post("/{location_data_type}/{dataset_id}/secrets")
@@ -382,7 +597,7 @@ async def add_update_dataset_secret(location_data_type: LocationDataType,
                                   user: User = Depends(my_user)):
     """add or update a secrets to a specific dataset"""
     log.debug("Authenticed User: '%s' added or updated the secret %s of /%s/%s", user.username, secret.key, location_data_type.value, dataset_id)
-    return adapter.add_update_secret(location_data_type, dataset_id, secret.key, secret.secret, user)
+    return await async_adapter.add_update_secret(location_data_type, dataset_id, secret.key, secret.secret, user)
 
 
 @app.delete("/{location_data_type}/{dataset_id}/secrets/{key}")
@@ -393,7 +608,7 @@ async def get_dataset_secrets(location_data_type: LocationDataType,
                                   user: User = Depends(my_user)):
     """delete a secret from a specific dataset"""
     log.debug("Authenticed User: '%s' deleted the secret %s from /%s/%s", user.username, key, location_data_type.value, dataset_id)
-    return adapter.delete_secret(location_data_type, dataset_id, key, user)
+    return await async_adapter.delete_secret(location_data_type, dataset_id, key, user)
 
 @app.exception_handler(FileNotFoundError)
 async def not_found_handler(request: Request, ex: FileNotFoundError):
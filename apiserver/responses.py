@@ -0,0 +1,58 @@
+import json
+import logging
+from typing import Any
+
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import Response
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# paths of responses that are never compressed by the middleware
+UNCOMPRESSED_PATHS = ("/_events", "/_snapshot")
+# the ids in the listings hardly compress, higher levels cost several times the cpu for a few percent
+DEFAULT_COMPRESSLEVEL: int = 1
+
+log = logging.getLogger(__name__)
+
+if orjson is None:  # pragma: no cover
+    log.warning("orjson is not installed, large responses are encoded with the json module.")
+
+
+def dump_json(content: Any) -> bytes:
+    """ encode trusted content (lists, tuples, dicts and strings) without any validation"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """
+    json response that is encoded directly, with orjson if it is installed. Routes return it
+    for large results that are already valid, which skips the validation of the response_model
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dump_json(content)
+
+
+class CompressionMiddleware:
+    """
+    gzip compression of responses of at least `minimum_size` bytes for clients that accept it;
+    event streams are passed through, as the compressor would hold back the events, and
+    snapshots, which are compressed already
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1000, compresslevel: int = DEFAULT_COMPRESSLEVEL):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=compresslevel)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and not scope["path"].endswith(UNCOMPRESSED_PATHS):
+            await self.gzip(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
@@ -0,0 +1,102 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .LocationStorage import (AbstractLocationDataStorageAdapter, BatchOperation, LocationData,
+                              LocationDataType, QueryFilters, QueryPage)
+from .Snapshot import Snapshot
+
+DEFAULT_WORKERS: int = 8
+DEFAULT_CHUNK_SIZE: int = 500
+
+log = logging.getLogger(__name__)
+
+
+class AsyncStorageAdapter:
+    """ Awaitable interface to a storage adapter
+
+    All calls are run on a bounded thread pool, so file access, json parsing and
+    long searches do not block the event loop. At most `max_workers` storage calls
+    run at the same time, further calls wait for a free thread.
+    """
+
+    def __init__(self, adapter: AbstractLocationDataStorageAdapter, max_workers: int = DEFAULT_WORKERS):
+        log.info("Initializing AsyncStorageAdapter with %d threads.", max_workers)
+        self.adapter = adapter
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="storage")
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """ run any blocking function on the storage thread pool and return its result"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    async def get_list(self, n_type: LocationDataType) -> List:
+        return await self.run(self.adapter.get_list, n_type)
+
+    async def query(self, n_type: LocationDataType, filters: Optional[QueryFilters] = None,
+                    sort: bool = True, page: Optional[QueryPage] = None) -> List[Tuple[str, str]]:
+        return await self.run(self.adapter.query, n_type, filters, sort=sort, page=page)
+
+    async def begin_snapshot(self, since: Optional[int] = None) -> Snapshot:
+        return await self.run(self.adapter.begin_snapshot, since)
+
+    async def get_key_counts(self, n_type: LocationDataType) -> Dict[str, int]:
+        return await self.run(self.adapter.get_key_counts, n_type)
+
+    async def get_facets(self, n_type: LocationDataType, keys: List[str],
+                         filters: Optional[QueryFilters] = None) -> Dict[str, Dict[str, int]]:
+        return await self.run(self.adapter.get_facets, n_type, keys, filters)
+
+    async def count(self, n_type: LocationDataType, filters: Optional[QueryFilters] = None) -> int:
+        return await self.run(self.adapter.count, n_type, filters)
+
+    async def get_version(self, n_type: LocationDataType, oid: str):
+        return await self.run(self.adapter.get_version, n_type, oid)
+
+    async def get_generation(self, n_type: LocationDataType):
+        return await self.run(self.adapter.get_generation, n_type)
+
+    async def add_new(self, n_type: LocationDataType, data: LocationData, user_name: str):
+        return await self.run(self.adapter.add_new, n_type, data, user_name)
+
+    async def apply_batch(self, n_type: LocationDataType, operations: List[BatchOperation], usr: str):
+        return await self.run(self.adapter.apply_batch, n_type, operations, usr)
+
+    async def get_details(self, n_type: LocationDataType, oid: str):
+        return await self.run(self.adapter.get_details, n_type, oid)
+
+    async def get_many(self, n_type: LocationDataType, oids: List[str]) -> Dict[str, LocationData]:
+        return await self.run(self.adapter.get_many, n_type, oids)
+
+    async def update_details(self, n_type: LocationDataType, oid: str, data: LocationData, usr: str):
+        return await self.run(self.adapter.update_details, n_type, oid, data, usr)
+
+    async def delete(self, n_type: LocationDataType, oid: str, usr: str):
+        return await self.run(self.adapter.delete, n_type, oid, usr)
+
+    async def delete_many(self, n_type: LocationDataType, oids: List[str], usr: str) -> List[str]:
+        return await self.run(self.adapter.delete_many, n_type, oids, usr)
+
+    async def import_objects(self, n_type: LocationDataType,
+                             objects: Iterable[Tuple[str, LocationData, List[str], Dict[str, str]]]) -> int:
+        return await self.run(self.adapter.import_objects, n_type, objects)
+
+    async def list_secrets(self, n_type: LocationDataType, oid: str, usr: str):
+        return await self.run(self.adapter.list_secrets, n_type, oid, usr)
+
+    async def get_secret_values(self, n_type: LocationDataType, oid: str, usr: str):
+        return await self.run(self.adapter.get_secret_values, n_type, oid, usr)
+
+    async def add_update_secret(self, n_type: LocationDataType, oid: str, key: str, value: str, usr: str):
+        return await self.run(self.adapter.add_update_secret, n_type, oid, key, value, usr)
+
+    async def get_secret(self, n_type: LocationDataType, oid: str, key: str, usr: str):
+        return await self.run(self.adapter.get_secret, n_type, oid, key, usr)
+
+    async def delete_secret(self, n_type: LocationDataType, oid: str, key: str, usr: str):
+        return await self.run(self.adapter.delete_secret, n_type, oid, key, usr)
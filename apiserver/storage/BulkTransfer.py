@@ -0,0 +1,273 @@
+import itertools
+import json
+import logging
+import zlib
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi.exceptions import HTTPException
+from pydantic import ValidationError
+
+from .AsyncStorageAdapter import DEFAULT_CHUNK_SIZE, AsyncStorageAdapter
+from .LocationStorage import (BatchAction, BatchOperation, ImportLineError, ImportResult, LocationData,
+                              LocationDataType)
+from .Snapshot import SNAPSHOT_FORMAT_VERSION, RestoreResult, Snapshot, SnapshotHeader, SnapshotRecord
+
+MAX_LINE_LENGTH: int = 1024 * 1024
+# further errors of an import are only counted
+MAX_IMPORT_ERRORS: int = 100
+# snapshots are written once and kept, so they are compressed better than responses
+SNAPSHOT_COMPRESSLEVEL: int = 6
+# a gzip body is inflated in pieces of at most this size
+INFLATE_CHUNK_SIZE: int = 64 * 1024
+
+log = logging.getLogger(__name__)
+
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_length: int = MAX_LINE_LENGTH) -> AsyncIterator[Optional[bytes]]:
+    """ split a stream of bytes into lines, yields None instead of lines longer than max_length"""
+    buffer = b''
+    skipping = False
+    async for chunk in chunks:
+        lines = (buffer + chunk).split(b'\n')
+        buffer = lines.pop()
+        for line in lines:
+            yield None if skipping or len(line) > max_length else line
+            skipping = False
+        if len(buffer) > max_length:
+            # the rest of the line is dropped as it arrives
+            buffer = b''
+            skipping = True
+    if skipping or buffer:
+        yield None if skipping or len(buffer) > max_length else buffer
+
+
+async def iter_gunzip(chunks: AsyncIterator[bytes], chunk_size: int = INFLATE_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """
+    decompress a gzip stream as it arrives, in pieces of at most chunk_size bytes. A damaged
+    stream ends where it becomes unreadable, the reader has to notice the missing rest
+    """
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    try:
+        async for chunk in chunks:
+            data = decompressor.decompress(chunk, chunk_size)
+            while data or decompressor.unconsumed_tail:
+                if data:
+                    yield data
+                data = decompressor.decompress(decompressor.unconsumed_tail, chunk_size)
+            if decompressor.eof:
+                return
+        data = decompressor.flush()
+        if data:
+            yield data
+    except zlib.error as ex:
+        log.warning("Stopped reading a damaged gzip stream: %s", ex)
+
+
+def describe(ex: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in ex.errors())
+
+
+async def import_lines(storage: AsyncStorageAdapter, n_type: LocationDataType, lines: AsyncIterator[Optional[bytes]],
+                       usr: str, upsert: bool = False, chunk_size: int = DEFAULT_CHUNK_SIZE) -> ImportResult:
+    """
+    create an object for every line (a json LocationData, see `iter_lines`), or with upsert update the
+    object with the same name if there is one. The lines are written in batches of chunk_size while
+    they are read, a failed batch fails all of its lines; invalid lines are skipped and reported
+    """
+    result = ImportResult()
+    names = {name: oid for name, oid in await storage.get_list(n_type)} if upsert else {}
+    operations: List[BatchOperation] = []
+    numbers: List[int] = []
+    pending = set()
+
+    def fail(number: int, error: str):
+        result.failed += 1
+        if len(result.errors) < MAX_IMPORT_ERRORS:
+            result.errors.append(ImportLineError(line=number, error=error))
+
+    async def flush():
+        try:
+            results = await storage.apply_batch(n_type, operations, usr)
+        except (HTTPException, FileNotFoundError) as ex:
+            for number in numbers:
+                fail(number, f"Batch failed: {getattr(ex, 'detail', ex)}")
+        else:
+            for op, (oid, data) in zip(operations, results):
+                if op.action == BatchAction.CREATE:
+                    result.created += 1
+                    if upsert:
+                        names[data.name] = oid
+                else:
+                    result.updated += 1
+        operations.clear()
+        numbers.clear()
+        pending.clear()
+
+    number = 0
+    async for line in lines:
+        number += 1
+        if line is None:
+            fail(number, f"Line is longer than {MAX_LINE_LENGTH} bytes")
+            continue
+        if not line.strip():
+            continue
+        try:
+            data = LocationData.parse_raw(line)
+        except ValidationError as ex:
+            fail(number, describe(ex))
+            continue
+        if upsert and data.name in pending:
+            # the same object can only be changed once per batch
+            await flush()
+        oid = names.get(data.name)
+        if oid is None:
+            operations.append(BatchOperation(action=BatchAction.CREATE, data=data))
+        else:
+            operations.append(BatchOperation(action=BatchAction.UPDATE, oid=oid, data=data))
+        numbers.append(number)
+        pending.add(data.name)
+        if len(operations) >= chunk_size:
+            await flush()
+    if operations:
+        await flush()
+    log.debug("Imported %d new and %d updated objects of type %s, %d lines failed.",
+              result.created, result.updated, n_type.value, result.failed)
+    return result
+
+
+async def iter_export(storage: AsyncStorageAdapter, n_type: LocationDataType,
+                      chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[str]:
+    """
+    yield all objects of the given type as json lines with their oid, sorted by name and id. The
+    objects are listed, loaded and encoded on the thread pool in chunks, so at most one chunk is
+    held at a time; objects deleted meanwhile are skipped
+    """
+    after = None
+
+    def encode() -> Tuple[str, bool]:
+        nonlocal after
+        entries = storage.adapter.list_sorted(n_type, after, chunk_size)
+        found = storage.adapter.get_many(n_type, [oid for _, oid in entries])
+        lines = [json.dumps({'oid': oid, **found[oid].dict()}) + "\n" for _, oid in entries if oid in found]
+        if len(entries) < chunk_size:
+            return "".join(lines), True
+        after = entries[-1]
+        return "".join(lines), False
+
+    while True:
+        data, done = await storage.run(encode)
+        if data:
+            yield data
+        if done:
+            return
+
+
+async def iter_snapshot(storage: AsyncStorageAdapter, snapshot: Snapshot,
+                        chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """
+    yield the records of the snapshot as gzip compressed json lines. The records are read,
+    encoded and compressed on the thread pool in chunks; the snapshot is closed at the end
+    """
+    records = snapshot.records()
+    compressor = zlib.compressobj(SNAPSHOT_COMPRESSLEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def encode() -> Tuple[bytes, bool]:
+        lines = [json.dumps(record) + "\n" for record in itertools.islice(records, chunk_size)]
+        if not lines:
+            return compressor.flush(), True
+        return compressor.compress("".join(lines).encode()), False
+
+    try:
+        while True:
+            data, done = await storage.run(encode)
+            if data:
+                yield data
+            if done:
+                return
+    finally:
+        snapshot.close()
+
+async def restore_lines(storage: AsyncStorageAdapter, lines: AsyncIterator[Optional[bytes]], usr: str,
+                        chunk_size: int = DEFAULT_CHUNK_SIZE) -> RestoreResult:
+    """
+    restore the objects of a snapshot (its lines, see `iter_lines`) with their ids, users and secrets as they
+    were stored, replacing existing objects, and delete the objects recorded as deleted. The records are
+    written in batches of chunk_size while they are read, a failed batch fails all of its lines
+    """
+    result = RestoreResult()
+    objects: List[Tuple[int, Tuple[str, LocationData, List[str], Dict[str, str]]]] = []
+    deletions: List[Tuple[int, str]] = []
+    current = None
+    read_objects = 0
+    read_deletions = 0
+    trailer = None
+
+    def fail(number: int, error: str):
+        result.failed += 1
+        if len(result.errors) < MAX_IMPORT_ERRORS:
+            result.errors.append(ImportLineError(line=number, error=error))
+
+    async def flush():
+        if objects:
+            try:
+                result.restored += await storage.import_objects(current, [obj for _, obj in objects])
+            except (HTTPException, FileNotFoundError, ValueError) as ex:
+                for number, _ in objects:
+                    fail(number, f"Batch failed: {getattr(ex, 'detail', ex)}")
+        if deletions:
+            try:
+                result.deleted += len(await storage.delete_many(current, [oid for _, oid in deletions], usr))
+            except (HTTPException, FileNotFoundError, ValueError) as ex:
+                for number, _ in deletions:
+                    fail(number, f"Batch failed: {getattr(ex, 'detail', ex)}")
+        objects.clear()
+        deletions.clear()
+
+    number = 0
+    async for line in lines:
+        number += 1
+        if line is not None and not line.strip():
+            continue
+        if result.seq is None:
+            try:
+                header = SnapshotHeader.parse_raw(line) if line is not None else None
+            except ValidationError:
+                header = None
+            if header is None or header.format != SNAPSHOT_FORMAT_VERSION:
+                raise HTTPException(400, f"The body is not a snapshot of format {SNAPSHOT_FORMAT_VERSION}")
+            result.seq = header.seq
+            continue
+        if line is None:
+            fail(number, f"Line is longer than {MAX_LINE_LENGTH} bytes")
+            continue
+        if trailer is not None:
+            fail(number, "Line after the end of the snapshot")
+            continue
+        try:
+            raw = json.loads(line)
+            if isinstance(raw, dict) and raw.get('end') is True:
+                trailer = raw
+                continue
+            record = SnapshotRecord.parse_obj(raw)
+        except ValueError as ex:
+            fail(number, describe(ex) if isinstance(ex, ValidationError) else f"Invalid json: {ex}")
+            continue
+        if record.deleted:
+            read_deletions += 1
+        else:
+            read_objects += 1
+        if record.type != current or len(objects) + len(deletions) >= chunk_size:
+            await flush()
+            current = record.type
+        if record.deleted:
+            deletions.append((number, str(record.oid)))
+        else:
+            objects.append((number, (str(record.oid), record.data, record.users, record.secrets)))
+    if result.seq is None:
+        raise HTTPException(400, f"The body is not a snapshot of format {SNAPSHOT_FORMAT_VERSION}")
+    await flush()
+    result.complete = (trailer is not None and trailer.get('objects') == read_objects
+                       and trailer.get('deleted') == read_deletions)
+    log.debug("Restored %d objects and deleted %d of snapshot %d, %d lines failed.",
+              result.restored, result.deleted, result.seq, result.failed)
+    return result
@@ -0,0 +1,220 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .LocationStorage import (AbstractLocationDataStorageAdapter, BatchOperation,
+                              LocationData, LocationDataType, QueryFilters, SearchField)
+
+DEFAULT_CACHE_SIZE: int = 10000
+
+log = logging.getLogger(__name__)
+
+
+class CachedStorageAdapter(AbstractLocationDataStorageAdapter):
+    """ Write-through in-memory cache in front of any other storage adapter
+
+    Parsed objects are kept per (type, oid) in a bounded LRU. Writes are passed
+    to the wrapped adapter first and only then applied to the cache, so the
+    wrapped adapter always holds the authoritative state. Every cache hit is
+    checked against the version reported by the wrapped adapter (e.g. a write
+    counter for json files), so objects that were modified without going through
+    this adapter are reloaded. If the wrapped adapter does not report versions,
+    cached objects stay valid until they are written through this adapter or evicted.
+
+    Secrets are never cached, the calls are passed through unchanged.
+    """
+
+    def __init__(self, adapter: AbstractLocationDataStorageAdapter, max_entries: int = DEFAULT_CACHE_SIZE):
+        AbstractLocationDataStorageAdapter.__init__(self)
+        if max_entries < 1:
+            raise ValueError(f"Cache size has to be positive, got {max_entries}.")
+        self.adapter = adapter
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.RLock()
+        log.info("Initializing CachedStorageAdapter with up to %d entries.", max_entries)
+
+    def __put(self, n_type: LocationDataType, oid: str, version, data: LocationData):
+        with self.__lock:
+            self.__entries[(n_type, oid)] = (version, data)
+            self.__entries.move_to_end((n_type, oid))
+            while len(self.__entries) > self.max_entries:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+    def __drop(self, n_type: LocationDataType, oid: str):
+        with self.__lock:
+            self.__entries.pop((n_type, oid), None)
+
+    def __load(self, n_type: LocationDataType, oid: str) -> LocationData:
+        version = self.adapter.get_version(n_type, oid)
+        with self.__lock:
+            entry = self.__entries.get((n_type, oid))
+            if entry is not None and entry[0] == version:
+                self.__entries.move_to_end((n_type, oid))
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        data = self.adapter.get_details(n_type, oid)
+        self.__put(n_type, oid, version, data)
+        return data
+
+    def stats(self) -> Dict[str, int]:
+        """ return the current size and the hit/ miss counters of the cache"""
+        with self.__lock:
+            return {
+                'entries': len(self.__entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+    def clear(self):
+        """ drop all cached objects, the counters are kept"""
+        with self.__lock:
+            self.__entries.clear()
+
+    def get_list(self, n_type: LocationDataType) -> List:
+        # the names are taken from the wrapped adapter, which keeps them indexed
+        return self.adapter.get_list(n_type)
+
+    def list_ids(self, n_type: LocationDataType) -> List[str]:
+        return self.adapter.list_ids(n_type)
+
+    def list_sorted(self, n_type: LocationDataType, after: Optional[Tuple[str, str]] = None,
+                    limit: Optional[int] = None) -> List[Tuple[str, str]]:
+        return self.adapter.list_sorted(n_type, after, limit)
+
+    def filter_natively(self, n_type: LocationDataType,
+                        filters: QueryFilters) -> Tuple[Optional[Set[str]], QueryFilters]:
+        # the remaining filters are then checked by `query` against the cached objects
+        return self.adapter.filter_natively(n_type, filters)
+
+    def match_substring(self, n_type: LocationDataType, term: str, field: SearchField) -> Set[str]:
+        return self.adapter.match_substring(n_type, term, field)
+
+    def match_keys(self, n_type: LocationDataType, keys: List[str]) -> Set[str]:
+        return self.adapter.match_keys(n_type, keys)
+
+    def get_key_counts(self, n_type: LocationDataType) -> Dict[str, int]:
+        return self.adapter.get_key_counts(n_type)
+
+    def get_facets(self, n_type: LocationDataType, keys: List[str],
+                   filters: QueryFilters = None) -> Dict[str, Dict[str, int]]:
+        return self.adapter.get_facets(n_type, keys, filters)
+
+    def count(self, n_type: LocationDataType, filters: QueryFilters = None) -> int:
+        if filters is None or not (filters.name or filters.url or filters.has_key or filters.search):
+            return self.adapter.count(n_type)
+        # like `query`, the filters the storage can not answer are checked against the cached objects
+        return super().count(n_type, filters)
+
+    def get_version(self, n_type: LocationDataType, oid: str):
+        return self.adapter.get_version(n_type, oid)
+
+    def get_generation(self, n_type: LocationDataType):
+        return self.adapter.get_generation(n_type)
+
+    def add_new(self, n_type: LocationDataType, data: LocationData, user_name: str):
+        (oid, data) = self.adapter.add_new(n_type, data, user_name)
+        self.__put(n_type, oid, self.adapter.get_version(n_type, oid), data)
+        return (oid, data)
+
+    def apply_batch(self, n_type: LocationDataType, operations: List[BatchOperation],
+                    usr: str) -> List[Tuple[str, Optional[LocationData]]]:
+        for op in operations:
+            if op.oid is not None:
+                self.__drop(n_type, op.oid)
+        # new and changed objects are cached on their next read
+        return self.adapter.apply_batch(n_type, operations, usr)
+
+    def get_details(self, n_type: LocationDataType, oid: str):
+        try:
+            return self.__load(n_type, oid)
+        except FileNotFoundError:
+            self.__drop(n_type, oid)
+            raise
+
+    def get_many(self, n_type: LocationDataType, oids: List[str]) -> Dict[str, LocationData]:
+        found = {}
+        misses = []
+        for oid in oids:
+            try:
+                version = self.adapter.get_version(n_type, oid)
+            except FileNotFoundError:
+                self.__drop(n_type, oid)
+                continue
+            with self.__lock:
+                entry = self.__entries.get((n_type, oid))
+                if entry is not None and entry[0] == version:
+                    self.__entries.move_to_end((n_type, oid))
+                    self.hits += 1
+                    found[oid] = entry[1]
+                    continue
+                self.misses += 1
+            misses.append((oid, version))
+        # everything that is not cached is loaded from the wrapped adapter in one call
+        loaded = self.adapter.get_many(n_type, [oid for oid, _ in misses]) if misses else {}
+        for oid, version in misses:
+            if oid in loaded:
+                self.__put(n_type, oid, version, loaded[oid])
+                found[oid] = loaded[oid]
+        return found
+
+    def update_details(self, n_type: LocationDataType, oid: str, data: LocationData, usr: str):
+        self.__drop(n_type, oid)
+        (oid, data) = self.adapter.update_details(n_type, oid, data, usr)
+        self.__put(n_type, oid, self.adapter.get_version(n_type, oid), data)
+        return (oid, data)
+
+    def delete(self, n_type: LocationDataType, oid: str, usr: str):
+        self.__drop(n_type, oid)
+        return self.adapter.delete(n_type, oid, usr)
+
+    def delete_many(self, n_type: LocationDataType, oids: List[str], usr: str) -> List[str]:
+        with self.__lock:
+            for oid in oids:
+                self.__entries.pop((n_type, oid), None)
+        return self.adapter.delete_many(n_type, oids, usr)
+
+    def export_object(self, n_type: LocationDataType, oid: str) -> Tuple[LocationData, List[str], Dict[str, str]]:
+        return self.adapter.export_object(n_type, oid)
+
+    def import_objects(self, n_type: LocationDataType, objects: Iterable[Tuple[str, LocationData, List[str], Dict[str, str]]]) -> int:
+        objects = list(objects)
+        with self.__lock:
+            for oid, _, _, _ in objects:
+                self.__entries.pop((n_type, oid), None)
+        return self.adapter.import_objects(n_type, objects)
+
+    def list_secrets(self, n_type: LocationDataType, oid: str, usr: str):
+        return self.adapter.list_secrets(n_type, oid, usr)
+
+    def get_secret_values(self, n_type: LocationDataType, oid: str, usr: str):
+        return self.adapter.get_secret_values(n_type, oid, usr)
+
+    def add_update_secret(self, n_type: LocationDataType, oid: str, key: str, value: str, usr: str):
+        return self.adapter.add_update_secret(n_type, oid, key, value, usr)
+
+    def get_secret(self, n_type: LocationDataType, oid: str, key: str, usr: str):
+        return self.adapter.get_secret(n_type, oid, key, usr)
+
+    def delete_secret(self, n_type: LocationDataType, oid: str, key: str, usr: str):
+        return self.adapter.delete_secret(n_type, oid, key, usr)
+
+    def get_owner(self, n_type: LocationDataType, oid: str):
+        return self.adapter.get_owner(n_type, oid)
+
+    def check_perm(self, n_type: LocationDataType, oid: str, usr: str):
+        return self.adapter.check_perm(n_type, oid, usr)
+
+    def add_perm(self, n_type: LocationDataType, oid: str, usr: str):
+        return self.adapter.add_perm(n_type, oid, usr)
+
+    def rm_perm(self, n_type: LocationDataType, oid: str, usr: str):
+        return self.adapter.rm_perm(n_type, oid, usr)
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import threading
+from typing import AsyncIterator, List, Optional, Set
+
+from .ChangeLog import Change, ChangeLog
+from .LocationStorage import LocationDataType
+
+DEFAULT_QUEUE_SIZE: int = 1000
+DEFAULT_HEARTBEAT: float = 15.0
+
+log = logging.getLogger(__name__)
+
+
+class Subscription:
+    """ the bounded queue of changes of one type for one client, bound to the event loop of that client"""
+
+    def __init__(self, n_type: LocationDataType, queue_size: int):
+        self.n_type = n_type
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.dropped = False
+
+    def push(self, changes: List[Change]):
+        # runs on the event loop of the subscription
+        if self.dropped:
+            return
+        for change in changes:
+            if self.queue.full():
+                # the client does not keep up; drop it instead of buffering without limit
+                log.warning("Dropping subscriber to %s changes, %d changes are pending.", self.n_type.value, self.queue.qsize())
+                self.dropped = True
+                while not self.queue.empty():
+                    self.queue.get_nowait()
+                self.queue.put_nowait(None)
+                return
+            self.queue.put_nowait(change)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Change]:
+        """ wait for the next change; None once the subscription was dropped. Raises asyncio.TimeoutError"""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class ChangeBroadcaster:
+    """ Fans the changes recorded in a `ChangeLog` out to any number of subscribers
+
+    Every subscriber gets its own queue of at most `queue_size` changes. The changes
+    are handed to the event loop of each subscriber, a subscriber whose queue is full
+    is dropped and receives None, so one slow client neither blocks the writers nor
+    makes the server buffer without limit. A dropped client can reconnect and pull
+    what it missed from the change log.
+    """
+
+    def __init__(self, changelog: ChangeLog, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.changelog = changelog
+        self.queue_size = queue_size
+        self.__subscriptions: Set[Subscription] = set()
+        self.__lock = threading.Lock()
+        changelog.add_listener(self.__publish)
+
+    def __len__(self):
+        return len(self.__subscriptions)
+
+    def __publish(self, n_type: LocationDataType, changes: List[Change]):
+        # called by the change log on a storage thread
+        with self.__lock:
+            subscriptions = [s for s in self.__subscriptions if s.n_type == n_type]
+        for subscription in subscriptions:
+            if subscription.dropped:
+                # e.g. the client disconnected before its stream was started
+                self.unsubscribe(subscription)
+                continue
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.push, changes)
+            except RuntimeError:
+                # the event loop of the subscriber is already closed
+                self.unsubscribe(subscription)
+
+    def subscribe(self, n_type: LocationDataType) -> Subscription:
+        """ start receiving the changes of the given type, has to be called on the event loop of the subscriber"""
+        subscription = Subscription(n_type, self.queue_size)
+        with self.__lock:
+            self.__subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.__lock:
+            self.__subscriptions.discard(subscription)
+
+    def close(self):
+        self.changelog.remove_listener(self.__publish)
+
+
+def format_event(change: Change) -> str:
+    return f"id: {change.seq}\nevent: {change.action.value}\ndata: {change.json()}\n\n"
+
+
+async def event_stream(broadcaster: ChangeBroadcaster, subscription: Subscription, replay: List[Change],
+                       heartbeat: float = DEFAULT_HEARTBEAT) -> AsyncIterator[str]:
+    """
+    yield the replayed changes, then the live changes of the subscription as server-sent events,
+    with a comment every `heartbeat` seconds of silence. The subscription has to be taken before
+    the replay was read, live changes that were already replayed are skipped. Ends with an
+    `overflow` event if the subscriber was dropped
+    """
+    try:
+        last_seq = 0
+        for change in replay:
+            last_seq = change.seq
+            yield format_event(change)
+        while True:
+            try:
+                change = await subscription.get(heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if change is None:
+                yield "event: overflow\ndata: {}\n\n"
+                return
+            if change.seq <= last_seq:
+                continue
+            yield format_event(change)
+    finally:
+        broadcaster.unsubscribe(subscription)
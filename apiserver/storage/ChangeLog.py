@@ -0,0 +1,180 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from enum import Enum
+from typing import Callable, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from .LocationStorage import LocationDataType
+
+DEFAULT_CHANGELOG_FILENAME: str = "_changes.log"
+DEFAULT_RETENTION: float = 7 * 24 * 60 * 60
+# the file is rewritten once it holds this many lines more than are retained
+COMPACT_SLACK: int = 1000
+
+log = logging.getLogger(__name__)
+
+
+class ChangeAction(str, Enum):
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    SECRETS = 'secrets'
+
+
+class Change(BaseModel):
+    """ one recorded change; the object itself is not part of the change and has to be fetched"""
+    seq: int
+    action: ChangeAction
+    oid: str
+    time: float
+
+
+class ChangeFeed(BaseModel):
+    """ changes of one type in order, last_seq is the `since` for the next request"""
+    changes: List[Change]
+    last_seq: int
+
+
+class ChangesExpired(Exception):
+    """ the requested changes are no longer (or not yet) known, the client has to list everything again"""
+
+
+class ChangeLog:
+    """ Sequence numbered log of all changes, persisted as json lines
+
+    Every change gets the next sequence number, shared by all types. Changes older
+    than `retention` seconds are dropped; the sequence number up to which changes
+    have been dropped is kept as the horizon, requests for changes before it fail
+    with `ChangesExpired`. The retained changes are kept in memory, the file is only
+    appended to, and rewritten once it holds `COMPACT_SLACK` more lines than are
+    retained. The first line of the file holds the horizon and the last sequence number.
+
+    Listeners are called with the type and the new changes after every record, in
+    order and with the lock held, so they must not block.
+    """
+
+    def __init__(self, path: str, retention: float = DEFAULT_RETENTION):
+        self.path = path
+        self.retention = retention
+        self.seq = 0
+        self.horizon = 0
+        self.__entries: List[Tuple[int, str, ChangeAction, str, float]] = []
+        self.__lines = 0
+        self.__listeners: List[Callable[[LocationDataType, List[Change]], None]] = []
+        self.__lock = threading.Lock()
+        self.__load()
+        self.__file = open(self.path, 'a')
+
+    def __load(self):
+        if not os.path.isfile(self.path):
+            self.__rewrite()
+            return
+        damaged = False
+        with open(self.path, 'r') as f:
+            for line in f:
+                self.__lines += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # torn write of the last line after a crash
+                    log.warning("Skipping damaged entry in change log %s.", self.path)
+                    damaged = True
+                    continue
+                if 'horizon' in record:
+                    self.horizon = record['horizon']
+                    self.seq = max(self.seq, record['seq'])
+                    continue
+                self.__entries.append((record['seq'], record['type'], ChangeAction(record['action']),
+                                       record['oid'], record['time']))
+                self.seq = max(self.seq, record['seq'])
+        self.__entries.sort()
+        if damaged:
+            # new entries must not be appended to a torn line
+            self.__rewrite()
+        log.info("Loaded change log %s up to sequence number %d.", self.path, self.seq)
+
+    def __rewrite(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(json.dumps({'horizon': self.horizon, 'seq': self.seq}) + "\n")
+            for entry in self.__entries:
+                f.write(self.__format(entry))
+        os.replace(tmp_path, self.path)
+        self.__lines = len(self.__entries) + 1
+
+    @staticmethod
+    def __format(entry: Tuple[int, str, ChangeAction, str, float]) -> str:
+        seq, n_type, action, oid, timestamp = entry
+        return json.dumps({'seq': seq, 'type': n_type, 'action': action.value, 'oid': oid, 'time': timestamp}) + "\n"
+
+    def __expire(self, now: float):
+        # has to be called with the lock held
+        cutoff = 0
+        while cutoff < len(self.__entries) and self.__entries[cutoff][4] < now - self.retention:
+            cutoff += 1
+        if cutoff:
+            self.horizon = self.__entries[cutoff - 1][0]
+            del self.__entries[:cutoff]
+        if self.__lines > len(self.__entries) + COMPACT_SLACK:
+            self.__file.close()
+            self.__rewrite()
+            self.__file = open(self.path, 'a')
+
+    def record(self, n_type: LocationDataType, changes: List[Tuple[ChangeAction, str]]):
+        """ append the (action, oid) pairs of one type, each with its own sequence number"""
+        if not changes:
+            return
+        with self.__lock:
+            now = time.time()
+            entries = []
+            for action, oid in changes:
+                self.seq += 1
+                entries.append((self.seq, n_type.value, action, oid, now))
+            self.__entries.extend(entries)
+            self.__file.write("".join(self.__format(entry) for entry in entries))
+            self.__file.flush()
+            self.__lines += len(entries)
+            self.__expire(now)
+            if self.__listeners:
+                recorded = [Change(seq=seq, action=action, oid=oid, time=timestamp)
+                            for seq, _, action, oid, timestamp in entries]
+                for listener in self.__listeners:
+                    listener(n_type, recorded)
+
+    def add_listener(self, listener: Callable[[LocationDataType, List[Change]], None]):
+        with self.__lock:
+            self.__listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[LocationDataType, List[Change]], None]):
+        with self.__lock:
+            self.__listeners.remove(listener)
+
+    def changes(self, n_type: LocationDataType, since: Optional[int] = None, limit: Optional[int] = None) -> ChangeFeed:
+        """
+        return the changes of the given type after the sequence number `since`, at most `limit`.
+        Without `since`, no changes but the current sequence number are returned
+        """
+        with self.__lock:
+            self.__expire(time.time())
+            if since is None:
+                return ChangeFeed(changes=[], last_seq=self.seq)
+            if since < self.horizon or since > self.seq:
+                raise ChangesExpired(f"Changes since {since} are not available, the log covers {self.horizon} to {self.seq}.")
+            changes = []
+            start = bisect.bisect_left(self.__entries, (since + 1,))
+            for seq, entry_type, action, oid, timestamp in self.__entries[start:]:
+                if entry_type != n_type.value:
+                    continue
+                changes.append(Change(seq=seq, action=action, oid=oid, time=timestamp))
+                if limit is not None and len(changes) >= limit:
+                    return ChangeFeed(changes=changes, last_seq=seq)
+            return ChangeFeed(changes=changes, last_seq=self.seq)
+
+    def close(self):
+        with self.__lock:
+            self.__file.close()
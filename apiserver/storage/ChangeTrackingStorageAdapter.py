@@ -0,0 +1,136 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .ChangeLog import ChangeAction, ChangeLog
+from .LocationStorage import (AbstractLocationDataStorageAdapter, BatchOperation, LocationData,
+                              LocationDataType, QueryFilters, QueryPage, SearchField)
+
+log = logging.getLogger(__name__)
+
+
+class ChangeTrackingStorageAdapter(AbstractLocationDataStorageAdapter):
+    """ Records every change made through it in a `ChangeLog`, in front of any other storage adapter
+
+    Changes are recorded after the wrapped adapter has applied them, so a client that
+    reads a change and then loads the object always sees this or a newer state.
+    Reads are passed through unchanged.
+    """
+
+    def __init__(self, adapter: AbstractLocationDataStorageAdapter, changelog: ChangeLog):
+        AbstractLocationDataStorageAdapter.__init__(self)
+        log.info("Initializing ChangeTrackingStorageAdapter with change log %s.", changelog.path)
+        self.adapter = adapter
+        self.changelog = changelog
+
+    def get_list(self, n_type: LocationDataType) -> List:
+        return self.adapter.get_list(n_type)
+
+    def list_ids(self, n_type: LocationDataType) -> List[str]:
+        return self.adapter.list_ids(n_type)
+
+    def query(self, n_type: LocationDataType, filters: QueryFilters = None, sort: bool = True,
+              page: QueryPage = None) -> List[Tuple[str, str]]:
+        return self.adapter.query(n_type, filters, sort=sort, page=page)
+
+    def list_sorted(self, n_type: LocationDataType, after: Optional[Tuple[str, str]] = None,
+                    limit: Optional[int] = None) -> List[Tuple[str, str]]:
+        return self.adapter.list_sorted(n_type, after, limit)
+
+    def filter_natively(self, n_type: LocationDataType,
+                        filters: QueryFilters) -> Tuple[Optional[Set[str]], QueryFilters]:
+        return self.adapter.filter_natively(n_type, filters)
+
+    def match_substring(self, n_type: LocationDataType, term: str, field: SearchField) -> Set[str]:
+        return self.adapter.match_substring(n_type, term, field)
+
+    def match_keys(self, n_type: LocationDataType, keys: List[str]) -> Set[str]:
+        return self.adapter.match_keys(n_type, keys)
+
+    def get_key_counts(self, n_type: LocationDataType) -> Dict[str, int]:
+        return self.adapter.get_key_counts(n_type)
+
+    def get_facets(self, n_type: LocationDataType, keys: List[str],
+                   filters: QueryFilters = None) -> Dict[str, Dict[str, int]]:
+        return self.adapter.get_facets(n_type, keys, filters)
+
+    def count(self, n_type: LocationDataType, filters: QueryFilters = None) -> int:
+        return self.adapter.count(n_type, filters)
+
+    def get_version(self, n_type: LocationDataType, oid: str):
+        return self.adapter.get_version(n_type, oid)
+
+    def get_generation(self, n_type: LocationDataType):
+        return self.adapter.get_generation(n_type)
+
+    def add_new(self, n_type: LocationDataType, data: LocationData, user_name: str):
+        (oid, data) = self.adapter.add_new(n_type, data, user_name)
+        self.changelog.record(n_type, [(ChangeAction.CREATE, oid)])
+        return (oid, data)
+
+    def apply_batch(self, n_type: LocationDataType, operations: List[BatchOperation],
+                    usr: str) -> List[Tuple[str, Optional[LocationData]]]:
+        results = self.adapter.apply_batch(n_type, operations, usr)
+        self.changelog.record(n_type, [(ChangeAction(op.action.value), oid) for op, (oid, _) in zip(operations, results)])
+        return results
+
+    def delete_many(self, n_type: LocationDataType, oids: List[str], usr: str) -> List[str]:
+        deleted = self.adapter.delete_many(n_type, oids, usr)
+        self.changelog.record(n_type, [(ChangeAction.DELETE, oid) for oid in deleted])
+        return deleted
+
+    def get_details(self, n_type: LocationDataType, oid: str):
+        return self.adapter.get_details(n_type, oid)
+
+    def get_many(self, n_type: LocationDataType, oids: List[str]) -> Dict[str, LocationData]:
+        return self.adapter.get_many(n_type, oids)
+
+    def update_details(self, n_type: LocationDataType, oid: str, data: LocationData, usr: str):
+        result = self.adapter.update_details(n_type, oid, data, usr)
+        self.changelog.record(n_type, [(ChangeAction.UPDATE, oid)])
+        return result
+
+    def delete(self, n_type: LocationDataType, oid: str, usr: str):
+        result = self.adapter.delete(n_type, oid, usr)
+        self.changelog.record(n_type, [(ChangeAction.DELETE, oid)])
+        return result
+
+    def export_object(self, n_type: LocationDataType, oid: str) -> Tuple[LocationData, List[str], Dict[str, str]]:
+        return self.adapter.export_object(n_type, oid)
+
+    def import_objects(self, n_type: LocationDataType, objects: Iterable[Tuple[str, LocationData, List[str], Dict[str, str]]]) -> int:
+        objects = list(objects)
+        result = self.adapter.import_objects(n_type, objects)
+        # imported objects may or may not have existed before, clients fetch them either way
+        self.changelog.record(n_type, [(ChangeAction.UPDATE, oid) for oid, _, _, _ in objects])
+        return result
+
+    def list_secrets(self, n_type: LocationDataType, oid: str, usr: str):
+        return self.adapter.list_secrets(n_type, oid, usr)
+
+    def get_secret_values(self, n_type: LocationDataType, oid: str, usr: str):
+        return self.adapter.get_secret_values(n_type, oid, usr)
+
+    def add_update_secret(self, n_type: LocationDataType, oid: str, key: str, value: str, usr: str):
+        result = self.adapter.add_update_secret(n_type, oid, key, value, usr)
+        self.changelog.record(n_type, [(ChangeAction.SECRETS, str(oid))])
+        return result
+
+    def get_secret(self, n_type: LocationDataType, oid: str, key: str, usr: str):
+        return self.adapter.get_secret(n_type, oid, key, usr)
+
+    def delete_secret(self, n_type: LocationDataType, oid: str, key: str, usr: str):
+        result = self.adapter.delete_secret(n_type, oid, key, usr)
+        self.changelog.record(n_type, [(ChangeAction.SECRETS, str(oid))])
+        return result
+
+    def get_owner(self, n_type: LocationDataType, oid: str):
+        return self.adapter.get_owner(n_type, oid)
+
+    def check_perm(self, n_type: LocationDataType, oid: str, usr: str):
+        return self.adapter.check_perm(n_type, oid, usr)
+
+    def add_perm(self, n_type: LocationDataType, oid: str, usr: str):
+        return self.adapter.add_perm(n_type, oid, usr)
+
+    def rm_perm(self, n_type: LocationDataType, oid: str, usr: str):
+        return self.adapter.rm_perm(n_type, oid, usr)
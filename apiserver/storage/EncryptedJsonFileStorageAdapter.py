@@ -3,7 +3,8 @@ from cryptography.fernet import Fernet
 from apiserver.config.settings import ApiserverSettings
 from .JsonFileStorageAdapter import JsonFileStorageAdapter, LocationDataType
 
-class EncryptedJsonFileStorageAdapter(JsonFileStorageAdapter):
+class SecretsEncryptionMixin:
+    """ Encrypts the secret values before they are handed to the storage adapter it is mixed into"""
 
     def encrypt(self, string: str):
         f = Fernet(self.encryption_key)
@@ -35,3 +36,7 @@ class EncryptedJsonFileStorageAdapter(JsonFileStorageAdapter):
     def delete_secret(self, n_type: LocationDataType, oid:str, key: str, usr: str):
         """ delete and return the value of the requested secret for the given object"""
         return self.decrypt(super().delete_secret(n_type, oid, key, usr))
+
+
+class EncryptedJsonFileStorageAdapter(SecretsEncryptionMixin, JsonFileStorageAdapter):
+    pass
@@ -1,7 +1,11 @@
+import itertools
 import json
 import os
+import string
 import uuid
-from typing import Dict, List
+import threading
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 import logging
 from fastapi.exceptions import HTTPException
 
@@ -9,25 +13,153 @@ from pydantic import BaseModel
 
 from apiserver.config import ApiserverSettings
 
-from .LocationStorage import (AbstractLocationDataStorageAdapter, LocationData,
-                              LocationDataType)
+from .LocationStorage import (AbstractLocationDataStorageAdapter, BatchAction, BatchOperation,
+                              LocationData, LocationDataType, QueryFilters, SearchField, check_batch,
+                              contains_term)
+from .MetadataKeyIndex import MetadataKeyIndex
+from .NameIndex import NameIndex
+from .TrigramIndex import TrigramIndex
+from .WriteAheadLog import DEFAULT_CHECKPOINT_SIZE, TMP_SUFFIX, WriteAheadLog
 
+INDEX_DIR: str = "_index"
+WAL_FILE: str = "_wal.log"
+# number of hex characters of the oid used per directory level of the sharded layout
+SHARD_WIDTH: int = 2
+# written with every object, objects with this version are read without validating them again
+STORAGE_FORMAT_VERSION: int = 1
+# the trigram index is rebuilt once it holds more stale postings than this and than live objects
+MIN_STALE_REBUILD: int = 1000
+# number of locks the objects are spread over for serializing their changes
+OBJECT_LOCK_STRIPES: int = 64
 
 log = logging.getLogger(__name__)
 
 class StoredData(BaseModel):
     actualData: LocationData
     users: List[str]
+    formatVersion: int = STORAGE_FORMAT_VERSION
 
-def load_object(path):
-    return StoredData.parse_file(path)
+def decode_stored(raw: Union[str, bytes], strict: bool = False) -> StoredData:
+    """
+    build the StoredData from its json. Objects of the current format version were validated
+    before this server wrote them and are built without validation, unless strict is set (for
+    data from elsewhere, e.g. imports); others are validated. Raises ValueError for invalid data
+    """
+    obj = json.loads(raw)
+    if not strict and isinstance(obj, dict) and obj.get('formatVersion') == STORAGE_FORMAT_VERSION:
+        try:
+            data = obj['actualData']
+            return StoredData.construct(
+                actualData=LocationData.construct(name=data['name'], url=data['url'], metadata=data.get('metadata')),
+                users=obj['users'], formatVersion=STORAGE_FORMAT_VERSION)
+        except (KeyError, TypeError):
+            # damaged, the validation reports what is wrong
+            pass
+    return StoredData.parse_obj(obj)
+
+def load_object(path, strict: bool = False) -> StoredData:
+    with open(path, 'rb') as f:
+        return decode_stored(f.read(), strict)
+
+def shard_path(local_path: str, oid: str, shard_depth: int) -> str:
+    """ path of the object in a layout with shard_depth directory levels keyed on the start of the oid"""
+    shards = [oid[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(shard_depth)]
+    return os.path.join(local_path, *shards, oid)
+
+def locate_object(local_path: str, oid: str, shard_depth: int) -> Optional[str]:
+    """
+    return the path of the object in the sharded or the flat layout, or None if it does not exist;
+    objects are linked into their new place before they are removed from the old one during a
+    migration, so checking the new place again finds objects moved while looking for them
+    """
+    preferred = shard_path(local_path, oid, shard_depth)
+    for path in (preferred, os.path.join(local_path, oid), preferred):
+        if os.path.isfile(path):
+            return path
+    return None
+
+def scan_objects(local_path: str) -> Iterator[Tuple[str, str]]:
+    """ yield (oid, path) of all objects below local_path, in the flat as well as in the sharded layout"""
+    with os.scandir(local_path) as entries:
+        for entry in entries:
+            # the type of the directory entry is known from scandir, no extra stat needed
+            if entry.is_dir(follow_symlinks=False):
+                if len(entry.name) == SHARD_WIDTH and all(c in string.hexdigits for c in entry.name):
+                    yield from scan_objects(entry.path)
+            elif entry.is_file() and not entry.name.endswith(('secrets', TMP_SUFFIX)):
+                yield entry.name, entry.path
 
-def get_unique_id(path: str) -> str:
+def iter_stored_objects(data_dir: str, n_type: LocationDataType):
+    """
+    read all objects of the given type directly from a json data directory and
+    yield them as (oid, data, users, secrets); the secrets are returned as stored
+    """
+    local_path = os.path.join(data_dir, n_type.value)
+    if not os.path.isdir(local_path):
+        return
+    for f, p in sorted(scan_objects(local_path)):
+        # the objects are imported elsewhere, so they are validated
+        obj = load_object(p, strict=True)
+        secrets = {}
+        if os.path.isfile(p + ".secrets"):
+            with open(p + ".secrets", "r") as secrets_file:
+                secrets = json.load(secrets_file)
+        yield f, obj.actualData, obj.users, secrets
+
+def get_unique_id(path: str, shard_depth: int = 0) -> str:
     oid = str(uuid.uuid4())
-    while os.path.exists(os.path.join(path, oid)):
+    while locate_object(path, oid, shard_depth) is not None:
         oid = str(uuid.uuid4())
     return oid
 
+def link_file(source: str, target: str) -> bool:
+    """ hard link source to target, return False if the source does not exist (any more)"""
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        # left over from an interrupted migration, or written by the server since, which
+        # only writes the new place, so the source is the same or outdated either way
+        pass
+    except FileNotFoundError:
+        return False
+    return True
+
+def remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def migrate_layout(data_dir: str, n_type: LocationDataType, shard_depth: int) -> int:
+    """
+    move all objects of the given type (and their secrets) into the layout with the given
+    shard depth, return the number of moved objects
+
+    This is safe while the server is running with the same shard depth: every file is hard
+    linked into its new place before it is removed from the old one, so it can always be found.
+    The server only ever writes the new place; it moves an object that is still in the old one
+    before changing it and removes the old files first when deleting it, so neither can bring
+    back a file the migration has moved.
+    """
+    local_path = os.path.join(data_dir, n_type.value)
+    if not os.path.isdir(local_path):
+        return 0
+    moved = 0
+    for oid, path in list(scan_objects(local_path)):
+        target = shard_path(local_path, oid, shard_depth)
+        if path == target:
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if not link_file(path, target):
+            # moved or deleted by the server in the meantime
+            continue
+        if link_file(path + ".secrets", target + ".secrets"):
+            remove_file(path + ".secrets")
+        remove_file(path)
+        moved += 1
+    log.info("Moved %d objects of type %s to shard depth %d.", moved, n_type.value, shard_depth)
+    return moved
+
 
 class JsonFileStorageAdapter(AbstractLocationDataStorageAdapter):
     """ This stores LocationData via the StoredData Object as json files
@@ -37,6 +169,17 @@ class JsonFileStorageAdapter(AbstractLocationDataStorageAdapter):
     this dataobject, uncluding removing their own access (this might trigger a
     confirmation via the frontend, but this is not enforced via the api)
 
+    With a shard_depth > 0, the objects are spread over nested directories named after
+    the first characters of their oid, objects in the flat layout are still found and
+    are moved into the sharded one when they are written.
+
+    All changes are committed through a write-ahead log, so an object and its
+    secrets are never left half written and concurrent writes share one fsync.
+    Every change of an object reads, modifies and commits it holding the lock of
+    the object (one of a fixed set of locks), so concurrent changes of the same
+    object are not lost and a deleted object is not written again, while changes
+    of different objects still run in parallel and share their syncs.
+
     IMPORTANT: The adapter does not check for authentication or authorization,
     it should only be invoked if the permissions have been checked
     """
@@ -44,9 +187,161 @@ class JsonFileStorageAdapter(AbstractLocationDataStorageAdapter):
     def __init__(self, settings: ApiserverSettings):
         AbstractLocationDataStorageAdapter.__init__(self)
         self.data_dir = settings.json_storage_path
+        self.shard_depth = getattr(settings, 'shard_depth', 0) or 0
         log.info("Initializing JsonFileStorageAdapter.")
         if not (os.path.exists(self.data_dir) and os.path.isdir(self.data_dir)):
             raise Exception(f"Data Directory {self.data_dir} does not exist.")
+        # replays writes interrupted by a crash, so it has to come before loading the indexes
+        self.wal = WriteAheadLog(os.path.join(self.data_dir, WAL_FILE), self.data_dir,
+                                 getattr(settings, 'wal_checkpoint_size', None) or DEFAULT_CHECKPOINT_SIZE,
+                                 self.__sync_indexes)
+        self.index_dir = os.path.join(self.data_dir, INDEX_DIR)
+        if not os.path.isdir(self.index_dir):
+            os.mkdir(self.index_dir)
+        self.name_indexes: Dict[LocationDataType, NameIndex] = {}
+        for n_type in LocationDataType:
+            self.name_indexes[n_type] = self.__load_index(n_type)
+        # the recovered records are only dropped once the indexes reflect them durably
+        self.wal.checkpoint()
+        # in-memory indexes are built on first use
+        self.__text_indexes: Dict[LocationDataType, TrigramIndex] = {}
+        self.__key_indexes: Dict[LocationDataType, MetadataKeyIndex] = {}
+        self.__index_lock = threading.Lock()
+        # held while building the in-memory indexes, writes only need the index lock
+        self.__build_lock = threading.Lock()
+        self.__changed_while_building: Dict[LocationDataType, Dict[str, Optional[LocationData]]] = {}
+        # versions of the objects written since the start, bumped with the indexes after every commit
+        self.__epoch = uuid.uuid4().hex
+        self.__versions: Dict[Tuple[LocationDataType, str], int] = {}
+        self.__version_counter = itertools.count(1)
+        self.__object_locks = [threading.Lock() for _ in range(OBJECT_LOCK_STRIPES)]
+
+    @contextmanager
+    def __locked(self, n_type: LocationDataType, oids: Iterable[str]):
+        """ hold the locks of the given objects, always taken in the same order so that they can not deadlock"""
+        stripes = sorted({hash((n_type.value, str(oid))) % OBJECT_LOCK_STRIPES for oid in oids})
+        with ExitStack() as stack:
+            for stripe in stripes:
+                stack.enter_context(self.__object_locks[stripe])
+            yield
+
+    def __load_index(self, n_type: LocationDataType) -> NameIndex:
+        local_path = self.__setup_path(n_type.value)
+
+        def read_name(oid: str):
+            try:
+                return load_object(locate_object(local_path, oid, self.shard_depth)).actualData.name
+            except ValueError:
+                log.error("Skipping unreadable object %s/%s while building the index.", n_type.value, oid)
+                return None
+
+        # objects written again by the recovery of the write-ahead log may have been renamed
+        recovered = [os.path.basename(path) for path in self.wal.recovered
+                     if path.split(os.sep, 1)[0] == n_type.value and not path.endswith(".secrets")]
+        index = NameIndex(self.index_dir, n_type.value)
+        index.load(lambda: self.__scan_ids(local_path), read_name, recovered)
+        return index
+
+    def __sync_indexes(self):
+        # the name changes have to be durable before the log records of the writes are dropped
+        for index in self.name_indexes.values():
+            index.sync()
+
+    def __build_indexes(self, n_type: LocationDataType):
+        # builds the missing indexes of the type without holding the index lock, so writes go on;
+        # the objects they change in the meantime are recorded and replayed on the new indexes
+        with self.__build_lock:
+            with self.__index_lock:
+                text_index = TrigramIndex() if n_type not in self.__text_indexes else None
+                key_index = MetadataKeyIndex() if n_type not in self.__key_indexes else None
+                if text_index is None and key_index is None:
+                    return
+                changed = self.__changed_while_building[n_type] = {}
+            log.info("Building search indexes for type %s.", n_type.value)
+            try:
+                for oid in self.list_ids(n_type):
+                    try:
+                        data = self.get_details(n_type, oid)
+                    except FileNotFoundError:
+                        # deleted since listing
+                        continue
+                    if text_index is not None:
+                        text_index.add(oid, data)
+                    if key_index is not None:
+                        key_index.add(oid, data)
+            except BaseException:
+                with self.__index_lock:
+                    del self.__changed_while_building[n_type]
+                raise
+            with self.__index_lock:
+                del self.__changed_while_building[n_type]
+                for oid, data in changed.items():
+                    for index in (text_index, key_index):
+                        if index is None:
+                            continue
+                        if data is None:
+                            index.remove(oid)
+                        else:
+                            index.add(oid, data)
+                if text_index is not None:
+                    self.__text_indexes[n_type] = text_index
+                if key_index is not None:
+                    self.__key_indexes[n_type] = key_index
+
+    def __text_index(self, n_type: LocationDataType) -> TrigramIndex:
+        while True:
+            self.__build_indexes(n_type)
+            with self.__index_lock:
+                # may have been dropped again in the meantime
+                text_index = self.__text_indexes.get(n_type)
+            if text_index is not None:
+                return text_index
+
+    def __key_index(self, n_type: LocationDataType) -> MetadataKeyIndex:
+        self.__build_indexes(n_type)
+        with self.__index_lock:
+            return self.__key_indexes[n_type]
+
+    def __drop_stale(self, n_type: LocationDataType):
+        # has to be called with the index lock held
+        text_index = self.__text_indexes.get(n_type)
+        if text_index is not None and text_index.stale > max(len(text_index), MIN_STALE_REBUILD):
+            log.info("Dropping the trigram index of type %s with %d stale postings.", n_type.value, text_index.stale)
+            del self.__text_indexes[n_type]
+
+    def __index_object(self, n_type: LocationDataType, oid: str, data: LocationData):
+        with self.__index_lock:
+            if n_type in self.__changed_while_building:
+                self.__changed_while_building[n_type][oid] = data
+            self.__versions[(n_type, oid)] = next(self.__version_counter)
+            self.name_indexes[n_type].put(oid, data.name)
+            if n_type in self.__text_indexes:
+                self.__text_indexes[n_type].add(oid, data)
+                self.__drop_stale(n_type)
+            if n_type in self.__key_indexes:
+                self.__key_indexes[n_type].add(oid, data)
+
+    def __unindex_object(self, n_type: LocationDataType, oid: str):
+        self.__unindex_objects(n_type, [oid])
+
+    def __unindex_objects(self, n_type: LocationDataType, oids: List[str]):
+        with self.__index_lock:
+            for oid in oids:
+                self.__versions.pop((n_type, oid), None)
+            self.name_indexes[n_type].remove_many(oids)
+            if n_type in self.__changed_while_building:
+                for oid in oids:
+                    self.__changed_while_building[n_type][oid] = None
+            if n_type in self.__text_indexes:
+                for oid in oids:
+                    self.__text_indexes[n_type].remove(oid)
+                self.__drop_stale(n_type)
+            if n_type in self.__key_indexes:
+                for oid in oids:
+                    self.__key_indexes[n_type].remove(oid)
+
+    def __scan_ids(self, local_path: str) -> List[str]:
+        return [oid for oid, _ in scan_objects(local_path)]
 
     def __setup_path(self, value: str) -> str:
         localpath = os.path.join(self.data_dir, value)
@@ -62,14 +357,81 @@ class JsonFileStorageAdapter(AbstractLocationDataStorageAdapter):
             log.error("Escaping the data dir! %s %s", common, full_path)
             raise FileNotFoundError()
 
-        if not os.path.isfile(full_path):
+        found = locate_object(localpath, str(oid), self.shard_depth)
+        if found is not None and os.path.commonprefix((os.path.realpath(found), os.path.realpath(self.data_dir))) != os.path.realpath(self.data_dir):
+            log.error("Escaping the data dir! %s", found)
+            raise FileNotFoundError()
+        if found is None:
             log.error("Requested object (%s) %s does not exist.", oid, full_path)
             raise FileNotFoundError(
                 f"The requested object ({oid}) {full_path} does not exist.")
-        return full_path
+        return found
 
     def __get_secrets_path(self, value: str, oid: str) -> str:
-        return self.__get_object_path(value, oid) + ".secrets"
+        secrets_path = self.__get_object_path(value, oid) + ".secrets"
+        if not os.path.isfile(secrets_path):
+            # the secrets are moved after the object during a migration
+            flat_path = os.path.join(self.data_dir, value, str(oid)) + ".secrets"
+            if os.path.isfile(flat_path):
+                return flat_path
+        return secrets_path
+
+    def __write_path(self, n_type: LocationDataType, oid: str) -> str:
+        """
+        return the path of the object in the configured layout, which is where it is written to;
+        an object still in the flat layout is moved there first, as a running migration may
+        remove the flat files at any time
+        """
+        target = shard_path(os.path.join(self.data_dir, n_type.value), str(oid), self.shard_depth)
+        while True:
+            found = self.__get_object_path(value=n_type.value, oid=oid)
+            if found == target:
+                return target
+            try:
+                with open(found, 'r') as f:
+                    ops = [(target, f.read())]
+                if not os.path.isfile(target + ".secrets") and os.path.isfile(found + ".secrets"):
+                    with open(found + ".secrets", 'r') as f:
+                        ops.append((target + ".secrets", f.read()))
+            except FileNotFoundError:
+                # moved by the migration in the meantime
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            self.__commit(ops + [(found + ".secrets", None), (found, None)])
+            return target
+
+    def __secrets_ops(self, n_type: LocationDataType, oid: str, path: str,
+                      secrets: Optional[Dict[str, str]]) -> List[Tuple[str, Optional[str]]]:
+        """
+        the operations that replace (or for None delete) the secrets of the object at path,
+        together with a copy a running migration has not removed from the flat layout yet
+        """
+        ops = [(path + ".secrets", None if secrets is None else json.dumps(secrets))]
+        flat_path = os.path.join(self.data_dir, n_type.value, str(oid)) + ".secrets"
+        if flat_path != ops[0][0] and os.path.isfile(flat_path):
+            if secrets is None:
+                # first, so that the migration can not link it into the new place again
+                ops.insert(0, (flat_path, None))
+            else:
+                ops.append((flat_path, None))
+        return ops
+
+    def __delete_ops(self, n_type: LocationDataType, oid: str) -> List[Tuple[str, Optional[str]]]:
+        """ the operations that delete the object and its secrets in the flat and the configured layout"""
+        self.__get_object_path(value=n_type.value, oid=oid)
+        local_path = os.path.join(self.data_dir, n_type.value)
+        path = shard_path(local_path, str(oid), self.shard_depth)
+        flat_path = os.path.join(local_path, str(oid))
+        ops = []
+        if flat_path != path:
+            # first, so that a running migration can not link them into the new place again
+            ops = [(p, None) for p in (flat_path + ".secrets", flat_path) if os.path.isfile(p)]
+        # while the flat files exist, the migration may still link the secrets into the new place
+        secrets = bool(ops) or os.path.isfile(path + ".secrets")
+        ops.append((path, None))
+        if secrets:
+            ops.append((path + ".secrets", None))
+        return ops
 
     def __load_secrets(self, path: str) -> Dict[str, str]:
         if not os.path.isfile(path):
@@ -77,33 +439,141 @@ class JsonFileStorageAdapter(AbstractLocationDataStorageAdapter):
         with open(path, "r") as f:
             return json.load(f)
 
-    def __store_secrets(self, path: str, secrets: Dict[str, str]):
-        with open(path, "w") as f:
-            json.dump(secrets, f)
+    def __store_secrets(self, n_type: LocationDataType, oid: str, path: str, secrets: Dict[str, str]):
+        self.__commit(self.__secrets_ops(n_type, oid, path, secrets))
+
+    def __commit(self, ops: List[Tuple[str, Optional[str]]]):
+        self.wal.commit([(os.path.relpath(path, self.data_dir), content) for path, content in ops])
+
+    def __committed(self, ops: List[Tuple[str, Optional[str]]]):
+        # the indexes have to be updated in the block, so the log is not checkpointed before
+        return self.wal.committed([(os.path.relpath(path, self.data_dir), content) for path, content in ops])
 
     def get_list(self, n_type: LocationDataType) -> List:
-        local_path = self.__setup_path(n_type.value)
-        ret = []
-        for f in os.listdir(local_path):
-            p = os.path.join(local_path, f)
-            if not os.path.isfile(p):
-                continue
-            if p.endswith('secrets'):
-                continue
-            data = load_object(p)
-            ret.append((data.actualData.name, f))
         log.debug("Listing all objects ob type %s.", n_type.value)
-        return ret
+        return self.name_indexes[n_type].entries()
+
+    def list_ids(self, n_type: LocationDataType) -> List[str]:
+        return self.name_indexes[n_type].ids()
+
+    def list_sorted(self, n_type: LocationDataType, after: Optional[Tuple[str, str]] = None,
+                    limit: Optional[int] = None) -> List[Tuple[str, str]]:
+        return self.name_indexes[n_type].range(after, limit)
+
+    def count(self, n_type: LocationDataType, filters: QueryFilters = None) -> int:
+        if filters is None or not (filters.name or filters.url or filters.has_key or filters.search):
+            return len(self.name_indexes[n_type])
+        return super().count(n_type, filters)
+
+    def filter_natively(self, n_type: LocationDataType,
+                        filters: QueryFilters) -> Tuple[Optional[Set[str]], QueryFilters]:
+        if not (filters.name or filters.url or filters.has_key or filters.search):
+            return None, filters
+        # cheapest first, every further filter only narrows the remaining candidates down
+        candidates = self.__key_index(n_type).query(filters.has_key) if filters.has_key else None
+        if filters.name or filters.url or filters.search:
+            text_index = self.__text_index(n_type)
+            for term, field in ((filters.name, SearchField.NAME), (filters.url, SearchField.URL),
+                                (filters.search, SearchField.ANY)):
+                if candidates is not None and not candidates:
+                    break
+                if term:
+                    candidates = text_index.query(term, field, within=candidates)
+        # the trigram candidates are verified by `query`, against the cached objects if there is a cache
+        return candidates, QueryFilters(name=filters.name, url=filters.url, search=filters.search)
+
+    def match_substring(self, n_type: LocationDataType, term: str, field: SearchField) -> Set[str]:
+        candidates = self.__text_index(n_type).query(term, field)
+        if candidates is None:
+            return super().match_substring(n_type, term, field)
+        return {oid for oid, data in self.get_many(n_type, list(candidates)).items() if contains_term(data, term, field)}
+
+    def match_keys(self, n_type: LocationDataType, keys: List[str]) -> Set[str]:
+        return self.__key_index(n_type).query(keys)
+
+    def get_key_counts(self, n_type: LocationDataType) -> Dict[str, int]:
+        return self.__key_index(n_type).cardinalities()
+
+    def get_facets(self, n_type: LocationDataType, keys: List[str],
+                   filters: QueryFilters = None) -> Dict[str, Dict[str, int]]:
+        within = None
+        if filters is not None and (filters.name or filters.url or filters.has_key or filters.search):
+            # answered by the indexes as well
+            within = {oid for _, oid in self.query(n_type, filters, sort=False)}
+        return self.__key_index(n_type).facets(keys, within)
+
+    def get_version(self, n_type: LocationDataType, oid: str):
+        full_path = self.__get_object_path(value=n_type.value, oid=oid)
+        stat = os.stat(full_path)
+        # the counter changes with every write through this adapter, as the inode is reused and
+        # the mtime can be too coarse to tell; the stat only catches changes made outside of it
+        return (self.__epoch, self.__versions.get((n_type, oid), 0), stat.st_mtime_ns, stat.st_size)
+
+    def get_generation(self, n_type: LocationDataType):
+        # every add, update and delete goes through the persisted name index
+        return self.name_indexes[n_type].generation
 
     def add_new(self, n_type: LocationDataType, data: LocationData, user_name: str):
         localpath = self.__setup_path(value=n_type.value)
-        oid = get_unique_id(path=localpath)
+        oid = get_unique_id(path=localpath, shard_depth=self.shard_depth)
+        full_path = shard_path(localpath, oid, self.shard_depth)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
         to_store = StoredData(users=[user_name], actualData=data)
-        with open(os.path.join(localpath, oid), 'w') as json_file:
-            json.dump(to_store.dict(), json_file)
+        with self.__committed([(full_path, json.dumps(to_store.dict()))]):
+            self.__index_object(n_type, oid, data)
         log.debug("Added new object with oid %s by user '%s'.", oid, user_name)
         return (oid, data)
 
+    def apply_batch(self, n_type: LocationDataType, operations: List[BatchOperation],
+                    usr: str) -> List[Tuple[str, Optional[LocationData]]]:
+        localpath = self.__setup_path(value=n_type.value)
+        with self.__locked(n_type, [op.oid for op in operations if op.action != BatchAction.CREATE]):
+            check_batch(operations, lambda oid: oid in self.name_indexes[n_type])
+            ops = []
+            results = []
+            created = set()
+            for op in operations:
+                if op.action == BatchAction.CREATE:
+                    oid = get_unique_id(path=localpath, shard_depth=self.shard_depth)
+                    while oid in created:
+                        oid = get_unique_id(path=localpath, shard_depth=self.shard_depth)
+                    created.add(oid)
+                    full_path = shard_path(localpath, oid, self.shard_depth)
+                    ops.append((full_path, json.dumps(StoredData(users=[usr], actualData=op.data).dict())))
+                    results.append((oid, op.data))
+                elif op.action == BatchAction.UPDATE:
+                    full_path = self.__write_path(n_type, op.oid)
+                    obj = load_object(path=full_path)
+                    obj.actualData = op.data
+                    ops.append((full_path, json.dumps(obj.dict())))
+                    results.append((op.oid, op.data))
+                else:
+                    ops.extend(self.__delete_ops(n_type, op.oid))
+                    results.append((op.oid, None))
+            # one record in the write-ahead log, so either all or none of the changes are applied
+            with self.__committed(ops):
+                for oid, data in results:
+                    if data is not None:
+                        self.__index_object(n_type, oid, data)
+                deleted = [oid for oid, data in results if data is None]
+                if deleted:
+                    self.__unindex_objects(n_type, deleted)
+        log.debug("Applied batch of %d operations on %s by user '%s'.", len(operations), n_type.value, usr)
+        return results
+
+    def delete_many(self, n_type: LocationDataType, oids: List[str], usr: str) -> List[str]:
+        self.__setup_path(value=n_type.value)
+        with self.__locked(n_type, oids):
+            existing = [oid for oid in dict.fromkeys(oids) if oid in self.name_indexes[n_type]]
+            ops = []
+            for oid in existing:
+                ops.extend(self.__delete_ops(n_type, oid))
+            if ops:
+                with self.__committed(ops):
+                    self.__unindex_objects(n_type, existing)
+        log.debug("Deleted %d objects of type %s by user '%s'.", len(existing), n_type.value, usr)
+        return existing
+
     def get_details(self, n_type: LocationDataType, oid: str):
         full_path = self.__get_object_path(value=n_type.value, oid=oid)
         obj = load_object(path=full_path)
@@ -111,24 +581,53 @@ class JsonFileStorageAdapter(AbstractLocationDataStorageAdapter):
         return obj.actualData
 
     def update_details(self, n_type: LocationDataType, oid: str, data: LocationData, usr: str):
-        full_path = self.__get_object_path(value=n_type.value, oid=oid)
-        obj = load_object(path=full_path)
-        obj.actualData = data
+        with self.__locked(n_type, [oid]):
+            full_path = self.__write_path(n_type, oid)
+            obj = load_object(path=full_path)
+            obj.actualData = data
 
-        with open(full_path, 'w') as f:
-            json.dump(obj.dict(), f)
+            with self.__committed([(full_path, json.dumps(obj.dict()))]):
+                self.__index_object(n_type, oid, data)
 
         log.debug("Updated  object with oid %s by user '%s'.", oid, usr)
         return (oid, data)
 
+    def export_object(self, n_type: LocationDataType, oid: str) -> Tuple[LocationData, List[str], Dict[str, str]]:
+        obj = load_object(self.__get_object_path(value=n_type.value, oid=oid))
+        return obj.actualData, obj.users, self.__load_secrets(self.__get_secrets_path(n_type.value, oid))
+
+    def import_objects(self, n_type: LocationDataType, objects: Iterable[Tuple[str, LocationData, List[str], Dict[str, str]]]) -> int:
+        localpath = self.__setup_path(value=n_type.value)
+        objects = list(objects)
+        with self.__locked(n_type, [oid for oid, *_ in objects]):
+            ops = []
+            imported = []
+            for oid, data, users, secrets in objects:
+                existing = oid in self.name_indexes[n_type]
+                if existing:
+                    full_path = self.__write_path(n_type, oid)
+                else:
+                    if os.path.basename(oid) != oid or oid.startswith('.'):
+                        raise ValueError(f"Invalid object id {oid}")
+                    full_path = shard_path(localpath, oid, self.shard_depth)
+                    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                ops.append((full_path, json.dumps(StoredData(users=users, actualData=data).dict())))
+                if secrets or existing:
+                    ops.extend(self.__secrets_ops(n_type, oid, full_path, secrets or None))
+                imported.append((oid, data))
+            if ops:
+                with self.__committed(ops):
+                    for oid, data in imported:
+                        self.__index_object(n_type, oid, data)
+        log.debug("Imported %d objects of type %s.", len(imported), n_type.value)
+        return len(imported)
+
     def delete(self, n_type: LocationDataType, oid: str, usr: str):
-        full_path = self.__get_object_path(value=n_type.value, oid=oid)
-        secrets_path = self.__get_secrets_path(n_type.value, oid)
-        log.debug("Deleted object %s/%s by user '%s'.", n_type, oid, usr)
-        os.remove(full_path)
-        if os.path.isfile(secrets_path):
-            log.debug("Deleted secrets from object %s/%s by user '%s", n_type, oid, usr)
-            os.remove(secrets_path)
+        with self.__locked(n_type, [oid]):
+            ops = self.__delete_ops(n_type, oid)
+            log.debug("Deleted object %s/%s by user '%s'.", n_type, oid, usr)
+            with self.__committed(ops):
+                self.__unindex_object(n_type, oid)
 
     def list_secrets(self, n_type: LocationDataType, oid:str, usr: str):
         """ list all available secrets for this object"""
@@ -143,11 +642,12 @@ class JsonFileStorageAdapter(AbstractLocationDataStorageAdapter):
 
     def add_update_secret(self, n_type: LocationDataType, oid:str, key: str, value: str, usr: str):
         """ add new secrets to an existing object"""
-        secrets_path = self.__get_secrets_path(value=n_type.value, oid=oid)
-        secrets = self.__load_secrets(secrets_path)
-        secrets[key] = value
-        log.debug('User %s is updating secretes for %s', usr, oid)
-        self.__store_secrets(secrets_path, secrets)
+        with self.__locked(n_type, [oid]):
+            full_path = self.__write_path(n_type, oid)
+            secrets = self.__load_secrets(self.__get_secrets_path(value=n_type.value, oid=oid))
+            secrets[key] = value
+            log.debug('User %s is updating secretes for %s', usr, oid)
+            self.__store_secrets(n_type, oid, full_path, secrets)
 
     def get_secret(self, n_type: LocationDataType, oid:str, key: str, usr: str):
         """ return the value of the requested secret for the given object"""
@@ -161,11 +661,12 @@ class JsonFileStorageAdapter(AbstractLocationDataStorageAdapter):
 
     def delete_secret(self, n_type: LocationDataType, oid:str, key: str, usr: str):
         """ delete and return the value of the requested secret for the given object"""
-        secrets_path = self.__get_secrets_path(value=n_type.value, oid=oid)
-        secrets = self.__load_secrets(secrets_path)
-        val = secrets.pop(key, None)
-        if not val:
-            raise HTTPException(404, f"Secret with key {key} does not exist for the object {n_type.value}/{oid}")
-        log.debug('User %s delete secret for %s', usr, oid)
-        self.__store_secrets(secrets_path, secrets)
+        with self.__locked(n_type, [oid]):
+            full_path = self.__write_path(n_type, oid)
+            secrets = self.__load_secrets(self.__get_secrets_path(value=n_type.value, oid=oid))
+            val = secrets.pop(key, None)
+            if not val:
+                raise HTTPException(404, f"Secret with key {key} does not exist for the object {n_type.value}/{oid}")
+            log.debug('User %s delete secret for %s', usr, oid)
+            self.__store_secrets(n_type, oid, full_path, secrets)
         return val
@@ -1,7 +1,9 @@
 
+import heapq
 from enum import Enum
-from typing import Dict, Optional, List
+from typing import Callable, Dict, Hashable, Iterable, Iterator, Optional, List, Set, Tuple
 
+from fastapi.exceptions import HTTPException
 from pydantic import BaseModel
 
 
@@ -18,6 +20,147 @@ class LocationData(BaseModel):
     metadata: Optional[Dict[str, str]]
 
 
+class SearchField(Enum):
+    NAME = 'name'
+    URL = 'url'
+    ANY = 'any'
+
+
+def contains_term(data: LocationData, term: str, field: SearchField) -> bool:
+    """
+    check if the term is contained in the given field of the object, ignoring case;
+    ANY matches name, url, metadata keys and metadata values
+    """
+    if field in (SearchField.NAME, SearchField.ANY) and term.lower() in data.name.lower():
+        return True
+    if field in (SearchField.URL, SearchField.ANY) and term.lower() in data.url.lower():
+        return True
+    if field == SearchField.ANY and data.metadata:
+        folded = term.casefold()
+        for key, value in data.metadata.items():
+            if folded in key.casefold() or folded in value.casefold():
+                return True
+    return False
+
+
+class QueryFilters(BaseModel):
+    """ filters of a list query, all set filters have to match"""
+    name: Optional[str] = None
+    url: Optional[str] = None
+    has_key: Optional[List[str]] = None
+    search: Optional[str] = None
+
+
+class QueryPage(BaseModel):
+    """
+    1-based page number and number of elements per page; if `after` is set, pages
+    are counted from the first (name, id) pair following it (keyset pagination)
+    """
+    number: int = 1
+    size: int = 25
+    after: Optional[Tuple[str, str]] = None
+
+
+class BatchAction(str, Enum):
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+
+
+class BatchOperation(BaseModel):
+    """ one operation of a batch; create requires data, update an oid and data, delete an oid"""
+    action: BatchAction
+    oid: Optional[str] = None
+    data: Optional[LocationData] = None
+
+
+class BatchResult(BaseModel):
+    """ result of one operation of a batch, data is not set for deletions"""
+    action: BatchAction
+    oid: str
+    data: Optional[LocationData] = None
+
+
+class DeleteStatus(str, Enum):
+    DELETED = 'deleted'
+    NOT_FOUND = 'not_found'
+
+
+class DeleteResult(BaseModel):
+    """ outcome of the deletion of one object in a bulk deletion"""
+    oid: str
+    status: DeleteStatus
+
+
+class MultiGetResult(BaseModel):
+    """ the requested objects that exist, by id, and the ids of those that do not"""
+    found: Dict[str, LocationData]
+    missing: List[str]
+
+
+class ImportLineError(BaseModel):
+    """ a line of an import that was not imported, with the reason"""
+    line: int
+    error: str
+
+
+class ImportResult(BaseModel):
+    """ the numbers of created, updated and failed objects of an import, with the first errors"""
+    created: int = 0
+    updated: int = 0
+    failed: int = 0
+    errors: List[ImportLineError] = []
+
+
+def check_batch(operations: List[BatchOperation], exists: Callable[[str], bool]):
+    """
+    validate all operations of a batch before any of them is applied; every object may
+    only be changed once per batch. Raises a HTTPException naming the first invalid operation
+    """
+    seen: Set[str] = set()
+    for i, op in enumerate(operations):
+        if op.action == BatchAction.CREATE:
+            if op.data is None or op.oid is not None:
+                raise HTTPException(400, f"Operation {i}: create requires data and no oid")
+            continue
+        if op.oid is None or (op.action == BatchAction.UPDATE) != (op.data is not None):
+            raise HTTPException(400, f"Operation {i}: {op.action.value} requires an oid" +
+                                (" and data" if op.action == BatchAction.UPDATE else " and no data"))
+        if op.oid in seen:
+            raise HTTPException(400, f"Operation {i}: object {op.oid} is changed more than once")
+        seen.add(op.oid)
+        if not exists(op.oid):
+            raise HTTPException(404, f"Operation {i}: object {op.oid} does not exist")
+
+
+def contains_keys(data: LocationData, keys: List[str]) -> bool:
+    return set(keys).issubset((data.metadata or {}).keys())
+
+
+def paginate(entries: List, page: Optional[QueryPage]) -> List:
+    if page is None:
+        return entries
+    if page.after is not None:
+        entries = [entry for entry in entries if entry > page.after]
+    index = (page.number - 1) * page.size
+    return entries[index:index + page.size]
+
+
+def select_sorted(entries: List[Tuple[str, str]], page: Optional[QueryPage]) -> List[Tuple[str, str]]:
+    """
+    sort the entries and return the requested page; only the entries up to the end of
+    the page are selected (via a heap), the rest is never sorted
+    """
+    if page is None:
+        return sorted(entries)
+    skip = (page.number - 1) * page.size
+    if skip < 0 or page.size < 0:
+        return paginate(sorted(entries), page)
+    if page.after is not None:
+        entries = (entry for entry in entries if entry > page.after)
+    return heapq.nsmallest(skip + page.size, entries)[skip:]
+
+
 class AbstractLocationDataStorageAdapter: # pragma: no cover
     """
     This is an abstract storage adapter for storing information about datasets,
@@ -42,7 +185,152 @@ class AbstractLocationDataStorageAdapter: # pragma: no cover
         """Get a list of all LocationData Elements with the provided type, as pairs of {name : id}"""
 
         raise NotImplementedError() 
+
+    def list_ids(self, n_type: LocationDataType) -> List[str]:
+        """
+        Get the ids of all LocationData Elements with the provided type. Adapters
+        should override this if the ids can be obtained without loading the objects
+        """
+        return [oid for _, oid in self.get_list(n_type)]
+
+    def query(self, n_type: LocationDataType, filters: QueryFilters = None, sort: bool = True,
+              page: QueryPage = None) -> List[Tuple[str, str]]:
+        """
+        return the (name, id) pairs of all objects of the given type that match the filters,
+        sorted by name and id if requested, restricted to the requested page.
+
+        Filters are first handed to `filter_natively`, the remaining ones are applied in
+        a single pass, cheapest first, loading every candidate at most once.
+        """
+        filters = filters or QueryFilters()
+        candidates, remaining = self.filter_natively(n_type, filters)
+        unfiltered = candidates is None and not (remaining.name or remaining.url or remaining.has_key or remaining.search)
+        if unfiltered and sort and page is not None and page.number >= 1 and page.size >= 0:
+            skip = (page.number - 1) * page.size
+            return self.list_sorted(n_type, page.after, skip + page.size)[skip:]
+
+        entries = list(self.__matches(n_type, candidates, remaining))
+        if sort:
+            return select_sorted(entries, page)
+        return paginate(entries, page)
+
+    def __matches(self, n_type: LocationDataType, candidates: Optional[Set[str]],
+                  remaining: QueryFilters) -> Iterator[Tuple[str, str]]:
+        """ yield the (name, id) pairs of the candidates that also match the remaining filters"""
+        entries = self.get_list(n_type)
+        if candidates is not None:
+            entries = [entry for entry in entries if entry[1] in candidates]
+        if remaining.name:
+            entries = [entry for entry in entries if remaining.name.lower() in entry[0].lower()]
+
+        checks: List[Callable[[LocationData], bool]] = []
+        if remaining.has_key:
+            checks.append(lambda data: contains_keys(data, remaining.has_key))
+        if remaining.url:
+            checks.append(lambda data: contains_term(data, remaining.url, SearchField.URL))
+        if remaining.search:
+            checks.append(lambda data: contains_term(data, remaining.search, SearchField.ANY))
+        if not checks:
+            yield from entries
+            return
+        for entry in entries:
+            try:
+                data = self.get_details(n_type, entry[1])
+            except FileNotFoundError:
+                # deleted since listing
+                continue
+            if all(check(data) for check in checks):
+                yield entry
+
+    def count(self, n_type: LocationDataType, filters: QueryFilters = None) -> int:
+        """
+        return the number of objects of the given type that match the filters, without
+        building the listing. Adapters that keep a count per type should override this
+        for the unfiltered case
+        """
+        filters = filters or QueryFilters()
+        candidates, remaining = self.filter_natively(n_type, filters)
+        if not (remaining.name or remaining.url or remaining.has_key or remaining.search):
+            return len(candidates) if candidates is not None else len(self.list_ids(n_type))
+        return sum(1 for _ in self.__matches(n_type, candidates, remaining))
+
+    def list_sorted(self, n_type: LocationDataType, after: Optional[Tuple[str, str]] = None,
+                    limit: Optional[int] = None) -> List[Tuple[str, str]]:
+        """
+        return up to `limit` (name, id) pairs of the given type in sorted order, starting
+        after the given pair. Adapters that keep the names sorted should override this
+        """
+        entries = self.get_list(n_type)
+        if after is not None:
+            entries = [entry for entry in entries if entry > after]
+        if limit is None:
+            return sorted(entries)
+        return heapq.nsmallest(limit, entries)
+
+    def filter_natively(self, n_type: LocationDataType,
+                        filters: QueryFilters) -> Tuple[Optional[Set[str]], QueryFilters]:
+        """
+        apply the filters that this adapter can answer without loading every object (e.g.
+        from an index). Return the ids of the matching objects (or None if no filter
+        was applied) and the filters that still have to be checked by `query`
+        """
+        return None, filters
+
+    def match_substring(self, n_type: LocationDataType, term: str, field: SearchField) -> Set[str]:
+        """
+        return the ids of all objects of the given type that contain the term in
+        the given field (see `contains_term`). Adapters with an index should override this
+        """
+        if field == SearchField.NAME:
+            return {oid for name, oid in self.get_list(n_type) if term.lower() in name.lower()}
+        return {oid for oid in self.list_ids(n_type) if contains_term(self.get_details(n_type, oid), term, field)}
+
+    def match_keys(self, n_type: LocationDataType, keys: List[str]) -> Set[str]:
+        """ return the ids of all objects of the given type that have all of the given metadata keys"""
+        required = set(keys)
+        return {oid for oid in self.list_ids(n_type)
+                if required.issubset((self.get_details(n_type, oid).metadata or {}).keys())}
+
+    def get_key_counts(self, n_type: LocationDataType) -> Dict[str, int]:
+        """ return all metadata keys used by objects of the given type, with the number of objects using them"""
+        counts: Dict[str, int] = {}
+        for oid in self.list_ids(n_type):
+            for key in self.get_details(n_type, oid).metadata or {}:
+                counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def get_facets(self, n_type: LocationDataType, keys: List[str],
+                   filters: QueryFilters = None) -> Dict[str, Dict[str, int]]:
+        """
+        return the number of objects per value of each of the given metadata keys, counting
+        only the objects that match the filters. Adapters that maintain the counts should
+        override this, this default loads every matching object
+        """
+        facets: Dict[str, Dict[str, int]] = {key: {} for key in keys}
+        oids = [oid for _, oid in self.query(n_type, filters, sort=False)]
+        for data in self.get_many(n_type, oids).values():
+            for key, counts in facets.items():
+                value = (data.metadata or {}).get(key)
+                if value is not None:
+                    counts[value] = counts.get(value, 0) + 1
+        return facets
+
+    def get_version(self, n_type: LocationDataType, oid: str) -> Optional[Hashable]:
+        """
+        return a token that changes whenever the stored object changes, or None if
+        the adapter can not tell; used by caches to detect modifications that did
+        not go through them
+        """
+        return None
     
+    def get_generation(self, n_type: LocationDataType) -> Optional[Hashable]:
+        """
+        return a token that changes whenever an object of the given type is added,
+        changed or deleted, or None if the adapter can not tell; used for the etags
+        of listings. Changes of secrets do not have to be reflected
+        """
+        return None
+
     def add_new(self, n_type: LocationDataType, data: LocationData, user_name: str):
         """
         add a new element of the provided type, assign and return the id and
@@ -51,10 +339,71 @@ class AbstractLocationDataStorageAdapter: # pragma: no cover
 
         raise NotImplementedError()
 
+    def apply_batch(self, n_type: LocationDataType, operations: List[BatchOperation],
+                    usr: str) -> List[Tuple[str, Optional[LocationData]]]:
+        """
+        apply all operations (see `BatchOperation`) or none of them, return (oid, data)
+        for every operation. All operations are validated with `check_batch` first;
+        adapters should override this to commit the whole batch in one transaction,
+        this default applies the operations one by one after the validation
+        """
+        ids = set(self.list_ids(n_type))
+        check_batch(operations, lambda oid: oid in ids)
+        results = []
+        for op in operations:
+            if op.action == BatchAction.CREATE:
+                results.append(self.add_new(n_type, op.data, usr))
+            elif op.action == BatchAction.UPDATE:
+                results.append(self.update_details(n_type, op.oid, op.data, usr))
+            else:
+                self.delete(n_type, op.oid, usr)
+                results.append((op.oid, None))
+        return results
+
+    def delete_many(self, n_type: LocationDataType, oids: List[str], usr: str) -> List[str]:
+        """
+        delete all objects with the given ids that exist in one batch, ids of objects
+        that do not exist are skipped. Return the ids of the deleted objects. Adapters
+        should override this to check and delete within one transaction
+        """
+        ids = set(self.list_ids(n_type))
+        existing = [oid for oid in dict.fromkeys(oids) if oid in ids]
+        self.apply_batch(n_type, [BatchOperation(action=BatchAction.DELETE, oid=oid) for oid in existing], usr)
+        return existing
+
     def get_details(self, n_type: LocationDataType, oid: str):
         """ return the LocationData of the requested object (identified by oid and type)"""
         raise NotImplementedError()
 
+    def export_object(self, n_type: LocationDataType, oid: str) -> Tuple[LocationData, List[str], Dict[str, str]]:
+        """
+        return the data, the users and the secrets of the object as they are stored, i.e. the
+        secrets encrypted if the adapter encrypts them; for backups, see `import_objects`
+        """
+        raise NotImplementedError()
+
+    def import_objects(self, n_type: LocationDataType, objects: Iterable[Tuple[str, LocationData, List[str], Dict[str, str]]]) -> int:
+        """
+        store (oid, data, users, secrets) tuples as returned by `export_object`, replacing existing
+        objects with the same id and their secrets; secrets are stored as given. Returns the
+        number of imported objects
+        """
+        raise NotImplementedError()
+
+    def get_many(self, n_type: LocationDataType, oids: List[str]) -> Dict[str, LocationData]:
+        """
+        return the LocationData of all requested objects that exist, by id; ids of
+        objects that do not exist are left out. Adapters that can load several
+        objects at once should override this
+        """
+        found = {}
+        for oid in oids:
+            try:
+                found[oid] = self.get_details(n_type, oid)
+            except FileNotFoundError:
+                continue
+        return found
+
     def update_details(self, n_type: LocationDataType, oid: str, data: LocationData, usr: str):
         """ change the details of the requested object, return {oid : newData}"""
         raise NotImplementedError()
@@ -0,0 +1,88 @@
+import sys
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+from .LocationStorage import LocationData
+
+
+class MetadataKeyIndex:
+    """ In-memory inverted index from metadata keys to the ids of the objects of one type that have them
+
+    Object ids are interned, so the sets of all keys share the same strings. The
+    number of objects per value of every key is kept as well, for the facets. To keep
+    these counts exact on updates and removals, the metadata of every object is kept
+    too, with interned keys and values; this is the main memory cost of the index.
+    """
+
+    def __init__(self):
+        self.__keys: Dict[str, Set[str]] = {}
+        self.__values: Dict[str, Dict[str, int]] = {}
+        self.__objects: Dict[str, Dict[str, str]] = {}
+        self.__lock = threading.RLock()
+
+    def add(self, oid: str, data: LocationData):
+        """ add the object to the index, replacing an older version of it"""
+        with self.__lock:
+            self.remove(oid)
+            oid = sys.intern(oid)
+            metadata = {sys.intern(key): sys.intern(value) for key, value in (data.metadata or {}).items()}
+            self.__objects[oid] = metadata
+            for key, value in metadata.items():
+                self.__keys.setdefault(key, set()).add(oid)
+                counts = self.__values.setdefault(key, {})
+                counts[value] = counts.get(value, 0) + 1
+
+    def remove(self, oid: str):
+        with self.__lock:
+            for key, value in self.__objects.pop(oid, {}).items():
+                ids = self.__keys[key]
+                ids.discard(oid)
+                if not ids:
+                    del self.__keys[key]
+                counts = self.__values[key]
+                counts[value] -= 1
+                if not counts[value]:
+                    del counts[value]
+                    if not counts:
+                        del self.__values[key]
+
+    def query(self, keys: Iterable[str]) -> Set[str]:
+        """ return the ids of all objects that have every one of the given keys"""
+        with self.__lock:
+            sets = []
+            for key in set(keys):
+                ids = self.__keys.get(key)
+                if not ids:
+                    return set()
+                sets.append(ids)
+            if not sets:
+                return set(self.__objects)
+            sets.sort(key=len)
+            result = set(sets[0])
+            for ids in sets[1:]:
+                result &= ids
+                if not result:
+                    break
+            return result
+
+    def cardinalities(self) -> Dict[str, int]:
+        """ return all known keys with the number of objects that have them"""
+        with self.__lock:
+            return {key: len(ids) for key, ids in self.__keys.items()}
+
+    def facets(self, keys: List[str], within: Optional[Set[str]] = None) -> Dict[str, Dict[str, int]]:
+        """
+        return the number of objects per value of each of the given keys, counting only
+        the objects within the given ids if there are any; keys nobody uses have no values
+        """
+        with self.__lock:
+            if within is None:
+                return {key: dict(self.__values.get(key, {})) for key in keys}
+            facets: Dict[str, Dict[str, int]] = {key: {} for key in keys}
+            for oid in within:
+                metadata = self.__objects.get(oid, {})
+                for key, counts in facets.items():
+                    value = metadata.get(key)
+                    if value is not None:
+                        counts[value] = counts.get(value, 0) + 1
+            return facets
@@ -0,0 +1,223 @@
+import bisect
+import json
+import logging
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .WriteAheadLog import fsync_path
+
+DEFAULT_COMPACT_AFTER: int = 1000
+
+log = logging.getLogger(__name__)
+
+
+class NameIndex:
+    """ Sorted (name, oid) pairs of all objects of one type, persisted next to the data
+
+    The index is stored as a snapshot file and a journal. Every change is appended
+    to the journal as one json line, tagged with a generation number that
+    increases with every change. On startup the snapshot is loaded and all journal
+    entries with a newer generation are replayed. Once the journal grows beyond
+    `compact_after` entries, a new snapshot is written and the journal is truncated.
+
+    The generation is persisted as well, so it can be used to detect whether
+    anything in this type has changed.
+
+    The journal is not synced on every change, `sync` has to be called before the
+    changes are dropped from the write-ahead log of the data. Snapshots are synced
+    when they are written.
+
+    Without an index_dir, the index is kept in memory only.
+    """
+
+    def __init__(self, index_dir: Optional[str], name: str, compact_after: int = DEFAULT_COMPACT_AFTER):
+        self.snapshot_path = os.path.join(index_dir, name + ".snapshot") if index_dir else None
+        self.journal_path = os.path.join(index_dir, name + ".journal") if index_dir else None
+        self.compact_after = compact_after
+        self.generation = 0
+        self.__entries: List[Tuple[str, str]] = []
+        self.__names: Dict[str, str] = {}
+        self.__journal_size = 0
+        self.__unsynced = False
+        self.__lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.__names)
+
+    def __contains__(self, oid: str):
+        return oid in self.__names
+
+    def __apply_put(self, oid: str, name: str):
+        old = self.__names.get(oid)
+        if old is not None:
+            del self.__entries[bisect.bisect_left(self.__entries, (old, oid))]
+        self.__names[oid] = name
+        bisect.insort(self.__entries, (name, oid))
+
+    def __apply_remove(self, oid: str):
+        old = self.__names.pop(oid, None)
+        if old is not None:
+            del self.__entries[bisect.bisect_left(self.__entries, (old, oid))]
+
+    def __apply_remove_many(self, oids: Iterable[str]):
+        removed = set()
+        for oid in oids:
+            if self.__names.pop(oid, None) is not None:
+                removed.add(oid)
+        if removed:
+            # one pass over the sorted entries instead of one deletion per object
+            self.__entries = [entry for entry in self.__entries if entry[1] not in removed]
+
+    def __append(self, record: dict):
+        self.generation += 1
+        if self.journal_path is None:
+            return
+        record['gen'] = self.generation
+        with open(self.journal_path, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+        self.__journal_size += 1
+        self.__unsynced = True
+        if self.__journal_size >= self.compact_after:
+            self.compact()
+
+    def __read_snapshot(self) -> bool:
+        if self.snapshot_path is None or not os.path.isfile(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path, 'r') as f:
+                snapshot = json.load(f)
+        except ValueError:
+            log.error("Index snapshot %s is damaged, rebuilding it.", self.snapshot_path)
+            return False
+        self.generation = snapshot['generation']
+        for name, oid in snapshot['entries']:
+            self.__names[oid] = name
+        self.__entries = sorted((name, oid) for oid, name in self.__names.items())
+        return True
+
+    def __replay_journal(self):
+        if self.journal_path is None or not os.path.isfile(self.journal_path):
+            return
+        with open(self.journal_path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # torn write of the last line after a crash
+                    log.warning("Skipping damaged entry in index journal %s.", self.journal_path)
+                    continue
+                self.__journal_size += 1
+                if record['gen'] <= self.generation:
+                    continue
+                if record['op'] == 'put':
+                    self.__apply_put(record['oid'], record['name'])
+                elif record['op'] == 'remove_many':
+                    self.__apply_remove_many(record['oids'])
+                else:
+                    self.__apply_remove(record['oid'])
+                self.generation = record['gen']
+
+    def load(self, list_ids: Callable[[], Iterable[str]], read_name: Callable[[str], Optional[str]],
+             changed: Iterable[str] = ()):
+        """
+        load snapshot and journal, then reconcile the index with the ids that
+        actually exist; only objects missing from the index and the given changed
+        ones (e.g. written again by a recovery) are read via read_name, which returns
+        None for objects that should not be indexed
+        """
+        with self.__lock:
+            self.__names = {}
+            self.__entries = []
+            self.__journal_size = 0
+            self.generation = 0
+            had_snapshot = self.__read_snapshot()
+            self.__replay_journal()
+
+            existing = set(list_ids())
+            stale = [oid for oid in self.__names if oid not in existing]
+            missing = [oid for oid in existing if oid not in self.__names]
+            for oid in stale:
+                self.__apply_remove(oid)
+            for oid in missing:
+                name = read_name(oid)
+                if name is not None:
+                    self.__apply_put(oid, name)
+            renamed = []
+            for oid in set(changed) & existing:
+                name = read_name(oid) if oid in self.__names else None
+                if name is not None and name != self.__names[oid]:
+                    self.__apply_put(oid, name)
+                    renamed.append(oid)
+            if stale or missing or renamed:
+                log.info("Reconciled index %s: %d stale, %d missing, %d renamed entries.",
+                         self.snapshot_path, len(stale), len(missing), len(renamed))
+                self.generation += 1
+            if stale or missing or renamed or not had_snapshot:
+                self.compact()
+            log.debug("Loaded index %s with %d entries at generation %d.", self.snapshot_path, len(self.__names), self.generation)
+
+    def compact(self):
+        """ write the current state as new snapshot and truncate the journal"""
+        with self.__lock:
+            if self.snapshot_path is None:
+                return
+            tmp_path = self.snapshot_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'generation': self.generation, 'entries': self.__entries}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            fsync_path(os.path.dirname(self.snapshot_path))
+            # entries left in the journal are older than the snapshot, so it does not have to be synced
+            with open(self.journal_path, 'w'):
+                pass
+            self.__journal_size = 0
+            self.__unsynced = False
+
+    def sync(self):
+        """ make all changes appended to the journal durable"""
+        with self.__lock:
+            if self.journal_path is None or not self.__unsynced:
+                return
+            fsync_path(self.journal_path)
+            fsync_path(os.path.dirname(self.journal_path))
+            self.__unsynced = False
+
+    def put(self, oid: str, name: str):
+        """ add or rename the object with the given id"""
+        with self.__lock:
+            self.__apply_put(oid, name)
+            self.__append({'op': 'put', 'oid': oid, 'name': name})
+
+    def remove(self, oid: str):
+        """ remove the object with the given id, if it is part of the index"""
+        with self.__lock:
+            self.__apply_remove(oid)
+            self.__append({'op': 'remove', 'oid': oid})
+
+    def remove_many(self, oids: List[str]):
+        """ remove all objects with the given ids that are part of the index, as one journal entry"""
+        with self.__lock:
+            self.__apply_remove_many(oids)
+            self.__append({'op': 'remove_many', 'oids': list(oids)})
+
+    def get(self, oid: str) -> Optional[str]:
+        """ return the name of the given object, or None if it is not indexed"""
+        return self.__names.get(oid)
+
+    def entries(self) -> List[Tuple[str, str]]:
+        """ return all (name, oid) pairs, sorted by name and oid"""
+        with self.__lock:
+            return list(self.__entries)
+
+    def range(self, after: Optional[Tuple[str, str]] = None, limit: Optional[int] = None) -> List[Tuple[str, str]]:
+        """ return up to limit (name, oid) pairs in sorted order, starting after the given pair"""
+        with self.__lock:
+            start = 0 if after is None else bisect.bisect_right(self.__entries, tuple(after))
+            end = len(self.__entries) if limit is None else start + limit
+            return self.__entries[start:end]
+
+    def ids(self) -> List[str]:
+        with self.__lock:
+            return list(self.__names)
@@ -0,0 +1,627 @@
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import uuid
+import zlib
+from collections import namedtuple
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi.exceptions import HTTPException
+
+from apiserver.config import ApiserverSettings
+
+from .EncryptedJsonFileStorageAdapter import SecretsEncryptionMixin
+from .JsonFileStorageAdapter import StoredData, decode_stored
+from .LocationStorage import (AbstractLocationDataStorageAdapter, BatchAction,
+                              BatchOperation, LocationData, LocationDataType,
+                              QueryFilters, check_batch)
+from .NameIndex import NameIndex
+from .WriteAheadLog import fsync_path
+
+DEFAULT_SEGMENT_DIR: str = "_segments"
+DEFAULT_SEGMENT_SIZE: int = 64 * 1024 * 1024
+DEFAULT_COMPACTION_INTERVAL: float = 60.0
+# sealed segments with less live data than this are compacted
+COMPACTION_THRESHOLD: float = 0.5
+
+# magic, kind, key length, payload length, crc32 of key and payload
+RECORD_HEADER = struct.Struct('<4sBHII')
+RECORD_MAGIC = b'DCR1'
+# footer offset, footer length, magic
+SEGMENT_TRAILER = struct.Struct('<QI4s')
+TRAILER_MAGIC = b'DCF1'
+
+KIND_OBJECT = 1
+KIND_SECRETS = 2
+KIND_DELETE = 3
+# the payload consists of further records, which are only valid together
+KIND_BATCH = 4
+
+SEGMENT_NAME = re.compile(r'^segment-(\d{8})-(\d{4})\.log$')
+
+log = logging.getLogger(__name__)
+
+# offset and length of the payload, size of the whole record
+Location = namedtuple('Location', ['segment', 'offset', 'length', 'size'])
+
+
+def segment_filename(segment: Tuple[int, int]) -> str:
+    return f"segment-{segment[0]:08d}-{segment[1]:04d}.log"
+
+
+def record_size(key: str, length: int) -> int:
+    return RECORD_HEADER.size + len(key.encode()) + length
+
+
+def encode_record(kind: int, key: str, payload: bytes) -> bytes:
+    key_bytes = key.encode()
+    crc = zlib.crc32(payload, zlib.crc32(key_bytes))
+    return RECORD_HEADER.pack(RECORD_MAGIC, kind, len(key_bytes), len(payload), crc) + key_bytes + payload
+
+
+class SegmentStorageAdapter(AbstractLocationDataStorageAdapter):
+    """ This stores LocationData as records in append-only segment files
+
+    Every write (object, full set of secrets of an object, or deletion) is appended as
+    one record to the active segment. An in-memory index points to the latest record
+    of every object and its secrets; reads are served from memory-mapped segments.
+
+    Once the active segment reaches `segment_size`, it is sealed: a footer with the
+    index of the segment is appended, so that on startup only the footers of sealed
+    segments and the records of the last, unsealed segment have to be read.
+
+    A background thread (disabled by a `compaction_interval` of 0) compacts the sealed segments once they contain more
+    superseded or deleted data than live data. All sealed segments are rewritten
+    into a single new one, which takes the place of the newest of them. The old files
+    are only removed after the new one is complete, and a segment lists the segments
+    it replaces, so an interrupted compaction never loses or resurrects data.
+
+    By default (`segment_fsync`), every append is synced before the write returns,
+    one fsync for all records of a batch, so a write that returned survives a power
+    loss. Without it, appends are only flushed to the operating system; they survive
+    a crash of the server, but the last writes may be lost if the machine goes down.
+
+    IMPORTANT: The adapter does not check for authentication or authorization,
+    it should only be invoked if the permissions have been checked
+    """
+
+    def __init__(self, settings: ApiserverSettings):
+        AbstractLocationDataStorageAdapter.__init__(self)
+        self.segment_dir = getattr(settings, 'segment_path', None) or os.path.join(settings.json_storage_path, DEFAULT_SEGMENT_DIR)
+        self.segment_size = getattr(settings, 'segment_size', None) or DEFAULT_SEGMENT_SIZE
+        self.fsync = getattr(settings, 'segment_fsync', True)
+        log.info("Initializing SegmentStorageAdapter in %s.", self.segment_dir)
+        if not os.path.isdir(os.path.dirname(os.path.abspath(self.segment_dir))):
+            raise Exception(f"Parent directory of {self.segment_dir} does not exist.")
+        if not os.path.isdir(self.segment_dir):
+            os.mkdir(self.segment_dir)
+
+        self.__lock = threading.RLock()
+        self.__compaction_lock = threading.Lock()
+        self.__objects: Dict[LocationDataType, Dict[str, Location]] = {n_type: {} for n_type in LocationDataType}
+        self.__secrets: Dict[LocationDataType, Dict[str, Location]] = {n_type: {} for n_type in LocationDataType}
+        self.__names: Dict[LocationDataType, NameIndex] = {}
+        self.__maps: Dict[Tuple[int, int], mmap.mmap] = {}
+        self.__sizes: Dict[Tuple[int, int], int] = {}
+        self.__live: Dict[Tuple[int, int], int] = {}
+        self.__active = None
+        self.__active_file = None
+        self.__active_entries = {}
+        # the name indexes are rebuilt on startup, which restarts their generations
+        self.__epoch = uuid.uuid4().hex
+        self.__load()
+
+        self.__stop = threading.Event()
+        self.__compactor = None
+        interval = getattr(settings, 'compaction_interval', DEFAULT_COMPACTION_INTERVAL)
+        if interval and interval > 0:
+            self.__compactor = threading.Thread(target=self.__compaction_loop, args=(interval,),
+                                                name="segment-compaction", daemon=True)
+            self.__compactor.start()
+
+    # -- loading ---------------------------------------------------------------
+
+    def __path(self, segment: Tuple[int, int]) -> str:
+        return os.path.join(self.segment_dir, segment_filename(segment))
+
+    def __read_footer(self, path: str) -> Tuple[Optional[dict], int]:
+        """ return the footer of a sealed segment and the end of its records, or None for unsealed ones"""
+        size = os.path.getsize(path)
+        if size < SEGMENT_TRAILER.size:
+            return None, size
+        with open(path, 'rb') as f:
+            f.seek(size - SEGMENT_TRAILER.size)
+            offset, length, magic = SEGMENT_TRAILER.unpack(f.read(SEGMENT_TRAILER.size))
+            if magic != TRAILER_MAGIC or offset + length + SEGMENT_TRAILER.size != size:
+                return None, size
+            f.seek(offset)
+            try:
+                return json.loads(f.read(length)), offset
+            except ValueError:
+                return None, size
+
+    def __scan(self, path: str) -> Tuple[List[list], int]:
+        """ read all valid records of an unsealed segment, return the entries and the end of the last valid one"""
+        entries = []
+        with open(path, 'rb') as f:
+            data = f.read()
+        return entries, self.__parse(data, 0, len(data), entries)
+
+    def __parse(self, data: bytes, offset: int, stop: int, entries: List[list]) -> int:
+        """ add the entries of all valid records in data[offset:stop], return the end of the last valid one"""
+        while offset + RECORD_HEADER.size <= stop:
+            magic, kind, key_length, length, crc = RECORD_HEADER.unpack_from(data, offset)
+            start = offset + RECORD_HEADER.size
+            end = start + key_length + length
+            if magic != RECORD_MAGIC or end > stop or zlib.crc32(data[start:end]) != crc:
+                break
+            key = data[start:start + key_length].decode()
+            if kind == KIND_BATCH:
+                batch = []
+                if self.__parse(data, start + key_length, end, batch) != end:
+                    break
+                entries.extend(batch)
+            else:
+                name = None
+                if kind == KIND_OBJECT:
+                    name = json.loads(data[start + key_length:end])['actualData']['name']
+                entries.append([kind, key, start + key_length, length, name])
+            offset = end
+        return offset
+
+    def __apply(self, segment: Tuple[int, int], entry: list, names: Dict[LocationDataType, Dict[str, str]]):
+        kind, key, offset, length, name = entry
+        type_value, oid = key.split('/', 1)
+        n_type = LocationDataType(type_value)
+        location = Location(segment, offset, length, record_size(key, length))
+        if kind == KIND_OBJECT:
+            self.__set(self.__objects[n_type], oid, location)
+            names[n_type][oid] = name
+        elif kind == KIND_SECRETS:
+            self.__set(self.__secrets[n_type], oid, location)
+        else:
+            self.__set(self.__objects[n_type], oid, None)
+            self.__set(self.__secrets[n_type], oid, None)
+            names[n_type].pop(oid, None)
+
+    def __set(self, index: Dict[str, Location], oid: str, location: Optional[Location]):
+        old = index.pop(oid, None)
+        if old is not None and old.segment in self.__live:
+            self.__live[old.segment] -= old.size
+        if location is not None:
+            index[oid] = location
+            self.__live[location.segment] = self.__live.get(location.segment, 0) + location.size
+
+    def __load(self):
+        segments = []
+        for f in os.listdir(self.segment_dir):
+            match = SEGMENT_NAME.match(f)
+            if match:
+                segments.append((int(match.group(1)), int(match.group(2))))
+        segments.sort()
+
+        footers = {segment: self.__read_footer(self.__path(segment)) for segment in segments}
+        replaced = set()
+        for footer, _ in footers.values():
+            if footer is not None:
+                replaced.update(tuple(segment) for segment in footer.get('replaces', []))
+        for segment in [segment for segment in segments if segment in replaced]:
+            log.info("Removing segment %s left over from an interrupted compaction.", segment_filename(segment))
+            os.remove(self.__path(segment))
+            segments.remove(segment)
+
+        names: Dict[LocationDataType, Dict[str, str]] = {n_type: {} for n_type in LocationDataType}
+        for segment in segments:
+            footer, end = footers[segment]
+            self.__live.setdefault(segment, 0)
+            if footer is not None:
+                entries = footer['entries']
+            else:
+                entries, end = self.__scan(self.__path(segment))
+                if end != os.path.getsize(self.__path(segment)):
+                    log.warning("Truncating segment %s after the last complete record at %d.", segment_filename(segment), end)
+                    with open(self.__path(segment), 'r+b') as f:
+                        f.truncate(end)
+                if segment != segments[-1]:
+                    # only the last segment may be unsealed, seal the others now
+                    self.__seal(self.__path(segment), entries, end)
+                else:
+                    self.__active = segment
+                    self.__active_entries = {(entry[0], entry[1]): entry for entry in entries}
+            self.__sizes[segment] = end
+            for entry in entries:
+                self.__apply(segment, entry, names)
+
+        for n_type in LocationDataType:
+            index = NameIndex(None, n_type.value)
+            index.load(names[n_type].keys, names[n_type].get)
+            self.__names[n_type] = index
+
+        if self.__active is None:
+            self.__new_segment((segments[-1][0] + 1 if segments else 1, 0))
+        else:
+            self.__active_file = open(self.__path(self.__active), 'ab')
+        log.debug("Loaded %d segments.", len(segments))
+
+    # -- writing ---------------------------------------------------------------
+
+    def __new_segment(self, segment: Tuple[int, int]):
+        self.__active = segment
+        self.__active_file = open(self.__path(segment), 'ab')
+        if self.fsync:
+            # the records synced later are of no use if the file itself is not in the directory
+            fsync_path(self.segment_dir)
+        self.__active_entries = {}
+        self.__sizes[segment] = 0
+        self.__live[segment] = 0
+
+    def __seal(self, path: str, entries, end: int, replaces=()):
+        """ append the footer with the index of all given entries to the segment file"""
+        latest = {}
+        for entry in entries:
+            latest[(entry[0], entry[1])] = entry
+        footer = json.dumps({
+            'entries': sorted(latest.values(), key=lambda entry: entry[2]),
+            'replaces': [list(r) for r in replaces]
+        }).encode()
+        with open(path, 'ab') as f:
+            f.write(footer + SEGMENT_TRAILER.pack(end, len(footer), TRAILER_MAGIC))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def __append(self, records: List[tuple]) -> List[Location]:
+        """
+        append (kind, type, oid, payload, name) records to the active segment, more than
+        one record are wrapped into a batch record, so they are recovered all or not at all
+        """
+        # has to be called with the lock held
+        segment = self.__active
+        start = self.__sizes[segment]
+        if len(records) > 1:
+            # the records of the batch start after the header and (empty) key of the batch record
+            start += RECORD_HEADER.size
+        encoded = []
+        entries = []
+        locations = []
+        offset = start
+        for kind, n_type, oid, payload, name in records:
+            key = f"{n_type.value}/{oid}"
+            record = encode_record(kind, key, payload)
+            payload_offset = offset + RECORD_HEADER.size + len(key.encode())
+            encoded.append(record)
+            entries.append([kind, key, payload_offset, len(payload), name])
+            locations.append(Location(segment, payload_offset, len(payload), len(record)))
+            offset += len(record)
+        data = b''.join(encoded)
+        if len(records) > 1:
+            data = encode_record(KIND_BATCH, '', data)
+        self.__active_file.write(data)
+        self.__active_file.flush()
+        if self.fsync:
+            os.fsync(self.__active_file.fileno())
+        self.__sizes[segment] += len(data)
+        for entry in entries:
+            self.__active_entries[(entry[0], entry[1])] = entry
+        if self.__sizes[segment] >= self.segment_size:
+            self.__rotate()
+        return locations
+
+    def __rotate(self):
+        segment = self.__active
+        self.__active_file.close()
+        self.__seal(self.__path(segment), self.__active_entries.values(), self.__sizes[segment])
+        self.__maps.pop(segment, None)
+        self.__new_segment((segment[0] + 1, 0))
+        log.debug("Sealed segment %s.", segment_filename(segment))
+
+    def __write(self, kind: int, n_type: LocationDataType, oid: str, payload: bytes, name: str = None):
+        self.__write_all([(kind, n_type, oid, payload, name)])
+
+    def __write_all(self, records: List[tuple]):
+        with self.__lock:
+            locations = self.__append(records)
+            removed: Dict[LocationDataType, List[str]] = {}
+            for (kind, n_type, oid, _, name), location in zip(records, locations):
+                if kind == KIND_OBJECT:
+                    self.__set(self.__objects[n_type], oid, location)
+                    self.__names[n_type].put(oid, name)
+                elif kind == KIND_SECRETS:
+                    self.__set(self.__secrets[n_type], oid, location)
+                else:
+                    self.__set(self.__objects[n_type], oid, None)
+                    self.__set(self.__secrets[n_type], oid, None)
+                    removed.setdefault(n_type, []).append(oid)
+            # an object is changed at most once per batch, so the removals can be applied last
+            for n_type, oids in removed.items():
+                self.__names[n_type].remove_many(oids)
+
+    # -- reading ---------------------------------------------------------------
+
+    def __read(self, location: Location) -> bytes:
+        end = location.offset + location.length
+        with self.__lock:
+            mapped = self.__maps.get(location.segment)
+            if mapped is None or len(mapped) < end:
+                with open(self.__path(location.segment), 'rb') as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.__maps[location.segment] = mapped
+        # segments are never modified in place, so the slice can be taken without the lock
+        return mapped[location.offset:end]
+
+    def __read_current(self, index: Dict[str, Location], oid: str, location: Location) -> bytes:
+        # a compaction may have moved the record and removed its segment since it was located
+        while True:
+            try:
+                return self.__read(location)
+            except FileNotFoundError:
+                with self.__lock:
+                    current = index.get(oid)
+                if current is None or current == location:
+                    raise
+                location = current
+
+    def __locate(self, n_type: LocationDataType, oid: str) -> Location:
+        location = self.__objects[n_type].get(str(oid))
+        if location is None:
+            log.error("Requested object (%s) %s does not exist.", oid, n_type.value)
+            raise FileNotFoundError(f"The requested object ({oid}) does not exist.")
+        return location
+
+    def __load_object(self, n_type: LocationDataType, oid: str) -> StoredData:
+        location = self.__locate(n_type, oid)
+        return decode_stored(self.__read_current(self.__objects[n_type], str(oid), location))
+
+    def __load_secrets(self, n_type: LocationDataType, oid: str) -> Dict[str, str]:
+        with self.__lock:
+            self.__locate(n_type, oid)
+            location = self.__secrets[n_type].get(str(oid))
+        if location is None:
+            return {}
+        return json.loads(self.__read_current(self.__secrets[n_type], str(oid), location))
+
+    # -- compaction ------------------------------------------------------------
+
+    def __compaction_loop(self, interval: float):
+        while not self.__stop.wait(interval):
+            try:
+                self.compact()
+            except Exception:
+                log.exception("Compaction of the segments failed.")
+
+    def close(self):
+        """ stop the compaction thread and close the active segment"""
+        self.__stop.set()
+        if self.__compactor is not None:
+            self.__compactor.join()
+        with self.__lock:
+            self.__active_file.close()
+
+    def garbage_ratio(self) -> float:
+        """ fraction of the records in sealed segments that has been superseded or deleted"""
+        with self.__lock:
+            sealed = [segment for segment in self.__sizes if segment != self.__active]
+            total = sum(self.__sizes[segment] for segment in sealed)
+            if not total:
+                return 0.0
+            return 1.0 - sum(self.__live.get(segment, 0) for segment in sealed) / total
+
+    def compact(self, force: bool = False) -> bool:
+        """
+        rewrite all sealed segments into one, dropping superseded and deleted records;
+        unless forced, only if the garbage ratio exceeds the threshold. Returns
+        whether a compaction was done
+        """
+        with self.__compaction_lock:
+            with self.__lock:
+                sealed = sorted(segment for segment in self.__sizes if segment != self.__active)
+                if not sealed or (not force and self.garbage_ratio() < COMPACTION_THRESHOLD):
+                    return False
+                live = [(kind, n_type, oid, location)
+                        for kind, indexes in ((KIND_OBJECT, self.__objects), (KIND_SECRETS, self.__secrets))
+                        for n_type, index in indexes.items()
+                        for oid, location in index.items() if location.segment in sealed]
+            live.sort(key=lambda item: (item[3].segment, item[3].offset))
+
+            target = (sealed[-1][0], sealed[-1][1] + 1)
+            tmp_path = self.__path(target) + ".tmp"
+            moved = []
+            entries = []
+            with open(tmp_path, 'wb') as f:
+                offset = 0
+                for kind, n_type, oid, location in live:
+                    payload = self.__read(location)
+                    key = f"{n_type.value}/{oid}"
+                    name = self.__names[n_type].get(oid) if kind == KIND_OBJECT else None
+                    record = encode_record(kind, key, payload)
+                    f.write(record)
+                    new_location = Location(target, offset + RECORD_HEADER.size + len(key.encode()), location.length, len(record))
+                    entries.append([kind, key, new_location.offset, new_location.length, name])
+                    moved.append((kind, n_type, oid, location, new_location))
+                    offset += len(record)
+            # the segment is complete before it is renamed into place
+            self.__seal(tmp_path, entries, offset, replaces=sealed)
+            os.replace(tmp_path, self.__path(target))
+            # the replaced segments may only go once the new one is durably in place
+            fsync_path(self.segment_dir)
+
+            with self.__lock:
+                self.__live[target] = 0
+                self.__sizes[target] = offset
+                for kind, n_type, oid, old, new in moved:
+                    index = self.__objects[n_type] if kind == KIND_OBJECT else self.__secrets[n_type]
+                    # only move what has not been overwritten in the meantime
+                    if index.get(oid) == old:
+                        self.__set(index, oid, new)
+                for segment in sealed:
+                    self.__sizes.pop(segment, None)
+                    self.__live.pop(segment, None)
+                    # open maps stay valid for running reads until they are garbage collected
+                    self.__maps.pop(segment, None)
+            for segment in sealed:
+                os.remove(self.__path(segment))
+            log.info("Compacted %d segments into %s.", len(sealed), segment_filename(target))
+            return True
+
+    # -- adapter interface -----------------------------------------------------
+
+    def get_list(self, n_type: LocationDataType) -> List:
+        return self.__names[n_type].entries()
+
+    def list_ids(self, n_type: LocationDataType) -> List[str]:
+        return self.__names[n_type].ids()
+
+    def list_sorted(self, n_type: LocationDataType, after: Optional[Tuple[str, str]] = None,
+                    limit: Optional[int] = None) -> List[Tuple[str, str]]:
+        return self.__names[n_type].range(after, limit)
+
+    def count(self, n_type: LocationDataType, filters: QueryFilters = None) -> int:
+        if filters is None or not (filters.name or filters.url or filters.has_key or filters.search):
+            return len(self.__names[n_type])
+        return super().count(n_type, filters)
+
+    def get_version(self, n_type: LocationDataType, oid: str):
+        return self.__locate(n_type, oid)
+
+    def get_generation(self, n_type: LocationDataType):
+        return (self.__epoch, self.__names[n_type].generation)
+
+    def add_new(self, n_type: LocationDataType, data: LocationData, user_name: str):
+        with self.__lock:
+            oid = str(uuid.uuid4())
+            while oid in self.__objects[n_type]:
+                oid = str(uuid.uuid4())
+            to_store = StoredData(users=[user_name], actualData=data)
+            self.__write(KIND_OBJECT, n_type, oid, to_store.json().encode(), data.name)
+        log.debug("Added new object with oid %s by user '%s'.", oid, user_name)
+        return (oid, data)
+
+    def apply_batch(self, n_type: LocationDataType, operations: List[BatchOperation],
+                    usr: str) -> List[Tuple[str, Optional[LocationData]]]:
+        with self.__lock:
+            check_batch(operations, lambda oid: oid in self.__objects[n_type])
+            records = []
+            results = []
+            for op in operations:
+                if op.action == BatchAction.CREATE:
+                    oid = str(uuid.uuid4())
+                    while oid in self.__objects[n_type]:
+                        oid = str(uuid.uuid4())
+                    to_store = StoredData(users=[usr], actualData=op.data)
+                    records.append((KIND_OBJECT, n_type, oid, to_store.json().encode(), op.data.name))
+                    results.append((oid, op.data))
+                elif op.action == BatchAction.UPDATE:
+                    obj = self.__load_object(n_type, op.oid)
+                    obj.actualData = op.data
+                    records.append((KIND_OBJECT, n_type, op.oid, obj.json().encode(), op.data.name))
+                    results.append((op.oid, op.data))
+                else:
+                    records.append((KIND_DELETE, n_type, op.oid, b'', None))
+                    results.append((op.oid, None))
+            if records:
+                self.__write_all(records)
+        log.debug("Applied batch of %d operations on %s by user '%s'.", len(operations), n_type.value, usr)
+        return results
+
+    def delete_many(self, n_type: LocationDataType, oids: List[str], usr: str) -> List[str]:
+        with self.__lock:
+            existing = [oid for oid in dict.fromkeys(oids) if oid in self.__objects[n_type]]
+            if existing:
+                self.__write_all([(KIND_DELETE, n_type, oid, b'', None) for oid in existing])
+        log.debug("Deleted %d objects of type %s by user '%s'.", len(existing), n_type.value, usr)
+        return existing
+
+    def export_object(self, n_type: LocationDataType, oid: str) -> Tuple[LocationData, List[str], Dict[str, str]]:
+        obj = self.__load_object(n_type, oid)
+        return obj.actualData, obj.users, self.__load_secrets(n_type, oid)
+
+    def import_objects(self, n_type: LocationDataType, objects: Iterable[Tuple[str, LocationData, List[str], Dict[str, str]]]) -> int:
+        with self.__lock:
+            records = []
+            for oid, data, users, secrets in objects:
+                to_store = StoredData(users=users, actualData=data)
+                records.append((KIND_OBJECT, n_type, oid, to_store.json().encode(), data.name))
+                if secrets or oid in self.__secrets[n_type]:
+                    records.append((KIND_SECRETS, n_type, oid, json.dumps(secrets).encode(), None))
+            if records:
+                self.__write_all(records)
+        count = sum(1 for record in records if record[0] == KIND_OBJECT)
+        log.debug("Imported %d objects of type %s.", count, n_type.value)
+        return count
+
+    def get_details(self, n_type: LocationDataType, oid: str):
+        obj = self.__load_object(n_type, oid)
+        log.debug("Returned object %s.", oid)
+        return obj.actualData
+
+    def get_many(self, n_type: LocationDataType, oids: List[str]) -> Dict[str, LocationData]:
+        with self.__lock:
+            locations = [(location, oid) for oid, location in ((oid, self.__objects[n_type].get(oid)) for oid in oids)
+                         if location is not None]
+        # read in file order, so the pages of the segments are accessed sequentially
+        locations.sort()
+        found = {}
+        for location, oid in locations:
+            try:
+                found[oid] = decode_stored(self.__read_current(self.__objects[n_type], oid, location)).actualData
+            except FileNotFoundError:
+                # deleted since it was located
+                continue
+        return found
+
+    def update_details(self, n_type: LocationDataType, oid: str, data: LocationData, usr: str):
+        with self.__lock:
+            obj = self.__load_object(n_type, oid)
+            obj.actualData = data
+            self.__write(KIND_OBJECT, n_type, oid, obj.json().encode(), data.name)
+        log.debug("Updated  object with oid %s by user '%s'.", oid, usr)
+        return (oid, data)
+
+    def delete(self, n_type: LocationDataType, oid: str, usr: str):
+        with self.__lock:
+            self.__locate(n_type, oid)
+            self.__write(KIND_DELETE, n_type, oid, b'')
+        log.debug("Deleted object %s/%s by user '%s'.", n_type, oid, usr)
+
+    def list_secrets(self, n_type: LocationDataType, oid:str, usr: str):
+        """ list all available secrets for this object"""
+        return list(self.__load_secrets(n_type, oid).keys())
+
+    def get_secret_values(self, n_type: LocationDataType, oid:str, usr: str):
+        """ get all available secrets (key + value) for this object"""
+        return self.__load_secrets(n_type, oid)
+
+    def add_update_secret(self, n_type: LocationDataType, oid:str, key: str, value: str, usr: str):
+        """ add new secrets to an existing object"""
+        with self.__lock:
+            secrets = self.__load_secrets(n_type, oid)
+            secrets[key] = value
+            log.debug('User %s is updating secretes for %s', usr, oid)
+            self.__write(KIND_SECRETS, n_type, str(oid), json.dumps(secrets).encode())
+
+    def get_secret(self, n_type: LocationDataType, oid:str, key: str, usr: str):
+        """ return the value of the requested secret for the given object"""
+        secrets = self.__load_secrets(n_type, oid)
+        log.debug('User %s is retrieving secrets for %s', usr, oid)
+        try:
+            return secrets[key]
+        except KeyError:
+            raise HTTPException(404, f"Secret with key {key} does not exist for the object {n_type.value}/{oid}")
+
+    def delete_secret(self, n_type: LocationDataType, oid:str, key: str, usr: str):
+        """ delete and return the value of the requested secret for the given object"""
+        with self.__lock:
+            secrets = self.__load_secrets(n_type, oid)
+            val = secrets.pop(key, None)
+            if not val:
+                raise HTTPException(404, f"Secret with key {key} does not exist for the object {n_type.value}/{oid}")
+            log.debug('User %s delete secret for %s', usr, oid)
+            self.__write(KIND_SECRETS, n_type, str(oid), json.dumps(secrets).encode())
+        return val
+
+
+class EncryptedSegmentStorageAdapter(SecretsEncryptionMixin, SegmentStorageAdapter):
+    pass
@@ -0,0 +1,352 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from pydantic import UUID4, BaseModel, root_validator
+
+from .ChangeLog import ChangeLog
+from .LocationStorage import (AbstractLocationDataStorageAdapter, BatchOperation, ImportLineError,
+                              LocationData, LocationDataType, QueryFilters, QueryPage, SearchField)
+
+SNAPSHOT_FORMAT_VERSION: int = 1
+
+log = logging.getLogger(__name__)
+
+
+class SnapshotHeader(BaseModel):
+    """ first line of a snapshot; seq is the `since` of the next incremental snapshot"""
+    format: int
+    seq: int
+    since: Optional[int] = None
+    created: float
+
+
+class SnapshotRecord(BaseModel):
+    """ one object of a snapshot with its users and stored secrets, or the id of a deleted object"""
+    type: LocationDataType
+    oid: UUID4
+    data: Optional[LocationData] = None
+    users: List[str] = []
+    secrets: Dict[str, str] = {}
+    deleted: bool = False
+
+    @root_validator(skip_on_failure=True)
+    def data_unless_deleted(cls, values):
+        if values.get('data') is None and not values.get('deleted'):
+            raise ValueError("A record needs data unless the object is deleted")
+        return values
+
+
+class RestoreResult(BaseModel):
+    """
+    the numbers of restored, deleted and failed objects of a restore, with the first errors;
+    complete if the snapshot ended with its trailer and all of its records were read
+    """
+    restored: int = 0
+    deleted: int = 0
+    failed: int = 0
+    errors: List[ImportLineError] = []
+    complete: bool = False
+    seq: Optional[int] = None
+
+
+class WriteGate:
+    """ lets any number of writes pass at the same time, or holds them back for a short exclusive section"""
+
+    def __init__(self):
+        self.__condition = threading.Condition()
+        self.__writers = 0
+        self.__exclusive = False
+
+    @contextmanager
+    def shared(self):
+        with self.__condition:
+            while self.__exclusive:
+                self.__condition.wait()
+            self.__writers += 1
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.__writers -= 1
+                if not self.__writers:
+                    self.__condition.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self.__condition:
+            while self.__exclusive:
+                self.__condition.wait()
+            # new writes wait from here on, the running ones are finished first
+            self.__exclusive = True
+            while self.__writers:
+                self.__condition.wait()
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.__exclusive = False
+                self.__condition.notify_all()
+
+
+class Snapshot:
+    """ The state of a set of objects at the moment the snapshot was begun
+
+    The objects are read while the snapshot is written out. Before a write changes
+    an object that has not been written out yet, the `SnapshotStorageAdapter` hands it
+    to `preserve`, which keeps its current state. The preserved objects are written to
+    an anonymous temporary file, only their positions in it are held in memory.
+    """
+
+    def __init__(self, adapter: AbstractLocationDataStorageAdapter, seq: int, since: Optional[int],
+                 members: Dict[LocationDataType, List[str]], deletions: Dict[LocationDataType, List[str]],
+                 release: Callable[['Snapshot'], None]):
+        self.adapter = adapter
+        self.seq = seq
+        self.since = since
+        self.created = time.time()
+        self.objects = 0
+        self.deleted = 0
+        self.__members = members
+        self.__deletions = deletions
+        self.__remaining: Dict[LocationDataType, Set[str]] = {n_type: set(oids) for n_type, oids in members.items()}
+        # (offset, length) of the preserved objects in the spill file
+        self.__preserved: Dict[Tuple[LocationDataType, str], Tuple[int, int]] = {}
+        self.__spill = None
+        self.__closed = False
+        self.__release = release
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def __encode(exported: Tuple[LocationData, List[str], Dict[str, str]]) -> dict:
+        data, users, secrets = exported
+        return {'data': data.dict(), 'users': users, 'secrets': secrets}
+
+    def __write_spill(self, record: dict) -> Tuple[int, int]:
+        # has to be called with the lock held
+        if self.__spill is None:
+            self.__spill = tempfile.TemporaryFile(prefix=f"snapshot-{self.seq}-")
+        line = json.dumps(record).encode()
+        offset = self.__spill.seek(0, os.SEEK_END)
+        self.__spill.write(line)
+        return offset, len(line)
+
+    def __read_spill(self, position: Tuple[int, int]) -> dict:
+        # has to be called with the lock held
+        offset, length = position
+        self.__spill.seek(offset)
+        return json.loads(self.__spill.read(length))
+
+    def preserve(self, n_type: LocationDataType, oids: List[str]):
+        """ keep the current state of the objects that are part of the snapshot and not written out yet"""
+        remaining = self.__remaining.get(n_type)
+        if not remaining:
+            return
+        with self.__lock:
+            if self.__closed:
+                return
+            for oid in oids:
+                if oid in remaining and (n_type, oid) not in self.__preserved:
+                    exported = self.__encode(self.adapter.export_object(n_type, oid))
+                    self.__preserved[(n_type, oid)] = self.__write_spill(exported)
+
+    def records(self) -> Iterator[dict]:
+        """ yield the header, the objects, the deleted ids and the trailer of the snapshot as json dicts"""
+        yield SnapshotHeader(format=SNAPSHOT_FORMAT_VERSION, seq=self.seq, since=self.since, created=self.created).dict()
+        for n_type, oids in self.__members.items():
+            remaining = self.__remaining[n_type]
+            for oid in oids:
+                # the lock keeps writes to this object back until it is read
+                with self.__lock:
+                    remaining.discard(oid)
+                    position = self.__preserved.pop((n_type, oid), None)
+                    if position is not None:
+                        exported = self.__read_spill(position)
+                    else:
+                        try:
+                            exported = self.__encode(self.adapter.export_object(n_type, oid))
+                        except FileNotFoundError:
+                            log.warning("Object %s/%s of snapshot %d is missing.", n_type.value, oid, self.seq)
+                            continue
+                self.objects += 1
+                yield {'type': n_type.value, 'oid': oid, **exported}
+        for n_type, oids in self.__deletions.items():
+            for oid in oids:
+                self.deleted += 1
+                yield {'type': n_type.value, 'oid': oid, 'deleted': True}
+        yield {'end': True, 'objects': self.objects, 'deleted': self.deleted}
+
+    def close(self):
+        """
+        stop preserving objects for the snapshot and drop the preserved ones, has to be called
+        once it is written or abandoned; further calls do nothing
+        """
+        self.__release(self)
+        with self.__lock:
+            self.__closed = True
+            self.__preserved = {}
+            if self.__spill is not None:
+                self.__spill.close()
+                self.__spill = None
+
+
+class SnapshotStorageAdapter(AbstractLocationDataStorageAdapter):
+    """ Takes consistent snapshots of all objects while writes continue, in front of any other storage adapter
+
+    A snapshot is begun in a short exclusive section, which waits for the running writes
+    and lists the ids of all objects together with the sequence number of the change log.
+    Afterwards writes continue; every write first lets the open snapshots preserve the
+    objects it changes (see `Snapshot`). Incremental snapshots hold the objects changed
+    since a sequence number of the change log and the ids of the deleted ones.
+    """
+
+    def __init__(self, adapter: AbstractLocationDataStorageAdapter, changelog: ChangeLog):
+        AbstractLocationDataStorageAdapter.__init__(self)
+        log.info("Initializing SnapshotStorageAdapter.")
+        self.adapter = adapter
+        self.changelog = changelog
+        self.gate = WriteGate()
+        self.__snapshots: List[Snapshot] = []
+        self.__lock = threading.Lock()
+
+    def begin_snapshot(self, since: Optional[int] = None) -> Snapshot:
+        """
+        begin a snapshot of all objects, or with since of the objects changed after that sequence
+        number of the change log (raises `ChangesExpired` if they are no longer known)
+        """
+        with self.gate.exclusive():
+            seq = self.changelog.seq
+            members: Dict[LocationDataType, List[str]] = {}
+            deletions: Dict[LocationDataType, List[str]] = {}
+            for n_type in LocationDataType:
+                ids = self.adapter.list_ids(n_type)
+                if since is None:
+                    members[n_type] = ids
+                    deletions[n_type] = []
+                    continue
+                changed = dict.fromkeys(change.oid for change in self.changelog.changes(n_type, since).changes)
+                existing = set(ids)
+                members[n_type] = [oid for oid in changed if oid in existing]
+                deletions[n_type] = [oid for oid in changed if oid not in existing]
+            snapshot = Snapshot(self.adapter, seq, since, members, deletions, self.__release)
+            with self.__lock:
+                self.__snapshots.append(snapshot)
+        log.debug("Began snapshot at sequence number %d of %d objects.", seq, sum(len(oids) for oids in members.values()))
+        return snapshot
+
+    def __release(self, snapshot: Snapshot):
+        with self.__lock:
+            if snapshot in self.__snapshots:
+                self.__snapshots.remove(snapshot)
+
+    def __write(self, n_type: LocationDataType, oids: List[str], func: Callable, *args):
+        with self.gate.shared():
+            with self.__lock:
+                snapshots = list(self.__snapshots)
+            for snapshot in snapshots:
+                snapshot.preserve(n_type, oids)
+            return func(*args)
+
+    def get_list(self, n_type: LocationDataType) -> List:
+        return self.adapter.get_list(n_type)
+
+    def list_ids(self, n_type: LocationDataType) -> List[str]:
+        return self.adapter.list_ids(n_type)
+
+    def query(self, n_type: LocationDataType, filters: QueryFilters = None, sort: bool = True,
+              page: QueryPage = None) -> List[Tuple[str, str]]:
+        return self.adapter.query(n_type, filters, sort=sort, page=page)
+
+    def list_sorted(self, n_type: LocationDataType, after: Optional[Tuple[str, str]] = None,
+                    limit: Optional[int] = None) -> List[Tuple[str, str]]:
+        return self.adapter.list_sorted(n_type, after, limit)
+
+    def filter_natively(self, n_type: LocationDataType,
+                        filters: QueryFilters) -> Tuple[Optional[Set[str]], QueryFilters]:
+        return self.adapter.filter_natively(n_type, filters)
+
+    def match_substring(self, n_type: LocationDataType, term: str, field: SearchField) -> Set[str]:
+        return self.adapter.match_substring(n_type, term, field)
+
+    def match_keys(self, n_type: LocationDataType, keys: List[str]) -> Set[str]:
+        return self.adapter.match_keys(n_type, keys)
+
+    def get_key_counts(self, n_type: LocationDataType) -> Dict[str, int]:
+        return self.adapter.get_key_counts(n_type)
+
+    def get_facets(self, n_type: LocationDataType, keys: List[str],
+                   filters: QueryFilters = None) -> Dict[str, Dict[str, int]]:
+        return self.adapter.get_facets(n_type, keys, filters)
+
+    def count(self, n_type: LocationDataType, filters: QueryFilters = None) -> int:
+        return self.adapter.count(n_type, filters)
+
+    def get_version(self, n_type: LocationDataType, oid: str):
+        return self.adapter.get_version(n_type, oid)
+
+    def get_generation(self, n_type: LocationDataType):
+        return self.adapter.get_generation(n_type)
+
+    def add_new(self, n_type: LocationDataType, data: LocationData, user_name: str):
+        # new objects are not part of any open snapshot
+        with self.gate.shared():
+            return self.adapter.add_new(n_type, data, user_name)
+
+    def apply_batch(self, n_type: LocationDataType, operations: List[BatchOperation],
+                    usr: str) -> List[Tuple[str, Optional[LocationData]]]:
+        oids = [str(op.oid) for op in operations if op.oid is not None]
+        return self.__write(n_type, oids, self.adapter.apply_batch, n_type, operations, usr)
+
+    def delete_many(self, n_type: LocationDataType, oids: List[str], usr: str) -> List[str]:
+        return self.__write(n_type, [str(oid) for oid in oids], self.adapter.delete_many, n_type, oids, usr)
+
+    def get_details(self, n_type: LocationDataType, oid: str):
+        return self.adapter.get_details(n_type, oid)
+
+    def get_many(self, n_type: LocationDataType, oids: List[str]) -> Dict[str, LocationData]:
+        return self.adapter.get_many(n_type, oids)
+
+    def export_object(self, n_type: LocationDataType, oid: str) -> Tuple[LocationData, List[str], Dict[str, str]]:
+        return self.adapter.export_object(n_type, oid)
+
+    def import_objects(self, n_type: LocationDataType, objects: Iterable[Tuple[str, LocationData, List[str], Dict[str, str]]]) -> int:
+        objects = list(objects)
+        return self.__write(n_type, [oid for oid, _, _, _ in objects], self.adapter.import_objects, n_type, objects)
+
+    def update_details(self, n_type: LocationDataType, oid: str, data: LocationData, usr: str):
+        return self.__write(n_type, [str(oid)], self.adapter.update_details, n_type, oid, data, usr)
+
+    def delete(self, n_type: LocationDataType, oid: str, usr: str):
+        return self.__write(n_type, [str(oid)], self.adapter.delete, n_type, oid, usr)
+
+    def list_secrets(self, n_type: LocationDataType, oid: str, usr: str):
+        return self.adapter.list_secrets(n_type, oid, usr)
+
+    def get_secret_values(self, n_type: LocationDataType, oid: str, usr: str):
+        return self.adapter.get_secret_values(n_type, oid, usr)
+
+    def add_update_secret(self, n_type: LocationDataType, oid: str, key: str, value: str, usr: str):
+        return self.__write(n_type, [str(oid)], self.adapter.add_update_secret, n_type, oid, key, value, usr)
+
+    def get_secret(self, n_type: LocationDataType, oid: str, key: str, usr: str):
+        return self.adapter.get_secret(n_type, oid, key, usr)
+
+    def delete_secret(self, n_type: LocationDataType, oid: str, key: str, usr: str):
+        return self.__write(n_type, [str(oid)], self.adapter.delete_secret, n_type, oid, key, usr)
+
+    def get_owner(self, n_type: LocationDataType, oid: str):
+        return self.adapter.get_owner(n_type, oid)
+
+    def check_perm(self, n_type: LocationDataType, oid: str, usr: str):
+        return self.adapter.check_perm(n_type, oid, usr)
+
+    def add_perm(self, n_type: LocationDataType, oid: str, usr: str):
+        return self.__write(n_type, [str(oid)], self.adapter.add_perm, n_type, oid, usr)
+
+    def rm_perm(self, n_type: LocationDataType, oid: str, usr: str):
+        return self.__write(n_type, [str(oid)], self.adapter.rm_perm, n_type, oid, usr)
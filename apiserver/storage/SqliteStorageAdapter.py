@@ -0,0 +1,440 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi.exceptions import HTTPException
+
+from apiserver.config import ApiserverSettings
+
+from .EncryptedJsonFileStorageAdapter import SecretsEncryptionMixin
+from .LocationStorage import (AbstractLocationDataStorageAdapter, BatchAction,
+                              BatchOperation, LocationData, LocationDataType,
+                              QueryFilters, SearchField, check_batch,
+                              contains_term)
+
+DEFAULT_SQLITE_FILENAME: str = "datacatalog.sqlite"
+# sqlite limits the number of parameters per statement
+BATCH_SIZE: int = 500
+
+log = logging.getLogger(__name__)
+
+
+def fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def metadata_text(metadata: Optional[Dict[str, str]]) -> str:
+    return "\n".join(part.casefold() for item in (metadata or {}).items() for part in item)
+
+
+class SqliteStorageAdapter(AbstractLocationDataStorageAdapter):
+    """ This stores LocationData in a single sqlite database
+
+    Every LocationDataType gets its own table, together with a table of the
+    metadata keys of every object (indexed by key), a table for the secrets and an
+    fts5 table with the trigrams of the lowercased name and url and the casefolded
+    metadata. Substring filters look up their candidates in the fts5 table and
+    verify them with `contains_term`, so they behave exactly like the other adapters.
+    If the sqlite library has no fts5 trigram support, the candidates are all objects.
+
+    The database is opened in WAL mode, every thread uses its own connection. Every
+    write is one transaction that takes the write lock when it begins (BEGIN IMMEDIATE),
+    so what it reads before writing, e.g. whether the object exists or its old metadata
+    for the facet counts, can not be changed by a concurrent write.
+
+    IMPORTANT: The adapter does not check for authentication or authorization,
+    it should only be invoked if the permissions have been checked
+    """
+
+    def __init__(self, settings: ApiserverSettings):
+        AbstractLocationDataStorageAdapter.__init__(self)
+        self.db_path = getattr(settings, 'sqlite_path', None) or os.path.join(settings.json_storage_path, DEFAULT_SQLITE_FILENAME)
+        log.info("Initializing SqliteStorageAdapter with database %s.", self.db_path)
+        if not os.path.isdir(os.path.dirname(os.path.abspath(self.db_path))):
+            raise Exception(f"Directory for database {self.db_path} does not exist.")
+        self.__local = threading.local()
+        self.fts = True
+        self.__create_tables()
+
+    def __connection(self) -> sqlite3.Connection:
+        conn = getattr(self.__local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.__local.conn = conn
+        return conn
+
+    @contextmanager
+    def __write_transaction(self):
+        conn = self.__connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+
+    def __create_tables(self):
+        # several server processes may start at the same time, the tables are counted only once
+        with self.__write_transaction() as conn:
+            for n_type in LocationDataType:
+                table = n_type.value
+                conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" (oid TEXT PRIMARY KEY, name TEXT NOT NULL, '
+                             'url TEXT NOT NULL, metadata TEXT, users TEXT NOT NULL, version INTEGER NOT NULL DEFAULT 1)')
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_name" ON "{table}" (name, oid)')
+                conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}_keys" (key TEXT NOT NULL, oid TEXT NOT NULL, '
+                             'PRIMARY KEY (key, oid)) WITHOUT ROWID')
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_keys_oid" ON "{table}_keys" (oid)')
+                conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}_secrets" (oid TEXT NOT NULL, key TEXT NOT NULL, '
+                             'value TEXT NOT NULL, PRIMARY KEY (oid, key)) WITHOUT ROWID')
+                has_facets = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                          (f'{table}_facets',)).fetchone() is not None
+                conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}_facets" (key TEXT NOT NULL, value TEXT NOT NULL, '
+                             'count INTEGER NOT NULL, PRIMARY KEY (key, value)) WITHOUT ROWID')
+                if not has_facets:
+                    # counted once for databases from before the facets were kept
+                    for (metadata,) in conn.execute(f'SELECT metadata FROM "{table}" WHERE metadata IS NOT NULL').fetchall():
+                        self.__count_values(conn, n_type, metadata, 1)
+            conn.execute('CREATE TABLE IF NOT EXISTS "_generations" (type TEXT PRIMARY KEY, generation INTEGER NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS "_counts" (type TEXT PRIMARY KEY, count INTEGER NOT NULL)')
+            for n_type in LocationDataType:
+                # counted once for databases from before the counts were kept
+                conn.execute(f'INSERT OR IGNORE INTO "_counts" (type, count) SELECT ?, COUNT(*) FROM "{n_type.value}"',
+                             (n_type.value,))
+        try:
+            with conn:
+                for n_type in LocationDataType:
+                    conn.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS "{n_type.value}_fts" USING fts5'
+                                 '(oid UNINDEXED, name, url, meta, tokenize="trigram case_sensitive 1")')
+        except sqlite3.OperationalError as ex:
+            log.warning("No fts5 trigram support in sqlite %s (%s), substring filters will scan.", sqlite3.sqlite_version, ex)
+            self.fts = False
+
+    def __exists(self, conn: sqlite3.Connection, n_type: LocationDataType, oid: str) -> bool:
+        return conn.execute(f'SELECT 1 FROM "{n_type.value}" WHERE oid = ?', (oid,)).fetchone() is not None
+
+    def __check_exists(self, conn: sqlite3.Connection, n_type: LocationDataType, oid: str):
+        if not self.__exists(conn, n_type, oid):
+            log.error("Requested object (%s) %s does not exist.", oid, n_type.value)
+            raise FileNotFoundError(f"The requested object ({oid}) does not exist.")
+
+    def __bump_generation(self, conn: sqlite3.Connection, n_type: LocationDataType):
+        conn.execute('INSERT INTO "_generations" (type, generation) VALUES (?, 1) '
+                     'ON CONFLICT (type) DO UPDATE SET generation = generation + 1', (n_type.value,))
+
+    def __add_to_count(self, conn: sqlite3.Connection, n_type: LocationDataType, added: int):
+        conn.execute('UPDATE "_counts" SET count = count + ? WHERE type = ?', (added, n_type.value))
+
+    def __count_values(self, conn: sqlite3.Connection, n_type: LocationDataType, metadata: Optional[str], added: int):
+        # metadata as stored, i.e. json or None
+        if metadata is None:
+            return
+        table = n_type.value
+        items = list(json.loads(metadata).items())
+        conn.executemany(f'INSERT INTO "{table}_facets" (key, value, count) VALUES (?, ?, ?) '
+                         'ON CONFLICT (key, value) DO UPDATE SET count = count + excluded.count',
+                         ((key, value, added) for key, value in items))
+        if added < 0:
+            conn.executemany(f'DELETE FROM "{table}_facets" WHERE key = ? AND value = ? AND count <= 0', items)
+
+    def __write_object(self, conn: sqlite3.Connection, n_type: LocationDataType, oid: str,
+                       data: LocationData, users: List[str]):
+        # like __delete_object, only called in a write transaction, so the old metadata read here
+        # is still the stored one when the counts and facets derived from it are changed
+        table = n_type.value
+        metadata = json.dumps(data.metadata) if data.metadata is not None else None
+        old = conn.execute(f'SELECT metadata FROM "{table}" WHERE oid = ?', (oid,)).fetchone()
+        if old is None:
+            conn.execute(f'INSERT INTO "{table}" (oid, name, url, metadata, users) VALUES (?, ?, ?, ?, ?)',
+                         (oid, data.name, data.url, metadata, json.dumps(users)))
+            self.__add_to_count(conn, n_type, 1)
+        else:
+            conn.execute(f'UPDATE "{table}" SET name = ?, url = ?, metadata = ?, version = version + 1 '
+                         'WHERE oid = ?', (data.name, data.url, metadata, oid))
+            self.__count_values(conn, n_type, old[0], -1)
+        self.__count_values(conn, n_type, metadata, 1)
+        conn.execute(f'DELETE FROM "{table}_keys" WHERE oid = ?', (oid,))
+        conn.executemany(f'INSERT INTO "{table}_keys" (key, oid) VALUES (?, ?)',
+                         ((key, oid) for key in (data.metadata or {})))
+        if self.fts:
+            conn.execute(f'DELETE FROM "{table}_fts" WHERE oid = ?', (oid,))
+            conn.execute(f'INSERT INTO "{table}_fts" (oid, name, url, meta) VALUES (?, ?, ?, ?)',
+                         (oid, data.name.lower(), data.url.lower(), metadata_text(data.metadata)))
+        self.__bump_generation(conn, n_type)
+
+    def __delete_object(self, conn: sqlite3.Connection, n_type: LocationDataType, oid: str):
+        table = n_type.value
+        old = conn.execute(f'SELECT metadata FROM "{table}" WHERE oid = ?', (oid,)).fetchone()
+        if old is not None:
+            conn.execute(f'DELETE FROM "{table}" WHERE oid = ?', (oid,))
+            self.__add_to_count(conn, n_type, -1)
+            self.__count_values(conn, n_type, old[0], -1)
+        for suffix in ("_keys", "_secrets"):
+            conn.execute(f'DELETE FROM "{table}{suffix}" WHERE oid = ?', (oid,))
+        if self.fts:
+            conn.execute(f'DELETE FROM "{table}_fts" WHERE oid = ?', (oid,))
+        self.__bump_generation(conn, n_type)
+
+    def __load_rows(self, n_type: LocationDataType, oids: Optional[Iterable[str]]):
+        conn = self.__connection()
+        statement = f'SELECT oid, name, url, metadata FROM "{n_type.value}"'
+        if oids is None:
+            rows = conn.execute(statement).fetchall()
+        else:
+            oids = list(oids)
+            rows = []
+            for i in range(0, len(oids), BATCH_SIZE):
+                chunk = oids[i:i + BATCH_SIZE]
+                rows.extend(conn.execute(statement + f' WHERE oid IN ({",".join("?" * len(chunk))})', chunk))
+        for oid, name, url, metadata in rows:
+            yield oid, LocationData(name=name, url=url, metadata=json.loads(metadata) if metadata is not None else None)
+
+    def __fts_candidates(self, n_type: LocationDataType, term: str, field: SearchField) -> Optional[Set[str]]:
+        if not self.fts or len(term) < 3:
+            return None
+        conn = self.__connection()
+        table = n_type.value
+        queries = []
+        if field in (SearchField.NAME, SearchField.ANY):
+            queries.append('name : ' + fts_phrase(term.lower()))
+        if field in (SearchField.URL, SearchField.ANY):
+            queries.append('url : ' + fts_phrase(term.lower()))
+        if field == SearchField.ANY:
+            queries.append('meta : ' + fts_phrase(term.casefold()))
+        return {row[0] for row in conn.execute(f'SELECT oid FROM "{table}_fts" WHERE "{table}_fts" MATCH ?',
+                                               (" OR ".join(queries),))}
+
+    def get_list(self, n_type: LocationDataType) -> List:
+        conn = self.__connection()
+        return conn.execute(f'SELECT name, oid FROM "{n_type.value}" ORDER BY name, oid').fetchall()
+
+    def list_ids(self, n_type: LocationDataType) -> List[str]:
+        conn = self.__connection()
+        return [row[0] for row in conn.execute(f'SELECT oid FROM "{n_type.value}"')]
+
+    def list_sorted(self, n_type: LocationDataType, after: Optional[Tuple[str, str]] = None,
+                    limit: Optional[int] = None) -> List[Tuple[str, str]]:
+        conn = self.__connection()
+        statement = f'SELECT name, oid FROM "{n_type.value}"'
+        params = []
+        if after is not None:
+            statement += ' WHERE (name, oid) > (?, ?)'
+            params.extend(after)
+        statement += ' ORDER BY name, oid'
+        if limit is not None:
+            statement += ' LIMIT ?'
+            params.append(limit)
+        return conn.execute(statement, params).fetchall()
+
+    def filter_natively(self, n_type: LocationDataType,
+                        filters: QueryFilters) -> Tuple[Optional[Set[str]], QueryFilters]:
+        if not (filters.name or filters.url or filters.has_key or filters.search):
+            return None, filters
+        candidates = self.match_keys(n_type, filters.has_key) if filters.has_key else None
+        checks = []
+        for term, field in ((filters.name, SearchField.NAME), (filters.url, SearchField.URL),
+                            (filters.search, SearchField.ANY)):
+            if not term:
+                continue
+            checks.append((term, field))
+            found = self.__fts_candidates(n_type, term, field)
+            if found is not None:
+                candidates = found if candidates is None else candidates & found
+        if checks and (candidates is None or candidates):
+            candidates = {oid for oid, data in self.__load_rows(n_type, candidates)
+                          if all(contains_term(data, term, field) for term, field in checks)}
+        return candidates, QueryFilters()
+
+    def match_substring(self, n_type: LocationDataType, term: str, field: SearchField) -> Set[str]:
+        candidates = self.__fts_candidates(n_type, term, field)
+        return {oid for oid, data in self.__load_rows(n_type, candidates) if contains_term(data, term, field)}
+
+    def match_keys(self, n_type: LocationDataType, keys: List[str]) -> Set[str]:
+        keys = list(set(keys))
+        if not keys:
+            return set(self.list_ids(n_type))
+        conn = self.__connection()
+        return {row[0] for row in conn.execute(
+            f'SELECT oid FROM "{n_type.value}_keys" WHERE key IN ({",".join("?" * len(keys))}) '
+            'GROUP BY oid HAVING COUNT(*) = ?', (*keys, len(keys)))}
+
+    def get_key_counts(self, n_type: LocationDataType) -> Dict[str, int]:
+        conn = self.__connection()
+        return dict(conn.execute(f'SELECT key, COUNT(*) FROM "{n_type.value}_keys" GROUP BY key').fetchall())
+
+    def get_facets(self, n_type: LocationDataType, keys: List[str],
+                   filters: QueryFilters = None) -> Dict[str, Dict[str, int]]:
+        facets: Dict[str, Dict[str, int]] = {key: {} for key in keys}
+        if not keys:
+            return facets
+        if filters is not None and (filters.name or filters.url or filters.has_key or filters.search):
+            oids = [oid for _, oid in self.query(n_type, filters, sort=False)]
+            for _, data in self.__load_rows(n_type, oids):
+                for key, counts in facets.items():
+                    value = (data.metadata or {}).get(key)
+                    if value is not None:
+                        counts[value] = counts.get(value, 0) + 1
+            return facets
+        conn = self.__connection()
+        unique = list(set(keys))
+        for key, value, count in conn.execute(f'SELECT key, value, count FROM "{n_type.value}_facets" '
+                                              f'WHERE key IN ({",".join("?" * len(unique))})', unique):
+            facets[key][value] = count
+        return facets
+
+    def get_version(self, n_type: LocationDataType, oid: str):
+        conn = self.__connection()
+        row = conn.execute(f'SELECT version FROM "{n_type.value}" WHERE oid = ?', (oid,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"The requested object ({oid}) does not exist.")
+        return row[0]
+
+    def count(self, n_type: LocationDataType, filters: QueryFilters = None) -> int:
+        if filters is None or not (filters.name or filters.url or filters.has_key or filters.search):
+            row = self.__connection().execute('SELECT count FROM "_counts" WHERE type = ?', (n_type.value,)).fetchone()
+            return row[0]
+        return super().count(n_type, filters)
+
+    def get_generation(self, n_type: LocationDataType):
+        row = self.__connection().execute('SELECT generation FROM "_generations" WHERE type = ?', (n_type.value,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def add_new(self, n_type: LocationDataType, data: LocationData, user_name: str):
+        with self.__write_transaction() as conn:
+            oid = str(uuid.uuid4())
+            while self.__exists(conn, n_type, oid):
+                oid = str(uuid.uuid4())
+            self.__write_object(conn, n_type, oid, data, [user_name])
+        log.debug("Added new object with oid %s by user '%s'.", oid, user_name)
+        return (oid, data)
+
+    def apply_batch(self, n_type: LocationDataType, operations: List[BatchOperation],
+                    usr: str) -> List[Tuple[str, Optional[LocationData]]]:
+        results = []
+        # the write lock is taken before validating, so the batch sees no concurrent changes
+        with self.__write_transaction() as conn:
+            check_batch(operations, lambda oid: self.__exists(conn, n_type, oid))
+            for op in operations:
+                if op.action == BatchAction.CREATE:
+                    oid = str(uuid.uuid4())
+                    while self.__exists(conn, n_type, oid):
+                        oid = str(uuid.uuid4())
+                    self.__write_object(conn, n_type, oid, op.data, [usr])
+                    results.append((oid, op.data))
+                elif op.action == BatchAction.UPDATE:
+                    self.__write_object(conn, n_type, op.oid, op.data, [])
+                    results.append((op.oid, op.data))
+                else:
+                    self.__delete_object(conn, n_type, op.oid)
+                    results.append((op.oid, None))
+        log.debug("Applied batch of %d operations on %s by user '%s'.", len(operations), n_type.value, usr)
+        return results
+
+    def delete_many(self, n_type: LocationDataType, oids: List[str], usr: str) -> List[str]:
+        with self.__write_transaction() as conn:
+            existing = [oid for oid in dict.fromkeys(oids) if self.__exists(conn, n_type, oid)]
+            for oid in existing:
+                self.__delete_object(conn, n_type, oid)
+        log.debug("Deleted %d objects of type %s by user '%s'.", len(existing), n_type.value, usr)
+        return existing
+
+    def get_details(self, n_type: LocationDataType, oid: str):
+        for _, data in self.__load_rows(n_type, [oid]):
+            log.debug("Returned object %s.", oid)
+            return data
+        log.error("Requested object (%s) %s does not exist.", oid, n_type.value)
+        raise FileNotFoundError(f"The requested object ({oid}) does not exist.")
+
+    def get_many(self, n_type: LocationDataType, oids: List[str]) -> Dict[str, LocationData]:
+        return dict(self.__load_rows(n_type, oids))
+
+    def update_details(self, n_type: LocationDataType, oid: str, data: LocationData, usr: str):
+        with self.__write_transaction() as conn:
+            self.__check_exists(conn, n_type, oid)
+            self.__write_object(conn, n_type, oid, data, [])
+        log.debug("Updated  object with oid %s by user '%s'.", oid, usr)
+        return (oid, data)
+
+    def delete(self, n_type: LocationDataType, oid: str, usr: str):
+        with self.__write_transaction() as conn:
+            self.__check_exists(conn, n_type, oid)
+            self.__delete_object(conn, n_type, oid)
+        log.debug("Deleted object %s/%s by user '%s'.", n_type, oid, usr)
+
+    def export_object(self, n_type: LocationDataType, oid: str) -> Tuple[LocationData, List[str], Dict[str, str]]:
+        conn = self.__connection()
+        with conn:
+            # one read transaction, so the object and its secrets are of the same moment
+            conn.execute("BEGIN")
+            row = conn.execute(f'SELECT name, url, metadata, users FROM "{n_type.value}" WHERE oid = ?', (oid,)).fetchone()
+            if row is None:
+                raise FileNotFoundError(f"The requested object ({oid}) does not exist.")
+            name, url, metadata, users = row
+            secrets = dict(conn.execute(f'SELECT key, value FROM "{n_type.value}_secrets" WHERE oid = ?', (oid,)).fetchall())
+        data = LocationData(name=name, url=url, metadata=json.loads(metadata) if metadata is not None else None)
+        return data, json.loads(users), secrets
+
+    def import_objects(self, n_type: LocationDataType, objects: Iterable[Tuple[str, LocationData, List[str], Dict[str, str]]]) -> int:
+        """
+        bulk import (oid, data, users, secrets) tuples in one transaction, replacing
+        existing objects with the same id; secrets are stored as given. Returns the
+        number of imported objects
+        """
+        table = n_type.value
+        count = 0
+        with self.__write_transaction() as conn:
+            for oid, data, users, secrets in objects:
+                # existing objects are updated, so their version keeps increasing
+                self.__write_object(conn, n_type, oid, data, users)
+                conn.execute(f'UPDATE "{table}" SET users = ? WHERE oid = ?', (json.dumps(users), oid))
+                conn.execute(f'DELETE FROM "{table}_secrets" WHERE oid = ?', (oid,))
+                conn.executemany(f'INSERT INTO "{table}_secrets" (oid, key, value) VALUES (?, ?, ?)',
+                                 ((oid, key, value) for key, value in secrets.items()))
+                count += 1
+        return count
+
+    def __load_secrets(self, conn: sqlite3.Connection, n_type: LocationDataType, oid: str) -> Dict[str, str]:
+        self.__check_exists(conn, n_type, oid)
+        return dict(conn.execute(f'SELECT key, value FROM "{n_type.value}_secrets" WHERE oid = ?', (str(oid),)).fetchall())
+
+    def list_secrets(self, n_type: LocationDataType, oid:str, usr: str):
+        """ list all available secrets for this object"""
+        return list(self.__load_secrets(self.__connection(), n_type, str(oid)).keys())
+
+    def get_secret_values(self, n_type: LocationDataType, oid:str, usr: str):
+        """ get all available secrets (key + value) for this object"""
+        return self.__load_secrets(self.__connection(), n_type, str(oid))
+
+    def add_update_secret(self, n_type: LocationDataType, oid:str, key: str, value: str, usr: str):
+        """ add new secrets to an existing object"""
+        with self.__write_transaction() as conn:
+            self.__check_exists(conn, n_type, str(oid))
+            conn.execute(f'INSERT OR REPLACE INTO "{n_type.value}_secrets" (oid, key, value) VALUES (?, ?, ?)',
+                         (str(oid), key, value))
+        log.debug('User %s is updating secretes for %s', usr, oid)
+
+    def get_secret(self, n_type: LocationDataType, oid:str, key: str, usr: str):
+        """ return the value of the requested secret for the given object"""
+        secrets = self.__load_secrets(self.__connection(), n_type, str(oid))
+        log.debug('User %s is retrieving secrets for %s', usr, oid)
+        try:
+            return secrets[key]
+        except KeyError:
+            raise HTTPException(404, f"Secret with key {key} does not exist for the object {n_type.value}/{oid}")
+
+    def delete_secret(self, n_type: LocationDataType, oid:str, key: str, usr: str):
+        """ delete and return the value of the requested secret for the given object"""
+        with self.__write_transaction() as conn:
+            val = self.__load_secrets(conn, n_type, str(oid)).get(key)
+            if not val:
+                raise HTTPException(404, f"Secret with key {key} does not exist for the object {n_type.value}/{oid}")
+            conn.execute(f'DELETE FROM "{n_type.value}_secrets" WHERE oid = ? AND key = ?', (str(oid), key))
+        log.debug('User %s delete secret for %s', usr, oid)
+        return val
+
+
+class EncryptedSqliteStorageAdapter(SecretsEncryptionMixin, SqliteStorageAdapter):
+    pass
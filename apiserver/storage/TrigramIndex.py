@@ -0,0 +1,104 @@
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+from .LocationStorage import LocationData, SearchField
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i+3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """ In-memory trigram inverted index over name, url and metadata of one type
+
+    For every field, each trigram of the normalized text points to the set of
+    object ids that contain it. Name and url are normalized with `lower`, the
+    metadata keys and values with `casefold`, the same way `contains_term` compares
+    them. A substring query intersects the posting lists of all trigrams of the
+    term (smallest first) and returns the candidates, which the caller verifies
+    with `contains_term` against the objects (loaded through the cache, if there
+    is one), so the results are exactly the same as those of a full scan. Terms
+    shorter than three characters can not be looked up and narrow nothing down.
+
+    Only the posting lists are kept, not the objects. Changed and removed objects
+    are therefore not taken out of the posting lists of their old trigrams; they
+    only cost further candidates. `stale` counts them, so the owner can rebuild
+    the index once they make up as much as the live part.
+    """
+
+    def __init__(self):
+        self.__ids: Set[str] = set()
+        self.__postings: Dict[SearchField, Dict[str, Set[str]]] = {
+            SearchField.NAME: {},
+            SearchField.URL: {},
+            SearchField.ANY: {}  # metadata keys and values
+        }
+        self.stale = 0
+        self.__lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.__ids)
+
+    @staticmethod
+    def __field_trigrams(data: LocationData):
+        yield SearchField.NAME, trigrams(data.name.lower())
+        yield SearchField.URL, trigrams(data.url.lower())
+        meta = set()
+        for key, value in (data.metadata or {}).items():
+            meta |= trigrams(key.casefold())
+            meta |= trigrams(value.casefold())
+        yield SearchField.ANY, meta
+
+    def add(self, oid: str, data: LocationData):
+        """ add the object to the index; the trigrams of an older version of it stay as stale postings"""
+        with self.__lock:
+            if oid in self.__ids:
+                self.stale += 1
+            self.__ids.add(oid)
+            for field, grams in self.__field_trigrams(data):
+                postings = self.__postings[field]
+                for gram in grams:
+                    postings.setdefault(gram, set()).add(oid)
+
+    def remove(self, oid: str):
+        with self.__lock:
+            if oid in self.__ids:
+                self.__ids.discard(oid)
+                self.stale += 1
+
+    def __candidates(self, field: SearchField, grams: Set[str]) -> Set[str]:
+        postings = self.__postings[field]
+        lists: List[Set[str]] = []
+        for gram in grams:
+            ids = postings.get(gram)
+            if not ids:
+                return set()
+            lists.append(ids)
+        lists.sort(key=len)
+        result = set(lists[0])
+        for ids in lists[1:]:
+            result &= ids
+            if not result:
+                break
+        return result
+
+    def query(self, term: str, field: SearchField, within: Optional[Iterable[str]] = None) -> Optional[Set[str]]:
+        """
+        return the ids of the indexed objects that may contain the term in the given field, a superset
+        of those that do; if `within` is given, only these ids are considered. Returns `within` (None if
+        it is not given) for terms that are too short to be looked up
+        """
+        with self.__lock:
+            if len(term) < 3:
+                return None if within is None else set(within)
+            candidates = set()
+            if field in (SearchField.NAME, SearchField.ANY):
+                candidates |= self.__candidates(SearchField.NAME, trigrams(term.lower()))
+            if field in (SearchField.URL, SearchField.ANY):
+                candidates |= self.__candidates(SearchField.URL, trigrams(term.lower()))
+            if field == SearchField.ANY:
+                candidates |= self.__candidates(SearchField.ANY, trigrams(term.casefold()))
+            candidates &= self.__ids
+            if within is not None:
+                candidates.intersection_update(within)
+            return candidates
@@ -0,0 +1,247 @@
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+DEFAULT_CHECKPOINT_SIZE: int = 4 * 1024 * 1024
+TMP_SUFFIX: str = ".tmp"
+
+log = logging.getLogger(__name__)
+
+# (path relative to the base directory, new content or None to delete the file)
+FileOperation = Tuple[str, Optional[str]]
+
+
+def write_file(path: str, content: str):
+    """ replace the file with the given content by writing a temporary file and renaming it"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + TMP_SUFFIX
+    with open(tmp_path, 'w') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def fsync_path(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    """ Makes groups of file writes and deletions atomic and durable
+
+    A commit appends one record with all operations to the log and waits until it
+    has been synced. Concurrent commits are grouped: the first waiting thread
+    writes the records of everyone that is waiting and syncs the log once for all of
+    them, then it applies the operations in log order, every file write by writing a
+    temporary file and renaming it. So a file is never seen half written and a commit
+    that returned survives a crash.
+
+    The files themselves are not synced on every write. Once the log has grown
+    beyond `checkpoint_size`, all files written since the last checkpoint are
+    synced, `before_checkpoint` is called to make everything derived from them
+    durable as well (e.g. indexes) and the log is truncated. A checkpoint waits
+    until all running `committed` blocks are left, so what they derive from their
+    changes is covered. On startup, all records still in the log are applied
+    again, which is safe as every operation is idempotent; they stay in the log
+    until the next checkpoint.
+    """
+
+    def __init__(self, path: str, base_dir: str, checkpoint_size: int = DEFAULT_CHECKPOINT_SIZE,
+                 before_checkpoint: Optional[Callable[[], None]] = None):
+        self.path = path
+        self.base_dir = base_dir
+        self.checkpoint_size = checkpoint_size
+        self.before_checkpoint = before_checkpoint
+        self.syncs = 0
+        self.__cond = threading.Condition()
+        self.__pending: List[dict] = []
+        self.__flushing = False
+        self.__next_seq = 1
+        self.__done_seq = 0
+        self.__errors: Dict[int, Exception] = {}
+        # commits whose blocks have not been left yet, a due checkpoint waits for them
+        self.__running = 0
+        self.__checkpoint_due = False
+        self.__touched: Set[str] = set()
+        # paths (relative to the base directory) written or deleted by the records replayed on startup
+        self.recovered: Set[str] = set()
+        self.__recover()
+        self.__file = open(self.path, 'a')
+        self.__size = self.__file.tell()
+
+    def __full_path(self, path: str) -> str:
+        return os.path.join(self.base_dir, path)
+
+    def __apply(self, record: dict, recovering: bool = False):
+        for path, content in record['ops']:
+            full_path = self.__full_path(path)
+            if content is None:
+                try:
+                    os.remove(full_path)
+                except FileNotFoundError:
+                    pass
+            elif not (recovering and self.__has_content(full_path, content)):
+                write_file(full_path, content)
+            self.__touched.add(full_path)
+
+    @staticmethod
+    def __has_content(path: str, content: str) -> bool:
+        # files that are already up to date are kept, hard links to them stay intact
+        if not os.path.isfile(path) or os.path.getsize(path) != len(content.encode()):
+            return False
+        with open(path, 'r') as f:
+            return f.read() == content
+
+    def __recover(self):
+        if not os.path.isfile(self.path):
+            return
+        replayed = 0
+        end = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("missing end of line")
+                    record = json.loads(line)
+                except ValueError:
+                    # torn write of the last record, it has never been committed
+                    log.warning("Ignoring incomplete record in write-ahead log %s.", self.path)
+                    break
+                self.__apply(record, recovering=True)
+                self.recovered.update(path for path, _ in record['ops'])
+                replayed += 1
+                end += len(line)
+        if replayed:
+            log.info("Replayed %d records from write-ahead log %s.", replayed, self.path)
+        self.__sync_touched()
+        # the replayed records are kept until the next checkpoint, new ones must not follow a torn one
+        with open(self.path, 'r+b') as f:
+            f.truncate(end)
+            os.fsync(f.fileno())
+
+    def __sync_touched(self):
+        dirs = set()
+        for path in self.__touched:
+            if os.path.exists(path):
+                fsync_path(path)
+            dirs.add(os.path.dirname(path))
+        for d in dirs:
+            if os.path.isdir(d):
+                fsync_path(d)
+        self.__touched = set()
+
+    def __flush(self, batch: List[dict]):
+        # only ever called by one thread at a time, without holding the condition
+        try:
+            for record in batch:
+                self.__file.write(json.dumps(record) + "\n")
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+        except OSError:
+            # do not leave a partial record in front of the following ones
+            self.__file.truncate(self.__size)
+            raise
+        self.syncs += 1
+        self.__size = self.__file.tell()
+        for record in batch:
+            try:
+                self.__apply(record)
+            except OSError as e:
+                log.error("Applying record %d of the write-ahead log failed: %s", record['seq'], e)
+                self.__errors[record['seq']] = e
+
+    def __checkpoint(self):
+        """ sync all files written since the last checkpoint and truncate the log"""
+        self.__sync_touched()
+        if self.before_checkpoint is not None:
+            self.before_checkpoint()
+        self.__file.truncate(0)
+        self.__file.seek(0)
+        os.fsync(self.__file.fileno())
+        self.__size = 0
+        log.debug("Checkpointed write-ahead log %s.", self.path)
+
+    def checkpoint(self):
+        """ sync all files written so far and truncate the log, once the running commits are done"""
+        with self.__cond:
+            self.__checkpoint_due = True
+            while self.__running:
+                self.__cond.wait()
+            try:
+                self.__checkpoint()
+            finally:
+                self.__checkpoint_due = False
+                self.__cond.notify_all()
+
+    @contextmanager
+    def committed(self, ops: List[FileOperation]):
+        """
+        atomically apply the given operations, paths are relative to the base directory;
+        enters the block once they are durable and visible. The log is not checkpointed
+        before the block is left, so changes derived from them in the block are covered
+        by the log until `before_checkpoint` has made them durable
+        """
+        with self.__cond:
+            # no new records while a checkpoint waits for the running commits
+            while self.__checkpoint_due:
+                self.__cond.wait()
+            self.__running += 1
+        try:
+            self.__commit(ops)
+            yield
+        finally:
+            with self.__cond:
+                self.__running -= 1
+                if self.__size >= self.checkpoint_size:
+                    self.__checkpoint_due = True
+                if self.__checkpoint_due and not self.__running:
+                    try:
+                        self.__checkpoint()
+                    except OSError as e:
+                        log.error("Checkpoint of the write-ahead log %s failed: %s", self.path, e)
+                    finally:
+                        self.__checkpoint_due = False
+                        self.__cond.notify_all()
+
+    def commit(self, ops: List[FileOperation]):
+        """
+        atomically apply the given operations, paths are relative to the base directory;
+        returns once they are durable and visible
+        """
+        with self.committed(ops):
+            pass
+
+    def __commit(self, ops: List[FileOperation]):
+        with self.__cond:
+            seq = self.__next_seq
+            self.__next_seq += 1
+            self.__pending.append({'seq': seq, 'ops': [[path, content] for path, content in ops]})
+            while self.__done_seq < seq:
+                if self.__flushing:
+                    self.__cond.wait()
+                    continue
+                batch, self.__pending = self.__pending, []
+                self.__flushing = True
+                self.__cond.release()
+                try:
+                    self.__flush(batch)
+                except Exception as e:
+                    for record in batch:
+                        self.__errors[record['seq']] = e
+                finally:
+                    self.__cond.acquire()
+                    self.__flushing = False
+                    self.__done_seq = batch[-1]['seq']
+                    self.__cond.notify_all()
+            error = self.__errors.pop(seq, None)
+        if error is not None:
+            raise error
+
+    def close(self):
+        with self.__cond:
+            self.__file.close()
@@ -1,5 +1,21 @@
 from .JsonFileStorageAdapter import JsonFileStorageAdapter
 
-from .LocationStorage import LocationDataType, LocationData, AbstractLocationDataStorageAdapter
+from .LocationStorage import LocationDataType, LocationData, AbstractLocationDataStorageAdapter, SearchField, QueryFilters, QueryPage, BatchAction, BatchOperation, BatchResult, DeleteResult, DeleteStatus, MultiGetResult, ImportLineError, ImportResult
 
-from .EncryptedJsonFileStorageAdapter import EncryptedJsonFileStorageAdapter
\ No newline at end of file
+from .EncryptedJsonFileStorageAdapter import EncryptedJsonFileStorageAdapter
+
+from .CachedStorageAdapter import CachedStorageAdapter
+
+from .AsyncStorageAdapter import AsyncStorageAdapter
+
+from .SqliteStorageAdapter import SqliteStorageAdapter, EncryptedSqliteStorageAdapter
+
+from .SegmentStorageAdapter import SegmentStorageAdapter, EncryptedSegmentStorageAdapter
+
+from .ChangeLog import ChangeLog, ChangeAction, Change, ChangeFeed, ChangesExpired
+
+from .ChangeTrackingStorageAdapter import ChangeTrackingStorageAdapter
+
+from .ChangeBroadcaster import ChangeBroadcaster, Subscription, event_stream
+
+from .Snapshot import Snapshot, SnapshotStorageAdapter, RestoreResult
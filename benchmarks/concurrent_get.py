@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Measures the latency of GET requests for single objects while a large search is in
+progress. Without --inline the storage calls run on the storage thread pool and
+the latency stays close to the idle latency, with --inline they run on the event
+loop (as the routes did before) and every GET waits for the search to finish.
+
+Run from the repository root:
+    python benchmarks/concurrent_get.py -n 20000
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def setup_environment(data_dir: str):
+    # has to happen before the apiserver is imported, it reads its settings on import
+    os.environ['DATACATALOG_APISERVER_JSON_STORAGE_PATH'] = data_dir
+    os.environ['DATACATALOG_APISERVER_USERDB_PATH'] = os.path.join(data_dir, 'userdb.json')
+    os.environ['DATACATALOG_APISERVER_CACHE_SIZE'] = '0'
+
+
+def populate(adapter, count: int):
+    from apiserver.storage import LocationData, LocationDataType
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        results = pool.map(lambda i: adapter.add_new(
+            LocationDataType.DATASET,
+            LocationData(name=f'dataset {i}', url=f'https://example.org/{i}', metadata={'index': str(i), 'group': str(i % 10)}),
+            'benchmark'), range(count))
+        return [oid for oid, _ in results]
+
+
+async def measure_gets(client, oids, requests: int, interval: float = 0.005):
+    latencies = []
+    for i in range(requests):
+        start = time.perf_counter()
+        # spread the requests over the duration of the search; a blocked event loop
+        # delays the request beyond the interval, which counts as latency as well
+        await asyncio.sleep(interval)
+        rsp = await client.get(f'/dataset/{oids[i % len(oids)]}')
+        latencies.append(time.perf_counter() - start - interval)
+        rsp.raise_for_status()
+    return latencies
+
+
+def report(label: str, latencies):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{label:<16} n={len(latencies):<5} median={statistics.median(latencies) * 1000:8.2f} ms"
+          f"  p99={p99 * 1000:8.2f} ms  max={latencies[-1] * 1000:8.2f} ms")
+
+
+async def run(args, oids):
+    import httpx
+    import apiserver.main as main
+
+    if args.inline:
+        async def inline(func, *a, **kw):
+            return func(*a, **kw)
+        main.async_adapter.run = inline
+
+    async with httpx.AsyncClient(app=main.app, base_url='http://benchmark') as client:
+        report("idle", await measure_gets(client, oids, args.requests))
+
+        async def search():
+            await asyncio.sleep(0.05)
+            start = time.perf_counter()
+            # the first search builds the search index of the type, reading every object
+            rsp = await client.get('/dataset', params={'search': 'group'})
+            return rsp, time.perf_counter() - start
+
+        latencies, (rsp, duration) = await asyncio.gather(measure_gets(client, oids, args.requests), search())
+        report("during search", latencies)
+        print(f"search returned {len(rsp.json())} objects in {duration:.2f} s")
+
+
+def main(args):
+    data_dir = tempfile.mkdtemp(prefix='datacatalog-benchmark-')
+    try:
+        setup_environment(data_dir)
+        import apiserver.main as main
+        print(f"Creating {args.number} datasets in {data_dir}")
+        oids = populate(main.adapter.adapter if hasattr(main.adapter, 'adapter') else main.adapter, args.number)
+        asyncio.run(run(args, oids))
+    finally:
+        shutil.rmtree(data_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("concurrent_get.py", description="Benchmark GET latency of the apiserver during a large search.")
+    parser.add_argument("-n", "--number", type=int, default=5000, help="Number of datasets to create.")
+    parser.add_argument("-r", "--requests", type=int, default=200, help="Number of GET requests per measurement.")
+    parser.add_argument("--inline", action="store_true", help="Run the storage calls on the event loop for comparison.")
+    main(parser.parse_args())
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+Measures the encoding of an unpaged listing (GET /dataset) with the default path of
+FastAPI, which validates the result against the response_model, converts it with
+jsonable_encoder and encodes it with the json module, and with the FastJSONResponse
+the route returns now. Also shows the size of the response with gzip compression.
+
+Run from the repository root:
+    python benchmarks/listing_serialization.py -n 10000 100000
+"""
+import argparse
+import asyncio
+import gzip
+import os
+import statistics
+import sys
+import time
+import uuid
+from typing import List
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def listing(count: int):
+    return sorted((f'dataset {i}', str(uuid.uuid4())) for i in range(count))
+
+
+def default_path(entries):
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+
+    field = create_response_field(name='response', type_=List[List[str]])
+    content = asyncio.run(serialize_response(field=field, response_content=entries))
+    return JSONResponse(content).body
+
+
+def fast_path(entries):
+    from apiserver.responses import FastJSONResponse
+    return FastJSONResponse(entries).body
+
+
+def measure(func, entries, repeat: int):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = func(entries)
+        durations.append(time.perf_counter() - start)
+    return body, statistics.median(durations)
+
+
+def main(args):
+    from apiserver import responses
+    from apiserver.responses import DEFAULT_COMPRESSLEVEL
+    print(f"encoder of the fast path: {'orjson' if responses.orjson is not None else 'json'}")
+    for count in args.number:
+        entries = listing(count)
+        default_body, default_time = measure(default_path, entries, args.repeat)
+        fast_body, fast_time = measure(fast_path, entries, args.repeat)
+        start = time.perf_counter()
+        compressed = gzip.compress(fast_body, compresslevel=DEFAULT_COMPRESSLEVEL)
+        gzip_time = time.perf_counter() - start
+        print(f"{count:>7} entries  default {default_time * 1000:8.1f} ms  fast {fast_time * 1000:8.1f} ms"
+              f"  ({default_time / fast_time:5.1f}x)  |  {len(default_body) / 1024:8.0f} KiB -> {len(fast_body) / 1024:8.0f} KiB"
+              f"  gzip {len(compressed) / 1024:6.0f} KiB in {gzip_time * 1000:6.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("listing_serialization.py", description="Benchmark the encoding of large listings.")
+    parser.add_argument("-n", "--number", type=int, nargs='+', default=[10000, 100000], help="Numbers of listed datasets.")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="Repetitions per measurement, the median is reported.")
+    main(parser.parse_args())
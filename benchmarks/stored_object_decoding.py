@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""
+Measures the decoding of stored objects, with the validation of every object (as
+imports do, and as all reads did before) and with the trusted path for objects
+of the current format version.
+
+Run from the repository root:
+    python benchmarks/stored_object_decoding.py -n 10000 -k 10
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def stored_objects(count: int, keys: int):
+    from apiserver.storage import LocationData
+    from apiserver.storage.JsonFileStorageAdapter import StoredData
+    return [StoredData(users=['benchmark'], actualData=LocationData(
+        name=f'dataset {i}', url=f'https://example.org/{i}',
+        metadata={f'key {k}': f'value {i} {k}' for k in range(keys)})).json().encode() for i in range(count)]
+
+
+def measure(raws, strict: bool, repeat: int) -> float:
+    from apiserver.storage.JsonFileStorageAdapter import decode_stored
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for raw in raws:
+            decode_stored(raw, strict)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def main(args):
+    raws = stored_objects(args.number, args.keys)
+    strict = measure(raws, True, args.repeat)
+    trusted = measure(raws, False, args.repeat)
+    print(f"{args.number} objects with {args.keys} metadata keys")
+    print(f"validated {strict * 1000:8.1f} ms  ({strict / args.number * 1e6:6.1f} us per object)")
+    print(f"trusted   {trusted * 1000:8.1f} ms  ({trusted / args.number * 1e6:6.1f} us per object)  {strict / trusted:4.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("stored_object_decoding.py", description="Benchmark the decoding of stored objects.")
+    parser.add_argument("-n", "--number", type=int, default=10000, help="Number of objects to decode.")
+    parser.add_argument("-k", "--keys", type=int, default=10, help="Number of metadata keys per object.")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="Repetitions per measurement, the median is reported.")
+    main(parser.parse_args())
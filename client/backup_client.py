@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import argparse
+import getpass
+import sys
+from urllib.parse import urljoin
+
+import requests
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def login(server, user, password):
+    r = requests.post(urljoin(server, 'token'),
+                      data={'username': user, 'password': password})
+
+    if r.status_code!=200:
+        print("Unable to authenticate. Breaking")
+        sys.exit(-1)
+
+    token = r.json()['access_token']
+    return {'Authorization': f"Bearer {token}"}
+
+
+def backup(server, auth_headers, since=None):
+    params = {'since': since} if since is not None else {}
+    with requests.get(urljoin(server, '_snapshot'), params=params, headers=auth_headers, stream=True) as r:
+        if r.status_code==410:
+            print(f"Changes since {since} are no longer available, take a full backup.")
+            sys.exit(-1)
+        if r.status_code!=200:
+            print(r.url, r.status_code, r.text)
+            sys.exit(-1)
+        seq = r.headers['X-Snapshot-Seq']
+        filename = f"snapshot-{seq}.ndjson.gz"
+        with open(filename, 'wb') as f:
+            # the snapshot is compressed already, the raw stream is written as it is
+            for chunk in r.raw.stream(CHUNK_SIZE, decode_content=False):
+                f.write(chunk)
+    print(f"Wrote {filename}, pass --since {seq} for the next incremental backup.")
+
+
+def read_chunks(filename):
+    with open(filename, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def restore(server, auth_headers, filename):
+    r = requests.post(urljoin(server, '_restore'), data=read_chunks(filename), headers=auth_headers)
+    if r.status_code!=200:
+        print(r.url, r.status_code, r.text)
+        sys.exit(-1)
+    result = r.json()
+    print(f"{filename}: restored {result['restored']}, deleted {result['deleted']}, failed {result['failed']} objects.")
+    for error in result['errors']:
+        print(f"Line {error['line']}: {error['error']}")
+    if not result['complete']:
+        print(f"{filename} is incomplete, the restore stopped.")
+        sys.exit(-1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Takes and restores snapshots of the apiserver')
+    parser.add_argument('-s', '--server', help='server url',
+                        default='http://localhost:8000/')
+    parser.add_argument('-u', '--user', help='user name (with secrets access)', required=True)
+    commands = parser.add_subparsers(dest='command', required=True)
+    backup_parser = commands.add_parser('backup', help='write a snapshot to snapshot-<seq>.ndjson.gz')
+    backup_parser.add_argument('--since', type=int,
+                               help='sequence number of the last snapshot, only changes after it are written')
+    restore_parser = commands.add_parser('restore', help='restore snapshots, the full one first')
+    restore_parser.add_argument('files', nargs='+', help='snapshot files in the order they were taken')
+    args = parser.parse_args()
+
+    password = getpass.getpass(prompt='Password required')
+    auth_headers = login(args.server, args.user, password)
+
+    if args.command == 'backup':
+        backup(args.server, auth_headers, args.since)
+    else:
+        for filename in args.files:
+            restore(args.server, auth_headers, filename)
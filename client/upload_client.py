@@ -32,24 +32,20 @@ if __name__ == "__main__":
     password = getpass.getpass(prompt='Password required')
     auth_headers = login(args.server, args.user, password)
 
-    lst = requests.get(urljoin(args.server, 'dataset')).json()
-    datasets = {a[0]: a[1] for a in lst}
-
     with open(args.dataset, 'r') as f:
         ds = json.load(f)
 
-    for el in ds:
-        if el['name'] in datasets:
-            print(f"{el['name']} is already on sever (id={datasets[el['name']]}). Updating...")
-            r = requests.put(url=urljoin(args.server, f"dataset/{datasets[el['name']]}"),
-                json=el, headers=auth_headers)
-        else:
-            r = requests.post(urljoin(args.server, 'dataset'),
-                            json=el, headers=auth_headers)
-        if r.status_code==200:
-            print(f"Sent {el['name']} -> {r.json()[0]}")
-        else:
-            print(r.url, r.status_code, r.text)
+    # existing datasets with the same name are updated by the server
+    body = "".join(json.dumps(el) + "\n" for el in ds)
+    r = requests.post(urljoin(args.server, 'dataset/_import'), params={'upsert': 'true'},
+                      data=body.encode(), headers=auth_headers)
+    if r.status_code==200:
+        result = r.json()
+        print(f"Created {result['created']}, updated {result['updated']}, failed {result['failed']} datasets.")
+        for error in result['errors']:
+            print(f"Dataset {error['line']}: {error['error']}")
+    else:
+        print(r.url, r.status_code, r.text)
 
     print('Data sets on the server:')
     r = requests.get(urljoin(args.server, 'dataset'))
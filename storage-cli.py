@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+import argparse
+import os
+from collections import namedtuple
+
+from apiserver.storage import LocationDataType, SqliteStorageAdapter
+from apiserver.storage.JsonFileStorageAdapter import iter_stored_objects, migrate_layout
+
+
+def to_sqlite(args):
+    if not os.path.isdir(args.data_dir):
+        raise ValueError(f"Data directory {args.data_dir} does not exist!")
+    if not args.target:
+        raise ValueError("Target database is not set!")
+    Settings = namedtuple('Settings', ['json_storage_path', 'sqlite_path'])
+    store = SqliteStorageAdapter(Settings(args.data_dir, args.target))
+    for n_type in LocationDataType:
+        count = store.import_objects(n_type, iter_stored_objects(args.data_dir, n_type))
+        print(f"Imported {count} objects of type {n_type.value}")
+
+
+def shard(args):
+    if not os.path.isdir(args.data_dir):
+        raise ValueError(f"Data directory {args.data_dir} does not exist!")
+    if args.depth < 0:
+        raise ValueError("The shard depth can not be negative!")
+    for n_type in LocationDataType:
+        count = migrate_layout(args.data_dir, n_type, args.depth)
+        print(f"Moved {count} objects of type {n_type.value}")
+
+
+def main(args):
+    if 'to_sqlite' in args.operation:
+        to_sqlite(args)
+    if 'shard' in args.operation:
+        shard(args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("storage-cli.py", description="CLI for maintaining the data directory of the datacatalog-apiserver.", formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("operation", type=str, nargs=1, help="\
+to_sqlite \tImports all objects and secrets of the json data directory into a sqlite database. Requires -t. \n\
+shard \tMoves all objects of the json data directory into the layout with the shard depth given by -d, 0 is the flat layout. \
+The server can keep running, if it is configured with the same shard depth. \
+")
+    parser.add_argument("-t", "--target", help="The sqlite database to import into, it is created if it does not exist.")
+    parser.add_argument("-d", "--depth", type=int, default=1, help="The number of directory levels for the sharded layout.")
+    parser.add_argument("data_dir", type=str, nargs='?', help="The json data directory of the apiserver.", default="./app/data")
+    args = parser.parse_intermixed_args()
+    main(args)
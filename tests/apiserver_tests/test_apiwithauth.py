@@ -1,3 +1,4 @@
+import json
 from fastapi.testclient import TestClient
 from context import apiserver, storage
 #from apiserver import app, my_user, my_auth
@@ -147,3 +148,172 @@ class UserTests(TestCase):
         }
         )
         self.assertEqual(rsp.status_code, 422)
+
+    def test_batch(self):
+        (oid, _) = self.client.post('/dataset', json={'name': 'existing', 'url': 'u'}).json()
+        (removed, _) = self.client.post('/dataset', json={'name': 'removed', 'url': 'u'}).json()
+
+        rsp = self.client.post('/dataset/_batch', json=[
+            {'action': 'create', 'data': {'name': 'created', 'url': 'u'}},
+            {'action': 'update', 'oid': oid, 'data': {'name': 'updated', 'url': 'u2'}},
+            {'action': 'delete', 'oid': removed}
+        ])
+        self.assertEqual(rsp.status_code, 200)
+        results = rsp.json()
+        self.assertEqual([r['action'] for r in results], ['create', 'update', 'delete'])
+        created = results[0]['oid']
+        self.assertEqual(results[1], {'action': 'update', 'oid': oid, 'data': {'name': 'updated', 'url': 'u2', 'metadata': None}})
+        self.assertIsNone(results[2]['data'])
+        self.assertEqual(sorted(self.client.get('/dataset').json()), [['created', created], ['updated', oid]])
+
+        # nothing is applied if one operation fails
+        rsp = self.client.post('/dataset/_batch', json=[
+            {'action': 'create', 'data': {'name': 'not created', 'url': 'u'}},
+            {'action': 'delete', 'oid': removed}
+        ])
+        self.assertEqual(rsp.status_code, 404)
+        rsp = self.client.post('/dataset/_batch', json=[
+            {'action': 'update', 'oid': oid, 'data': {'name': 'twice', 'url': 'u'}},
+            {'action': 'delete', 'oid': oid}
+        ])
+        self.assertEqual(rsp.status_code, 400)
+        rsp = self.client.post('/dataset/_batch', json=[{'action': 'update', 'oid': oid}])
+        self.assertEqual(rsp.status_code, 400)
+        self.assertEqual(sorted(self.client.get('/dataset').json()), [['created', created], ['updated', oid]])
+
+        self.client.delete(f"/dataset/{oid}")
+        self.client.delete(f"/dataset/{created}")
+
+    def test_multiget(self):
+        oids = [self.client.post('/dataset', json={'name': f'multi {i}', 'url': 'u'}).json()[0] for i in range(3)]
+        rsp = self.client.post('/dataset/_multiget', json=oids[:2] + [proper_uuid, oids[0]])
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(rsp.json(), {
+            'found': {oids[0]: {'name': 'multi 0', 'url': 'u', 'metadata': None},
+                      oids[1]: {'name': 'multi 1', 'url': 'u', 'metadata': None}},
+            'missing': [proper_uuid]})
+        self.assertEqual(self.client.post('/dataset/_multiget', json=['invalid']).status_code, 422)
+        for oid in oids:
+            self.client.delete(f"/dataset/{oid}")
+
+    def test_bulk_delete(self):
+        oids = [self.client.post('/dataset', json={'name': f'bulk {i}', 'url': 'u'}).json()[0] for i in range(3)]
+        rsp = self.client.request("DELETE", "/dataset", json=[oids[0], proper_uuid, oids[1], oids[0]])
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(rsp.json(), [{'oid': oids[0], 'status': 'deleted'},
+                                      {'oid': proper_uuid, 'status': 'not_found'},
+                                      {'oid': oids[1], 'status': 'deleted'}])
+        self.assertEqual(self.client.get('/dataset').json(), [['bulk 2', oids[2]]])
+        self.assertEqual(self.client.get(f"/dataset/{oids[0]}").status_code, 404)
+        self.assertEqual(self.client.request("DELETE", "/dataset", json=['invalid']).status_code, 422)
+        self.client.delete(f"/dataset/{oids[2]}")
+
+    def test_fields(self):
+        oids = [self.client.post('/dataset', json={'name': f'fields {i}', 'url': f'u{i}', 'metadata': {'site': 'jsc', 'i': str(i)}}).json()[0] for i in range(3)]
+        rsp = self.client.get('/dataset', params={'name': 'fields ', 'fields': 'name,url,metadata.i,metadata.missing'})
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(rsp.json(), [{'oid': oid, 'name': f'fields {i}', 'url': f'u{i}', 'metadata': {'i': str(i)}} for i, oid in enumerate(oids)])
+        rsp = self.client.get('/dataset', params={'name': 'fields ', 'fields': 'metadata', 'page': 2, 'page_size': 2})
+        self.assertEqual(rsp.json(), [{'oid': oids[2], 'metadata': {'site': 'jsc', 'i': '2'}}])
+        rsp = self.client.get('/dataset', params={'name': 'fields 1', 'fields': 'name'})
+        self.assertEqual(rsp.json(), [{'oid': oids[1], 'name': 'fields 1'}])
+        self.assertEqual(self.client.get('/dataset', params={'name': 'fields 1'}).json(), [['fields 1', oids[1]]])
+        for fields in ('users', 'url.x', 'metadata.', ','):
+            self.assertEqual(self.client.get('/dataset', params={'fields': fields}).status_code, 400, fields)
+        for oid in oids:
+            self.client.delete(f"/dataset/{oid}")
+
+    def test_facets(self):
+        oids = [self.client.post('/dataset', json={'name': f'facet {i}', 'url': f'u{i % 2}', 'metadata': {'facet_site': 'jsc' if i else 'bsc'}}).json()[0] for i in range(3)]
+        rsp = self.client.get('/dataset/_facets', params={'keys': ['facet_site', 'facet_unknown']})
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(rsp.json(), {'facet_site': {'jsc': 2, 'bsc': 1}, 'facet_unknown': {}})
+        rsp = self.client.get('/dataset/_facets', params={'keys': 'facet_site', 'url': 'u0'})
+        self.assertEqual(rsp.json(), {'facet_site': {'jsc': 1, 'bsc': 1}})
+        self.assertEqual(self.client.get('/dataset/_facets').status_code, 422)
+        for oid in oids:
+            self.client.delete(f"/dataset/{oid}")
+
+    def test_etags(self):
+        (oid, _) = self.client.post('/dataset', json={'name': 'etag', 'url': 'u'}).json()
+        rsp = self.client.get('/dataset')
+        etag = rsp.headers['ETag']
+        rsp = self.client.get('/dataset', headers={'If-None-Match': etag})
+        self.assertEqual(rsp.status_code, 304)
+        self.assertEqual(rsp.headers['ETag'], etag)
+        self.assertEqual(rsp.content, b'')
+        self.assertNotEqual(self.client.get('/dataset', params={'name': 'et'}).headers['ETag'], etag)
+
+        detail_etag = self.client.get(f'/dataset/{oid}').headers['ETag']
+        self.assertEqual(self.client.get(f'/dataset/{oid}', headers={'If-None-Match': f'"other", {detail_etag}'}).status_code, 304)
+        self.client.put(f'/dataset/{oid}', json={'name': 'etag', 'url': 'changed'})
+        rsp = self.client.get(f'/dataset/{oid}', headers={'If-None-Match': detail_etag})
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(rsp.json()['url'], 'changed')
+        self.assertNotEqual(rsp.headers['ETag'], detail_etag)
+        self.assertEqual(self.client.get('/dataset', headers={'If-None-Match': etag}).status_code, 200)
+        self.assertEqual(self.client.get(f'/dataset/{proper_uuid}', headers={'If-None-Match': '*'}).status_code, 404)
+        self.client.delete(f"/dataset/{oid}")
+
+    def test_changes(self):
+        since = self.client.get('/dataset/_changes').json()['last_seq']
+        (oid, _) = self.client.post('/dataset', json={'name': 'changed', 'url': 'u'}).json()
+        self.client.put(f'/dataset/{oid}', json={'name': 'changed', 'url': 'u2'})
+        self.client.delete(f"/dataset/{oid}")
+
+        rsp = self.client.get('/dataset/_changes', params={'since': since, 'limit': 2})
+        self.assertEqual(rsp.status_code, 200)
+        feed = rsp.json()
+        self.assertEqual([(c['action'], c['oid']) for c in feed['changes']], [('create', oid), ('update', oid)])
+        feed = self.client.get('/dataset/_changes', params={'since': feed['last_seq']}).json()
+        self.assertEqual([(c['action'], c['oid']) for c in feed['changes']], [('delete', oid)])
+        self.assertEqual(self.client.get('/dataset/_changes', params={'since': feed['last_seq'] + 1}).status_code, 410)
+        self.assertEqual(self.client.get('/dataset/_changes', params={'limit': 0}).status_code, 422)
+
+    def test_events_resume(self):
+        last_seq = self.client.get('/dataset/_changes').json()['last_seq']
+        self.assertEqual(self.client.get('/dataset/_events', params={'since': last_seq + 1}).status_code, 410)
+        self.assertEqual(self.client.get('/dataset/_events', headers={'Last-Event-ID': 'x'}).status_code, 400)
+
+    def test_export(self):
+        oids = [self.client.post('/dataset', json={'name': f'export {i}', 'url': 'u', 'metadata': {'i': str(i)}}).json()[0] for i in range(3)]
+        rsp = self.client.get('/dataset/_export')
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(rsp.headers['content-type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in rsp.text.splitlines()]
+        exported = [line for line in lines if line['oid'] in oids]
+        self.assertEqual(exported, [{'oid': oid, 'name': f'export {i}', 'url': 'u', 'metadata': {'i': str(i)}} for i, oid in enumerate(oids)])
+        self.assertEqual(len(lines), len(self.client.get('/dataset').json()))
+        for oid in oids:
+            self.client.delete(f"/dataset/{oid}")
+
+    def test_import(self):
+        def body():
+            yield b'{"name": "import 0", "url": "u"}\n{"name": "import 1",'
+            yield b' "url": "u"}\nnot json\n'
+            yield b'{"name": "import 0", "url": "changed"}\n'
+
+        rsp = self.client.post('/dataset/_import', params={'upsert': True}, content=body())
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(rsp.json()['created'], 2)
+        self.assertEqual(rsp.json()['updated'], 1)
+        self.assertEqual([error['line'] for error in rsp.json()['errors']], [3])
+        imported = {name: oid for name, oid in self.client.get('/dataset', params={'name': 'import '}).json()}
+        self.assertEqual(sorted(imported), ['import 0', 'import 1'])
+        self.assertEqual(self.client.get(f"/dataset/{imported['import 0']}").json()['url'], 'changed')
+        for oid in imported.values():
+            self.client.delete(f"/dataset/{oid}")
+
+    def test_compression(self):
+        oids = [self.client.post('/dataset', json={'name': f'compressed {i}', 'url': 'u'}).json()[0] for i in range(40)]
+        rsp = self.client.get('/dataset', params={'name': 'compressed '}, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(rsp.headers['content-encoding'], 'gzip')
+        self.assertIn('etag', rsp.headers)
+        self.assertEqual(sorted(oid for _, oid in rsp.json()), sorted(oids))
+        rsp = self.client.get('/dataset', params={'name': 'compressed ', 'page': 1, 'page_size': 40}, headers={'Accept-Encoding': 'identity'})
+        self.assertNotIn('content-encoding', rsp.headers)
+        self.assertIn('x-next-cursor', rsp.headers)
+        self.assertEqual(len(rsp.json()), 40)
+        for oid in oids:
+            self.client.delete(f"/dataset/{oid}")
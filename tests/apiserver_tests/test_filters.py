@@ -100,6 +100,17 @@ class FilterTests(unittest.TestCase):
         self.assertEqual(rsp.json(), [['dataset', '0']])
         delete_entries(self.client, oids)
 
+    def test_key_counts(self):
+        oids = fill_with_elements(self.client, 4)
+
+        rsp = self.client.get('/dataset/_keys')
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(rsp.json(), {'value for i': 16, 'value for j': 16})
+
+        rsp = self.client.get('/storage_target/_keys')
+        self.assertEqual(rsp.json(), {})
+        delete_entries(self.client, oids)
+
     def test_search_filter(self):
         oids = fill_with_elements(self.client, 4)
         
@@ -129,4 +140,34 @@ class FilterTests(unittest.TestCase):
         rsp = self.client.get('/dataset', params={"page" : 7, "page_size" : 100})
         self.assertEqual(len(rsp.json()), 0)
 
-        delete_entries(self.client, oids)
\ No newline at end of file
+        delete_entries(self.client, oids)
+
+    def test_paging_cursor(self):
+        oids = fill_with_elements(self.client, 6)
+        everything = self.client.get('/dataset').json()
+
+        collected = []
+        rsp = self.client.get('/dataset', params={"page" : 1, "page_size" : 10})
+        while True:
+            self.assertEqual(rsp.status_code, 200)
+            collected.extend(rsp.json())
+            if 'X-Next-Cursor' not in rsp.headers:
+                break
+            rsp = self.client.get('/dataset', params={"cursor" : rsp.headers['X-Next-Cursor'], "page_size" : 10})
+        self.assertEqual(collected, everything)
+
+        # page counts from the cursor position
+        rsp = self.client.get('/dataset', params={"page" : 1, "page_size" : 5})
+        rsp = self.client.get('/dataset', params={"cursor" : rsp.headers['X-Next-Cursor'], "page" : 2, "page_size" : 5})
+        self.assertEqual(rsp.json(), everything[10:15])
+
+        # cursors work together with filters
+        rsp = self.client.get('/dataset', params={"search" : "Dataset 1", "page" : 1, "page_size" : 4})
+        rsp = self.client.get('/dataset', params={"search" : "Dataset 1", "cursor" : rsp.headers['X-Next-Cursor'], "page_size" : 4})
+        self.assertEqual([entry[0] for entry in rsp.json()], ['Test Dataset 1 4', 'Test Dataset 1 5'])
+        self.assertNotIn('X-Next-Cursor', rsp.headers)
+
+        rsp = self.client.get('/dataset', params={"cursor" : "not a cursor"})
+        self.assertEqual(rsp.status_code, 400)
+
+        delete_entries(self.client, oids)
@@ -0,0 +1,41 @@
+import json
+import unittest
+from unittest import mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.responses import PlainTextResponse
+
+from context import apiserver
+from apiserver import responses
+from apiserver.responses import CompressionMiddleware, FastJSONResponse, dump_json
+
+
+class ResponsesTests(unittest.TestCase):
+    def setUp(self):
+        app = FastAPI()
+        app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+        @app.get("/dataset")
+        async def listing():
+            return FastJSONResponse([["name ä", str(i)] for i in range(100)])
+
+        @app.get("/dataset/_events")
+        async def events():
+            return PlainTextResponse(": keep-alive\n\n" * 100, media_type="text/event-stream")
+
+        self.client = TestClient(app)
+
+    def test_dump_json(self):
+        content = [["name ä", "1"], ("name", "2")]
+        self.assertEqual(json.loads(dump_json(content)), [["name ä", "1"], ["name", "2"]])
+        with mock.patch.object(responses, 'orjson', None):
+            self.assertEqual(dump_json(content), '[["name ä","1"],["name","2"]]'.encode('utf-8'))
+
+    def test_compression(self):
+        rsp = self.client.get("/dataset", headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(rsp.headers['content-encoding'], 'gzip')
+        self.assertEqual(rsp.headers['content-type'], 'application/json')
+        self.assertEqual(len(rsp.json()), 100)
+        rsp = self.client.get("/dataset/_events", headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('content-encoding', rsp.headers)
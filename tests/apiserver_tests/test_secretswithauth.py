@@ -1,3 +1,5 @@
+import gzip
+import json
 from fastapi.testclient import TestClient
 from context import apiserver, storage
 #from apiserver import app, my_user, my_auth
@@ -122,4 +124,40 @@ class UserTests(TestCase):
         rsp = self.client.delete(f'/dataset/{proper_uuid}/secrets/somespecificsecret')
         self.assertEqual(403, rsp.status_code)
 
+        self.assertEqual(403, self.client.get('/_snapshot').status_code)
+        self.assertEqual(403, self.client.post('/_restore', content=b'').status_code)
+
+    def test_snapshot_restore(self):
+        self.client.post(f'/dataset/{self.dummy_oid}/secrets', json={'key': 'backup_key', 'secret': 'backup_value'})
+        rsp = self.client.get('/_snapshot')
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(rsp.headers['content-type'], 'application/gzip')
+        self.assertNotIn('content-encoding', rsp.headers)
+        seq = int(rsp.headers['x-snapshot-seq'])
+        self.assertIn(f'snapshot-{seq}.ndjson.gz', rsp.headers['content-disposition'])
+        snapshot = rsp.content
+        records = [json.loads(line) for line in gzip.decompress(snapshot).splitlines()]
+        self.assertEqual(records[0]['seq'], seq)
+        self.assertTrue(records[-1]['end'])
+        (record,) = [record for record in records if record.get('oid') == self.dummy_oid]
+        self.assertEqual(record['data']['url'], 'http://loc.me/1')
+        self.assertIn('backup_key', record['secrets'])
+
+        self.client.put(f'/dataset/{self.dummy_oid}', json={'name': 'some datase1t', 'url': 'changed'})
+        self.client.delete(f'/dataset/{self.dummy_oid}/secrets/backup_key')
+        rsp = self.client.get('/_snapshot', params={'since': seq})
+        changed = [json.loads(line) for line in gzip.decompress(rsp.content).splitlines()][1:-1]
+        self.assertEqual([record['oid'] for record in changed], [self.dummy_oid])
+        self.assertEqual(self.client.get('/_snapshot', params={'since': int(rsp.headers['x-snapshot-seq']) + 1}).status_code, 410)
+
+        rsp = self.client.post('/_restore', content=snapshot)
+        self.assertEqual(rsp.status_code, 200)
+        self.assertTrue(rsp.json()['complete'])
+        self.assertEqual(rsp.json()['restored'], records[-1]['objects'])
+        self.assertEqual(self.client.get(f'/dataset/{self.dummy_oid}').json()['url'], 'http://loc.me/1')
+        self.assertEqual(self.client.get(f'/dataset/{self.dummy_oid}/secrets/backup_key').json(), 'backup_value')
+        self.client.delete(f'/dataset/{self.dummy_oid}/secrets/backup_key')
+
+        self.assertEqual(self.client.post('/_restore', content=gzip.compress(b'{"name": "x"}')).status_code, 400)
+
     # TODO test delete object, DO secrets disappear too? (currently they don't)
\ No newline at end of file
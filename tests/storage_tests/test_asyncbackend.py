@@ -0,0 +1,129 @@
+import asyncio
+import json
+import os
+import pathlib
+import shutil
+import time
+import unittest
+from collections import namedtuple
+
+from apiserver.storage import AsyncStorageAdapter, JsonFileStorageAdapter, LocationData, LocationDataType, QueryFilters
+from apiserver.storage.BulkTransfer import import_lines, iter_export, iter_lines
+
+
+class SlowAdapter(JsonFileStorageAdapter):
+    def get_details(self, n_type, oid):
+        time.sleep(0.2)
+        return super().get_details(n_type, oid)
+
+
+class AsyncTests(unittest.TestCase):
+    def setUp(self):
+        Settings = namedtuple('Settings', ['json_storage_path'])
+        self.test_config = Settings('/tmp/json_test/')
+        pathlib.Path(self.test_config.json_storage_path).mkdir(
+            parents=True, exist_ok=True)
+        self.inner = SlowAdapter(self.test_config)
+        self.store = AsyncStorageAdapter(self.inner, max_workers=2)
+
+    def tearDown(self):
+        self.store.shutdown()
+        if os.path.exists(self.test_config.json_storage_path):
+            shutil.rmtree(self.test_config.json_storage_path)
+
+    def test_calls(self):
+        async def run():
+            (oid, data) = await self.store.add_new(LocationDataType.DATASET, LocationData(name='test', url='u', metadata={'k': 'v'}), 'test_user')
+            self.assertEqual(await self.store.get_details(LocationDataType.DATASET, oid), data)
+            self.assertEqual(await self.store.query(LocationDataType.DATASET, QueryFilters(name='es')), [('test', oid)])
+            self.assertEqual(await self.store.get_key_counts(LocationDataType.DATASET), {'k': 1})
+            await self.store.add_update_secret(LocationDataType.DATASET, oid, 'key', 'value', 'test_user')
+            self.assertEqual(await self.store.get_secret(LocationDataType.DATASET, oid, 'key', 'test_user'), 'value')
+            await self.store.delete(LocationDataType.DATASET, oid, 'test_user')
+            with self.assertRaises(FileNotFoundError):
+                await self.store.get_details(LocationDataType.DATASET, oid)
+        asyncio.run(run())
+
+    def test_event_loop_not_blocked(self):
+        (oid, _) = self.inner.add_new(LocationDataType.DATASET, LocationData(name='test', url='u'), 'test_user')
+
+        async def run():
+            ticks = 0
+
+            async def tick():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            ticker = asyncio.ensure_future(tick())
+            start = time.monotonic()
+            await asyncio.gather(*[self.store.get_details(LocationDataType.DATASET, oid) for _ in range(4)])
+            elapsed = time.monotonic() - start
+            ticker.cancel()
+            return ticks, elapsed
+
+        ticks, elapsed = asyncio.run(run())
+        # the loop kept running while the calls were blocked
+        self.assertGreater(ticks, 10)
+        # two threads, so the four calls run in two rounds
+        self.assertGreaterEqual(elapsed, 0.4)
+        self.assertLess(elapsed, 0.8)
+
+    def test_iter_export(self):
+        store = AsyncStorageAdapter(JsonFileStorageAdapter(self.test_config), max_workers=2)
+        oids = [store.adapter.add_new(LocationDataType.DATASET, LocationData(name=f'obj{i}', url='u'), 'test_user')[0] for i in range(5)]
+
+        async def run():
+            found = []
+            async for chunk in iter_export(store, LocationDataType.DATASET, chunk_size=2):
+                found.extend((line['name'], line['oid']) for line in map(json.loads, chunk.splitlines()))
+                if len(found) == 2:
+                    # deleted while the export is running
+                    store.adapter.delete(LocationDataType.DATASET, oids[3], 'test_user')
+            return found
+
+        found = asyncio.run(run())
+        store.shutdown()
+        self.assertEqual(found, [(f'obj{i}', oids[i]) for i in (0, 1, 2, 4)])
+
+    def test_iter_lines(self):
+        async def chunks():
+            for chunk in (b'{"a"', b': 1}\n\n{"b": 2}\nxxxx', b'xxxx', b'xx\n{"c"', b': 3}'):
+                yield chunk
+
+        async def run():
+            return [line async for line in iter_lines(chunks(), max_length=8)]
+
+        self.assertEqual(asyncio.run(run()), [b'{"a": 1}', b'', b'{"b": 2}', None, b'{"c": 3}'])
+
+    def test_import_lines(self):
+        store = AsyncStorageAdapter(JsonFileStorageAdapter(self.test_config), max_workers=2)
+        store.adapter.add_new(LocationDataType.DATASET, LocationData(name='existing', url='old'), 'test_user')
+
+        async def lines(*values):
+            for value in values:
+                yield value
+
+        async def run():
+            created = await import_lines(store, LocationDataType.DATASET, lines(
+                b'{"name": "new", "url": "u"}', b'{"name": "broken"', b'{"name": "no url"}',
+                b'{"name": "existing", "url": "copy"}'), 'test_user', chunk_size=2)
+            upserted = await import_lines(store, LocationDataType.DATASET, lines(
+                b'{"name": "existing", "url": "updated"}', b'{"name": "twice", "url": "1"}',
+                b'{"name": "twice", "url": "2"}'), 'test_user', upsert=True)
+            return created, upserted
+
+        created, upserted = asyncio.run(run())
+        store.shutdown()
+        self.assertEqual((created.created, created.updated, created.failed), (2, 0, 2))
+        self.assertEqual([error.line for error in created.errors], [2, 3])
+        self.assertIn('url: field required', created.errors[1].error)
+        self.assertEqual((upserted.created, upserted.updated, upserted.failed), (1, 2, 0))
+        names = sorted(store.adapter.get_list(LocationDataType.DATASET))
+        self.assertEqual([name for name, _ in names], ['existing', 'existing', 'new', 'twice'])
+        # with two objects of the same name, either of them is updated
+        urls = sorted(store.adapter.get_details(LocationDataType.DATASET, o).url for name, o in names if name == 'existing')
+        self.assertIn(urls, (['copy', 'updated'], ['old', 'updated']))
+        twice = [o for name, o in names if name == 'twice'][0]
+        self.assertEqual(store.adapter.get_details(LocationDataType.DATASET, twice).url, '2')
@@ -0,0 +1,109 @@
+import json
+import os
+import pathlib
+import shutil
+import unittest
+from collections import namedtuple
+
+from apiserver.storage import LocationData, LocationDataType
+from apiserver.storage.CachedStorageAdapter import CachedStorageAdapter
+from apiserver.storage.JsonFileStorageAdapter import JsonFileStorageAdapter
+
+
+class CachedTests(unittest.TestCase):
+    def setUp(self):
+        Settings = namedtuple('Settings', ['json_storage_path'])
+        self.test_config = Settings('/tmp/json_test/')
+        pathlib.Path(self.test_config.json_storage_path).mkdir(
+            parents=True, exist_ok=True)
+
+        self.inner = JsonFileStorageAdapter(self.test_config)
+        self.store = CachedStorageAdapter(self.inner, max_entries=3)
+
+    def tearDown(self):
+        if os.path.exists(self.test_config.json_storage_path):
+            shutil.rmtree(self.test_config.json_storage_path)
+
+    def test_invalid_size(self):
+        self.assertRaises(ValueError, CachedStorageAdapter, self.inner, 0)
+
+    def test_write_through(self):
+        d = LocationData(name='bla', url='local')
+        (oid, _) = self.store.add_new(LocationDataType.DATASET, d, 'test_user')
+        self.assertEqual(self.inner.get_details(LocationDataType.DATASET, oid), d)
+
+        self.assertEqual(self.store.get_details(LocationDataType.DATASET, oid), d)
+        self.assertEqual(self.store.stats()['hits'], 1)
+        self.assertEqual(self.store.stats()['misses'], 0)
+
+        new_data = LocationData(name='blub', url='other', metadata={'key': 'value'})
+        self.store.update_details(LocationDataType.DATASET, oid, new_data, 'test_user')
+        self.assertEqual(self.inner.get_details(LocationDataType.DATASET, oid), new_data)
+        self.assertEqual(self.store.get_details(LocationDataType.DATASET, oid), new_data)
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [('blub', oid)])
+
+        self.store.delete(LocationDataType.DATASET, oid, 'test_user')
+        self.assertRaises(FileNotFoundError, self.store.get_details, LocationDataType.DATASET, oid)
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [])
+
+    def test_external_modification(self):
+        (oid, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name='bla', url='local'), 'test_user')
+        self.store.get_details(LocationDataType.DATASET, oid)
+
+        path = os.path.join(self.test_config.json_storage_path, LocationDataType.DATASET.value, oid)
+        with open(path, 'w') as f:
+            json.dump({'users': [], 'actualData': {'name': 'changed outside', 'url': 'somewhere else'}}, f)
+
+        self.assertEqual(self.store.get_details(LocationDataType.DATASET, oid).name, 'changed outside')
+        self.assertEqual(self.store.stats()['misses'], 1)
+
+        os.remove(path)
+        self.assertRaises(FileNotFoundError, self.store.get_details, LocationDataType.DATASET, oid)
+
+    def test_coarse_mtime(self):
+        (oid, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name='bla', url='local'), 'test_user')
+        self.store.get_details(LocationDataType.DATASET, oid)
+
+        # written past the cache, with the same size and modification time as before
+        path = os.path.join(self.test_config.json_storage_path, LocationDataType.DATASET.value, oid)
+        before = os.stat(path)
+        self.inner.update_details(LocationDataType.DATASET, oid, LocationData(name='blu', url='local'), 'test_user')
+        os.utime(path, ns=(before.st_atime_ns, before.st_mtime_ns))
+        self.assertEqual(os.stat(path).st_size, before.st_size)
+
+        self.assertEqual(self.store.get_details(LocationDataType.DATASET, oid).name, 'blu')
+
+    def test_lru_eviction(self):
+        oids = [self.store.add_new(LocationDataType.DATASET, LocationData(name=f'ds_{i}', url='local'), 'test_user')[0] for i in range(4)]
+        stats = self.store.stats()
+        self.assertEqual(stats['entries'], 3)
+        self.assertEqual(stats['evictions'], 1)
+
+        # first one was evicted, the others are still cached
+        self.store.get_details(LocationDataType.DATASET, oids[0])
+        self.assertEqual(self.store.stats()['misses'], 1)
+        self.store.get_details(LocationDataType.DATASET, oids[3])
+        self.assertEqual(self.store.stats()['hits'], 1)
+
+    def test_list(self):
+        for i in range(3):
+            self.store.add_new(LocationDataType.DATASET, LocationData(name=f'ds_{i}', url='local'), 'test_user')
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET),
+                         self.inner.get_list(LocationDataType.DATASET))
+
+    def test_secrets_passthrough(self):
+        (oid, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name='bla', url='local'), 'test_user')
+        self.store.add_update_secret(LocationDataType.DATASET, oid, 'key', 'value', 'test_user')
+        self.assertEqual(self.store.get_secret(LocationDataType.DATASET, oid, 'key', 'test_user'), 'value')
+        self.assertEqual(self.inner.list_secrets(LocationDataType.DATASET, oid, 'test_user'), ['key'])
+
+    def test_get_many(self):
+        oids = [self.inner.add_new(LocationDataType.DATASET, LocationData(name=f'ds_{i}', url='local'), 'test_user')[0] for i in range(2)]
+        self.store.get_details(LocationDataType.DATASET, oids[0])
+        hits = self.store.stats()['hits']
+
+        found = self.store.get_many(LocationDataType.DATASET, oids + ['missing'])
+        self.assertEqual(found, {oid: self.inner.get_details(LocationDataType.DATASET, oid) for oid in oids})
+        self.assertEqual(self.store.stats()['hits'], hits + 1)
+        self.store.get_many(LocationDataType.DATASET, oids)
+        self.assertEqual(self.store.stats()['hits'], hits + 3)
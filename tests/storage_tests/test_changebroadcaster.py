@@ -0,0 +1,80 @@
+import asyncio
+import os
+import pathlib
+import shutil
+import threading
+import unittest
+
+from apiserver.storage import (ChangeAction, ChangeBroadcaster, ChangeLog, LocationDataType,
+                               event_stream)
+
+
+class ChangeBroadcasterTests(unittest.TestCase):
+    def setUp(self):
+        self.base_dir = '/tmp/json_test/'
+        pathlib.Path(self.base_dir).mkdir(parents=True, exist_ok=True)
+        self.log = ChangeLog(os.path.join(self.base_dir, 'changes.log'))
+        self.broadcaster = ChangeBroadcaster(self.log, queue_size=3)
+
+    def tearDown(self):
+        self.broadcaster.close()
+        self.log.close()
+        if os.path.exists(self.base_dir):
+            shutil.rmtree(self.base_dir)
+
+    def record(self, *oids, n_type=LocationDataType.DATASET):
+        # the storage calls record their changes on the storage threads
+        thread = threading.Thread(target=self.log.record, args=(n_type, [(ChangeAction.CREATE, oid) for oid in oids]))
+        thread.start()
+        thread.join()
+
+    def test_fan_out(self):
+        async def run():
+            first = self.broadcaster.subscribe(LocationDataType.DATASET)
+            second = self.broadcaster.subscribe(LocationDataType.DATASET)
+            other = self.broadcaster.subscribe(LocationDataType.TEMPLATE)
+            self.record('a', 'b')
+            self.record('t', n_type=LocationDataType.TEMPLATE)
+            for subscription in (first, second):
+                self.assertEqual([(await subscription.get(1)).oid for _ in range(2)], ['a', 'b'])
+            self.assertEqual((await other.get(1)).oid, 't')
+            with self.assertRaises(asyncio.TimeoutError):
+                await first.get(0.05)
+            self.broadcaster.unsubscribe(second)
+            self.assertEqual(len(self.broadcaster), 2)
+        asyncio.run(run())
+
+    def test_drop_slow_consumer(self):
+        async def run():
+            slow = self.broadcaster.subscribe(LocationDataType.DATASET)
+            fast = self.broadcaster.subscribe(LocationDataType.DATASET)
+            for oid in ('a', 'b', 'c', 'd'):
+                self.record(oid)
+                await asyncio.sleep(0.01)
+                self.assertEqual((await fast.get(1)).oid, oid)
+            self.assertTrue(slow.dropped)
+            self.assertIsNone(await slow.get(1))
+            self.assertFalse(fast.dropped)
+            # dropped subscribers are removed on the next change
+            self.record('e')
+            self.assertEqual(len(self.broadcaster), 1)
+        asyncio.run(run())
+
+    def test_event_stream(self):
+        self.record('old', 'replayed')
+
+        async def run():
+            subscription = self.broadcaster.subscribe(LocationDataType.DATASET)
+            # changed after the subscription was taken, so it is replayed and also queued
+            self.record('both')
+            replay = self.log.changes(LocationDataType.DATASET, 1).changes
+            stream = event_stream(self.broadcaster, subscription, replay, heartbeat=0.05)
+            events = [await stream.__anext__() for _ in range(2)]
+            self.assertEqual(events[0].split("\n")[:2], ['id: 2', 'event: create'])
+            self.assertIn('"oid": "both"', events[1])
+            self.assertEqual(await stream.__anext__(), ": keep-alive\n\n")
+            self.record('live')
+            self.assertIn('"oid": "live"', await stream.__anext__())
+            await stream.aclose()
+            self.assertEqual(len(self.broadcaster), 0)
+        asyncio.run(run())
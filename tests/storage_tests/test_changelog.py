@@ -0,0 +1,93 @@
+import importlib
+import os
+import pathlib
+import shutil
+import unittest
+from collections import namedtuple
+from unittest import mock
+
+from apiserver.storage import (BatchOperation, ChangeAction, ChangeLog, ChangesExpired,
+                               ChangeTrackingStorageAdapter, JsonFileStorageAdapter,
+                               LocationData, LocationDataType)
+
+# the module, the package exports the class under the same name
+changelog_module = importlib.import_module('apiserver.storage.ChangeLog')
+
+
+def at(timestamp: float):
+    return mock.patch.object(changelog_module, 'time', mock.Mock(time=lambda: timestamp))
+
+
+class ChangeLogTests(unittest.TestCase):
+    def setUp(self):
+        Settings = namedtuple('Settings', ['json_storage_path'])
+        self.test_config = Settings('/tmp/json_test/')
+        pathlib.Path(self.test_config.json_storage_path).mkdir(parents=True, exist_ok=True)
+        self.path = os.path.join(self.test_config.json_storage_path, 'changes.log')
+        self.log = ChangeLog(self.path)
+        self.store = ChangeTrackingStorageAdapter(JsonFileStorageAdapter(self.test_config), self.log)
+
+    def tearDown(self):
+        self.log.close()
+        if os.path.exists(self.test_config.json_storage_path):
+            shutil.rmtree(self.test_config.json_storage_path)
+
+    def actions(self, feed):
+        return [(change.action, change.oid) for change in feed.changes]
+
+    def test_record_changes(self):
+        start = self.log.changes(LocationDataType.DATASET).last_seq
+        (oid, data) = self.store.add_new(LocationDataType.DATASET, LocationData(name='one', url='u'), 'test_user')
+        self.store.add_new(LocationDataType.TEMPLATE, LocationData(name='template', url='u'), 'test_user')
+        self.store.update_details(LocationDataType.DATASET, oid, data, 'test_user')
+        self.store.add_update_secret(LocationDataType.DATASET, oid, 'key', 'value', 'test_user')
+        results = self.store.apply_batch(LocationDataType.DATASET, [BatchOperation(action='create', data=data)], 'test_user')
+        self.store.delete_many(LocationDataType.DATASET, [oid, 'missing'], 'test_user')
+
+        feed = self.log.changes(LocationDataType.DATASET, start)
+        self.assertEqual(self.actions(feed), [(ChangeAction.CREATE, oid), (ChangeAction.UPDATE, oid),
+                                              (ChangeAction.SECRETS, oid), (ChangeAction.CREATE, results[0][0]),
+                                              (ChangeAction.DELETE, oid)])
+        self.assertEqual(feed.last_seq, start + 6)
+        self.assertEqual([c.seq for c in feed.changes], [start + 1, start + 3, start + 4, start + 5, start + 6])
+
+        page = self.log.changes(LocationDataType.DATASET, start, limit=2)
+        self.assertEqual(page.last_seq, start + 3)
+        self.assertEqual(self.actions(self.log.changes(LocationDataType.DATASET, page.last_seq, limit=2))[0],
+                         (ChangeAction.SECRETS, oid))
+        self.assertEqual(self.log.changes(LocationDataType.DATASET, feed.last_seq).changes, [])
+
+    def test_reload(self):
+        self.store.add_new(LocationDataType.DATASET, LocationData(name='one', url='u'), 'test_user')
+        self.log.close()
+        with open(self.path, 'a') as f:
+            f.write('{"seq": 99, "type": "dat')
+        self.log = ChangeLog(self.path)
+        self.assertEqual(self.log.seq, 1)
+        self.log.record(LocationDataType.DATASET, [(ChangeAction.DELETE, 'oid')])
+        self.log.close()
+        self.log = ChangeLog(self.path)
+        self.assertEqual(self.actions(self.log.changes(LocationDataType.DATASET, 0))[1], (ChangeAction.DELETE, 'oid'))
+
+    def test_retention(self):
+        self.log.retention = 10
+        with at(1000.0):
+            self.log.record(LocationDataType.DATASET, [(ChangeAction.CREATE, 'old')])
+        with at(1005.0):
+            self.log.record(LocationDataType.DATASET, [(ChangeAction.CREATE, 'new')])
+        with at(1012.0):
+            self.assertRaises(ChangesExpired, self.log.changes, LocationDataType.DATASET, 0)
+            self.assertEqual(self.actions(self.log.changes(LocationDataType.DATASET, 1)), [(ChangeAction.CREATE, 'new')])
+        self.assertRaises(ChangesExpired, self.log.changes, LocationDataType.DATASET, 3)
+
+    def test_compaction(self):
+        self.log.retention = 0
+        with mock.patch.object(changelog_module, 'COMPACT_SLACK', 5):
+            for i in range(12):
+                self.log.record(LocationDataType.DATASET, [(ChangeAction.CREATE, str(i))])
+        with open(self.path) as f:
+            self.assertLess(len(f.readlines()), 8)
+        self.log.close()
+        self.log = ChangeLog(self.path)
+        self.assertEqual(self.log.seq, 12)
+        self.assertRaises(ChangesExpired, self.log.changes, LocationDataType.DATASET, 0)
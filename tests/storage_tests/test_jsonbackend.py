@@ -1,7 +1,10 @@
+import threading
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-from apiserver.storage.JsonFileStorageAdapter import JsonFileStorageAdapter, StoredData, get_unique_id
-from apiserver.storage import LocationDataType, LocationData
+from apiserver.storage.JsonFileStorageAdapter import STORAGE_FORMAT_VERSION, JsonFileStorageAdapter, StoredData, decode_stored, get_unique_id, iter_stored_objects, migrate_layout
+from apiserver.storage import BatchOperation, LocationDataType, LocationData, QueryFilters
 from collections import namedtuple
 import os
 import pathlib
@@ -152,3 +155,215 @@ class SomeTests(unittest.TestCase):
         self.secret_oid = self.store.add_new(self.secret_type, LocationData(name="secrets_test", url="secrets_url"), "")[0]
         self.assertRaises(HTTPException, self.store.delete_secret, self.secret_type, self.secret_oid, "somekey", "")
         self.store.delete(self.secret_type, self.secret_oid, "")
+
+    def test_concurrent_secrets(self):
+        (oid, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name='shared', url='u'), 'test_user')
+
+        def add(thread):
+            for i in range(50):
+                self.store.add_update_secret(LocationDataType.DATASET, oid, f'key {thread} {i}', 'value', 'test_user')
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for future in [executor.submit(add, thread) for thread in range(8)]:
+                future.result()
+        self.assertEqual(len(self.store.list_secrets(LocationDataType.DATASET, oid, 'test_user')), 400)
+
+    def test_update_races_delete(self):
+        oids = [self.store.add_new(LocationDataType.DATASET, LocationData(name=f'race {i}', url='u'), 'test_user')[0]
+                for i in range(50)]
+
+        def update(oid):
+            for i in range(5):
+                try:
+                    self.store.update_details(LocationDataType.DATASET, oid, LocationData(name=f'updated {i}', url='u'), 'test_user')
+                    self.store.apply_batch(LocationDataType.DATASET, [BatchOperation(action='update', oid=oid, data=LocationData(name='batch', url='u'))], 'test_user')
+                    self.store.add_update_secret(LocationDataType.DATASET, oid, f'key {i}', 'value', 'test_user')
+                except (FileNotFoundError, HTTPException):
+                    return
+
+        def delete(oid):
+            self.store.delete(LocationDataType.DATASET, oid, 'test_user')
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = [executor.submit(update, oid) for oid in oids] + [executor.submit(delete, oid) for oid in oids]
+            for future in futures:
+                future.result()
+        # an update that loses against the delete must not bring the object back
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [])
+        self.assertEqual(self.store.query(LocationDataType.DATASET, QueryFilters(search='updated')), [])
+        self.assertEqual(os.listdir(os.path.join(self.test_config.json_storage_path, LocationDataType.DATASET.value)), [])
+
+    def test_writes_during_index_build(self):
+        (kept, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name='kept', url='u'), 'test_user')
+        (gone, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name='gone', url='u'), 'test_user')
+        started, release = threading.Event(), threading.Event()
+        get_details = self.store.get_details
+
+        def slow_get_details(n_type, oid):
+            started.set()
+            release.wait(5)
+            return get_details(n_type, oid)
+
+        with mock.patch.object(self.store, 'get_details', side_effect=slow_get_details):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                build = executor.submit(self.store.query, LocationDataType.DATASET, QueryFilters(search='e'))
+                self.assertTrue(started.wait(5))
+
+                def write():
+                    self.store.update_details(LocationDataType.DATASET, kept,
+                                              LocationData(name='renamed', url='u', metadata={'k': 'v'}), 'test_user')
+                    self.store.delete(LocationDataType.DATASET, gone, 'test_user')
+                    return self.store.add_new(LocationDataType.DATASET, LocationData(name='fresh', url='u'), 'test_user')[0]
+
+                # the writes do not wait for the build
+                fresh = executor.submit(write).result(timeout=5)
+                release.set()
+                build.result()
+
+        self.assertEqual(self.store.query(LocationDataType.DATASET, QueryFilters(search='renamed')), [('renamed', kept)])
+        self.assertEqual(self.store.query(LocationDataType.DATASET, QueryFilters(search='fresh')), [('fresh', fresh)])
+        self.assertEqual(self.store.query(LocationDataType.DATASET, QueryFilters(search='gone')), [])
+        self.assertEqual(self.store.query(LocationDataType.DATASET, QueryFilters(search='kept')), [])
+        self.assertEqual(self.store.match_keys(LocationDataType.DATASET, ['k']), {kept})
+
+    def test_sharded_layout(self):
+        Settings = namedtuple('Settings', ['json_storage_path', 'shard_depth'])
+        store = JsonFileStorageAdapter(Settings(self.test_config.json_storage_path, 2))
+        (oid, data) = store.add_new(LocationDataType.DATASET, LocationData(name='sharded', url='local'), 'test_user')
+        store.add_update_secret(LocationDataType.DATASET, oid, 'key', 'value', 'test_user')
+        path = os.path.join(self.test_config.json_storage_path, LocationDataType.DATASET.value, oid[:2], oid[2:4], oid)
+        self.assertTrue(os.path.isfile(path))
+        self.assertTrue(os.path.isfile(path + '.secrets'))
+        self.assertEqual(store.get_details(LocationDataType.DATASET, oid), data)
+
+        shutil.rmtree(os.path.join(self.test_config.json_storage_path, '_index'))
+        store = JsonFileStorageAdapter(Settings(self.test_config.json_storage_path, 2))
+        self.assertEqual(store.get_list(LocationDataType.DATASET), [('sharded', oid)])
+        store.delete(LocationDataType.DATASET, oid, 'test_user')
+        self.assertFalse(os.path.exists(path + '.secrets'))
+
+    def test_migrate_layout(self):
+        (oid, data) = self.store.add_new(LocationDataType.DATASET, LocationData(name='flat', url='local'), 'test_user')
+        self.store.add_update_secret(LocationDataType.DATASET, oid, 'key', 'value', 'test_user')
+        Settings = namedtuple('Settings', ['json_storage_path', 'shard_depth'])
+        store = JsonFileStorageAdapter(Settings(self.test_config.json_storage_path, 1))
+        self.assertEqual(store.get_details(LocationDataType.DATASET, oid), data)
+
+        self.assertEqual(migrate_layout(self.test_config.json_storage_path, LocationDataType.DATASET, 1), 1)
+        self.assertEqual(migrate_layout(self.test_config.json_storage_path, LocationDataType.DATASET, 1), 0)
+        local_path = os.path.join(self.test_config.json_storage_path, LocationDataType.DATASET.value)
+        self.assertFalse(os.path.exists(os.path.join(local_path, oid)))
+        self.assertTrue(os.path.isfile(os.path.join(local_path, oid[:2], oid + '.secrets')))
+        self.assertEqual(store.get_details(LocationDataType.DATASET, oid), data)
+        self.assertEqual(store.get_secret(LocationDataType.DATASET, oid, 'key', ''), 'value')
+        self.assertEqual([o for o, *_ in iter_stored_objects(self.test_config.json_storage_path, LocationDataType.DATASET)], [oid])
+
+    def test_migrate_interrupted(self):
+        (oid, data) = self.store.add_new(LocationDataType.DATASET, LocationData(name='flat', url='local'), 'test_user')
+        self.store.add_update_secret(LocationDataType.DATASET, oid, 'key', 'value', 'test_user')
+        local_path = os.path.join(self.test_config.json_storage_path, LocationDataType.DATASET.value)
+        # object already linked into the new layout, secrets not yet
+        os.mkdir(os.path.join(local_path, oid[:2]))
+        os.link(os.path.join(local_path, oid), os.path.join(local_path, oid[:2], oid))
+        Settings = namedtuple('Settings', ['json_storage_path', 'shard_depth'])
+        store = JsonFileStorageAdapter(Settings(self.test_config.json_storage_path, 1))
+        self.assertEqual(store.get_secret(LocationDataType.DATASET, oid, 'key', ''), 'value')
+
+        self.assertEqual(migrate_layout(self.test_config.json_storage_path, LocationDataType.DATASET, 1), 1)
+        self.assertEqual(store.get_list(LocationDataType.DATASET), [('flat', oid)])
+        self.assertEqual(store.get_secret(LocationDataType.DATASET, oid, 'key', ''), 'value')
+
+    def test_migrate_while_writing(self):
+        Settings = namedtuple('Settings', ['json_storage_path', 'shard_depth'])
+        local_path = os.path.join(self.test_config.json_storage_path, LocationDataType.DATASET.value)
+        writes = {
+            'update': lambda store, oid: store.update_details(LocationDataType.DATASET, oid, LocationData(name='new', url='u'), ''),
+            'secret': lambda store, oid: store.add_update_secret(LocationDataType.DATASET, oid, 'other', 'value', ''),
+            'delete': lambda store, oid: store.delete(LocationDataType.DATASET, oid, '')
+        }
+        for action, write in writes.items():
+            (oid, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name='flat', url='u'), 'test_user')
+            self.store.add_update_secret(LocationDataType.DATASET, oid, 'key', 'value', 'test_user')
+            store = JsonFileStorageAdapter(Settings(self.test_config.json_storage_path, 1))
+            commit = store.wal.commit
+
+            def migrate_first(ops):
+                # the migration moves the object after the server has looked it up
+                migrate_layout(self.test_config.json_storage_path, LocationDataType.DATASET, 1)
+                commit(ops)
+            with mock.patch.object(store.wal, 'commit', side_effect=migrate_first):
+                write(store, oid)
+            store.wal.close()
+
+            self.assertFalse(os.path.exists(os.path.join(local_path, oid)), action)
+            self.assertFalse(os.path.exists(os.path.join(local_path, oid + '.secrets')), action)
+            self.assertEqual(migrate_layout(self.test_config.json_storage_path, LocationDataType.DATASET, 1), 0)
+            store = JsonFileStorageAdapter(Settings(self.test_config.json_storage_path, 1))
+            if action == 'delete':
+                self.assertFalse(os.path.exists(os.path.join(local_path, oid[:2], oid)))
+                self.assertFalse(os.path.exists(os.path.join(local_path, oid[:2], oid + '.secrets')))
+            else:
+                self.assertEqual(store.get_details(LocationDataType.DATASET, oid).name, 'new' if action == 'update' else 'flat')
+                self.assertEqual(store.get_secret(LocationDataType.DATASET, oid, 'key', ''), 'value')
+                store.delete(LocationDataType.DATASET, oid, '')
+            store.wal.close()
+
+    def test_migrate_after_update(self):
+        (oid, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name='flat', url='local'), 'test_user')
+        local_path = os.path.join(self.test_config.json_storage_path, LocationDataType.DATASET.value)
+        # interrupted after linking the object, which the server then updates in the new place
+        os.mkdir(os.path.join(local_path, oid[:2]))
+        os.link(os.path.join(local_path, oid), os.path.join(local_path, oid[:2], oid))
+        Settings = namedtuple('Settings', ['json_storage_path', 'shard_depth'])
+        store = JsonFileStorageAdapter(Settings(self.test_config.json_storage_path, 1))
+        store.update_details(LocationDataType.DATASET, oid, LocationData(name='new', url='u'), 'test_user')
+
+        self.assertEqual(migrate_layout(self.test_config.json_storage_path, LocationDataType.DATASET, 1), 1)
+        self.assertFalse(os.path.exists(os.path.join(local_path, oid)))
+        self.assertEqual(store.get_details(LocationDataType.DATASET, oid).name, 'new')
+        self.assertEqual([o for o, *_ in iter_stored_objects(self.test_config.json_storage_path, LocationDataType.DATASET)], [oid])
+
+    def test_delete_many(self):
+        oids = [self.store.add_new(LocationDataType.DATASET, LocationData(name=f'bulk{i}', url='local'), 'test_user')[0] for i in range(3)]
+        self.store.add_update_secret(LocationDataType.DATASET, oids[0], 'key', 'value', 'test_user')
+        syncs = self.store.wal.syncs
+
+        deleted = self.store.delete_many(LocationDataType.DATASET, [oids[0], 'missing', oids[1], oids[0]], 'test_user')
+        self.assertEqual(deleted, oids[:2])
+        self.assertEqual(self.store.wal.syncs, syncs + 1)
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [('bulk2', oids[2])])
+        self.assertRaises(FileNotFoundError, self.store.get_details, LocationDataType.DATASET, oids[0])
+        local_path = os.path.join(self.test_config.json_storage_path, LocationDataType.DATASET.value)
+        self.assertFalse(os.path.exists(os.path.join(local_path, oids[0] + '.secrets')))
+        self.assertEqual(self.store.delete_many(LocationDataType.DATASET, ['missing'], 'test_user'), [])
+
+    def test_trusted_read(self):
+        (oid, data) = self.store.add_new(LocationDataType.DATASET, LocationData(name='trusted', url='local', metadata={'k': 'v'}), 'test_user')
+        path = os.path.join(self.test_config.json_storage_path, LocationDataType.DATASET.value, oid)
+        with open(path) as f:
+            self.assertEqual(json.load(f)['formatVersion'], STORAGE_FORMAT_VERSION)
+        self.assertEqual(self.store.get_details(LocationDataType.DATASET, oid), data)
+
+        # objects of the current version are not validated again, others and strict reads are
+        raw = json.dumps({'actualData': {'name': 'n', 'url': 'u', 'metadata': {'k': 1}}, 'users': ['u'], 'formatVersion': STORAGE_FORMAT_VERSION})
+        self.assertEqual(decode_stored(raw).actualData.metadata, {'k': 1})
+        self.assertEqual(decode_stored(raw, strict=True).actualData.metadata, {'k': '1'})
+        legacy = json.dumps({'actualData': {'name': 'n', 'url': 'u', 'metadata': {'k': 1}}, 'users': ['u']})
+        self.assertEqual(decode_stored(legacy).actualData.metadata, {'k': '1'})
+        self.assertEqual(decode_stored(legacy).formatVersion, STORAGE_FORMAT_VERSION)
+        for invalid in ('{"actualData": {"name": "n"}, "users": [], "formatVersion": 1}', '{"actualData": {"name": "n"}', '[]'):
+            self.assertRaises(ValueError, decode_stored, invalid)
+
+    def test_export_import(self):
+        (oid, data) = self.store.add_new(LocationDataType.DATASET, LocationData(name='exported', url='u', metadata={'k': 'v'}), 'owner')
+        self.store.add_update_secret(LocationDataType.DATASET, oid, 'key', 'value', 'owner')
+        exported = self.store.export_object(LocationDataType.DATASET, oid)
+        self.assertEqual(exported, (data, ['owner'], {'key': 'value'}))
+
+        new_oid = '00000000-0000-4000-8000-000000000000'
+        changed = LocationData(name='changed', url='v')
+        self.assertEqual(self.store.import_objects(LocationDataType.DATASET, [(oid, changed, ['other'], {}), (new_oid, *exported)]), 2)
+        self.assertEqual(self.store.export_object(LocationDataType.DATASET, oid), (changed, ['other'], {}))
+        self.assertEqual(self.store.export_object(LocationDataType.DATASET, new_oid), exported)
+        self.assertEqual(sorted(self.store.get_list(LocationDataType.DATASET)), [('changed', oid), ('exported', new_oid)])
+        self.assertRaises(ValueError, self.store.import_objects, LocationDataType.DATASET, [('../escape', changed, [], {})])
@@ -0,0 +1,40 @@
+import unittest
+
+from apiserver.storage import LocationData
+from apiserver.storage.MetadataKeyIndex import MetadataKeyIndex
+
+
+class MetadataKeyIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.index = MetadataKeyIndex()
+        self.index.add('1', LocationData(name='a', url='u', metadata={'site': 'jsc', 'format': 'nc'}))
+        self.index.add('2', LocationData(name='b', url='u', metadata={'site': 'bsc'}))
+        self.index.add('3', LocationData(name='c', url='u'))
+
+    def test_query(self):
+        self.assertEqual(self.index.query(['site']), {'1', '2'})
+        self.assertEqual(self.index.query(['site', 'format']), {'1'})
+        self.assertEqual(self.index.query(['format', 'unknown']), set())
+        self.assertEqual(self.index.query([]), {'1', '2', '3'})
+
+    def test_cardinalities(self):
+        self.assertEqual(self.index.cardinalities(), {'site': 2, 'format': 1})
+
+    def test_facets(self):
+        self.index.add('4', LocationData(name='d', url='u', metadata={'site': 'jsc'}))
+        self.assertEqual(self.index.facets(['site', 'unknown']), {'site': {'jsc': 2, 'bsc': 1}, 'unknown': {}})
+        self.assertEqual(self.index.facets(['site', 'format'], within={'1', '2', '3'}),
+                         {'site': {'jsc': 1, 'bsc': 1}, 'format': {'nc': 1}})
+
+        self.index.add('4', LocationData(name='d', url='u', metadata={'site': 'bsc'}))
+        self.index.remove('1')
+        self.assertEqual(self.index.facets(['site', 'format']), {'site': {'bsc': 2}, 'format': {}})
+
+    def test_update_and_remove(self):
+        self.index.add('1', LocationData(name='a', url='u', metadata={'project': 'x'}))
+        self.assertEqual(self.index.cardinalities(), {'site': 1, 'project': 1})
+
+        self.index.remove('2')
+        self.index.remove('2')
+        self.assertEqual(self.index.cardinalities(), {'project': 1})
+        self.assertEqual(self.index.query(['site']), set())
@@ -0,0 +1,143 @@
+import os
+import pathlib
+import shutil
+import unittest
+from collections import namedtuple
+from unittest import mock
+
+from apiserver.storage import LocationData, LocationDataType
+from apiserver.storage.JsonFileStorageAdapter import JsonFileStorageAdapter
+from apiserver.storage.NameIndex import NameIndex
+
+
+class NameIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.index_dir = '/tmp/index_test/'
+        pathlib.Path(self.index_dir).mkdir(parents=True, exist_ok=True)
+        self.existing = {}
+
+    def tearDown(self):
+        if os.path.exists(self.index_dir):
+            shutil.rmtree(self.index_dir)
+
+    def new_index(self, compact_after=1000):
+        index = NameIndex(self.index_dir, 'dataset', compact_after)
+        index.load(lambda: list(self.existing), self.existing.get)
+        return index
+
+    def test_sorted_entries(self):
+        index = self.new_index()
+        index.put('2', 'b')
+        index.put('1', 'b')
+        index.put('3', 'a')
+        self.assertEqual(index.entries(), [('a', '3'), ('b', '1'), ('b', '2')])
+
+        index.put('3', 'c')
+        index.remove('1')
+        self.assertEqual(index.entries(), [('b', '2'), ('c', '3')])
+        self.assertEqual(index.get('3'), 'c')
+        self.assertIsNone(index.get('1'))
+
+    def test_journal_replay(self):
+        index = self.new_index()
+        for i in range(5):
+            self.existing[str(i)] = f'name_{i}'
+            index.put(str(i), f'name_{i}')
+        del self.existing['0']
+        index.remove('0')
+
+        reloaded = self.new_index()
+        self.assertEqual(reloaded.entries(), index.entries())
+        self.assertEqual(reloaded.generation, index.generation)
+
+    def test_remove_many(self):
+        index = self.new_index()
+        for i in range(5):
+            self.existing[str(i)] = f'name_{i}'
+            index.put(str(i), f'name_{i}')
+        generation = index.generation
+        for oid in ('1', '3'):
+            del self.existing[oid]
+        index.remove_many(['1', '3', 'missing'])
+        self.assertEqual(index.entries(), [('name_0', '0'), ('name_2', '2'), ('name_4', '4')])
+        self.assertEqual(index.generation, generation + 1)
+
+        reloaded = self.new_index()
+        self.assertEqual(reloaded.entries(), index.entries())
+        self.assertEqual(reloaded.generation, index.generation)
+
+    def test_compaction(self):
+        index = self.new_index(compact_after=3)
+        for i in range(7):
+            self.existing[str(i)] = f'name_{i}'
+            index.put(str(i), f'name_{i}')
+        with open(index.journal_path) as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+        reloaded = self.new_index()
+        self.assertEqual(len(reloaded), 7)
+        self.assertEqual(reloaded.generation, 7)
+
+    def test_sync(self):
+        index = self.new_index()
+        with mock.patch('apiserver.storage.NameIndex.fsync_path') as fsync_path:
+            index.put('1', 'one')
+            index.sync()
+            self.assertIn(mock.call(index.journal_path), fsync_path.call_args_list)
+            fsync_path.reset_mock()
+            # nothing appended since
+            index.sync()
+            fsync_path.assert_not_called()
+
+            index.compact()
+            fsync_path.assert_called_with(self.index_dir.rstrip('/'))
+
+    def test_reconcile(self):
+        index = self.new_index()
+        self.existing['1'] = 'one'
+        index.put('1', 'one')
+        index.put('2', 'two')
+        self.existing['3'] = 'three'
+
+        reloaded = self.new_index()
+        self.assertEqual(reloaded.entries(), [('one', '1'), ('three', '3')])
+        self.assertGreater(reloaded.generation, index.generation)
+
+    def test_damaged_journal(self):
+        index = self.new_index()
+        self.existing['1'] = 'one'
+        index.put('1', 'one')
+        with open(index.journal_path, 'a') as f:
+            f.write('{"op": "put", "oid"')
+
+        reloaded = self.new_index()
+        self.assertEqual(reloaded.entries(), [('one', '1')])
+
+
+class JsonIndexTests(unittest.TestCase):
+    def setUp(self):
+        Settings = namedtuple('Settings', ['json_storage_path'])
+        self.test_config = Settings('/tmp/json_test/')
+        pathlib.Path(self.test_config.json_storage_path).mkdir(
+            parents=True, exist_ok=True)
+
+    def tearDown(self):
+        if os.path.exists(self.test_config.json_storage_path):
+            shutil.rmtree(self.test_config.json_storage_path)
+
+    def test_restart(self):
+        store = JsonFileStorageAdapter(self.test_config)
+        oids = [store.add_new(LocationDataType.DATASET, LocationData(name=f'ds_{i}', url='local'), 'test_user')[0] for i in range(3)]
+        store.update_details(LocationDataType.DATASET, oids[0], LocationData(name='renamed', url='local'), 'test_user')
+        store.delete(LocationDataType.DATASET, oids[1], 'test_user')
+
+        restarted = JsonFileStorageAdapter(self.test_config)
+        self.assertEqual(restarted.get_list(LocationDataType.DATASET), [('ds_2', oids[2]), ('renamed', oids[0])])
+
+    def test_existing_data_without_index(self):
+        store = JsonFileStorageAdapter(self.test_config)
+        (oid, _) = store.add_new(LocationDataType.DATASET, LocationData(name='old', url='local'), 'test_user')
+        shutil.rmtree(os.path.join(self.test_config.json_storage_path, '_index'))
+
+        restarted = JsonFileStorageAdapter(self.test_config)
+        self.assertEqual(restarted.get_list(LocationDataType.DATASET), [('old', oid)])
@@ -0,0 +1,107 @@
+import os
+import pathlib
+import shutil
+import unittest
+from collections import Counter, namedtuple
+
+from apiserver.storage import LocationData, LocationDataType, QueryFilters, QueryPage
+from apiserver.storage.JsonFileStorageAdapter import JsonFileStorageAdapter
+
+
+class ScanningAdapter(JsonFileStorageAdapter):
+    """ uses the default single-pass query and counts the loaded objects"""
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.loaded = Counter()
+
+    def filter_natively(self, n_type, filters):
+        return None, filters
+
+    def get_details(self, n_type, oid):
+        self.loaded[oid] += 1
+        return super().get_details(n_type, oid)
+
+
+class QueryTests(unittest.TestCase):
+    def setUp(self):
+        Settings = namedtuple('Settings', ['json_storage_path'])
+        self.test_config = Settings('/tmp/json_test/')
+        pathlib.Path(self.test_config.json_storage_path).mkdir(
+            parents=True, exist_ok=True)
+        self.store = JsonFileStorageAdapter(self.test_config)
+        for i in range(4):
+            for j in range(4):
+                metadata = {'i': str(i)}
+                if j % 2:
+                    metadata['odd'] = 'Yes'
+                self.store.add_new(LocationDataType.DATASET,
+                                   LocationData(name=f'Set {i} {j}', url=f'http://site{i}.eu/', metadata=metadata), 'test_user')
+        self.scanning = ScanningAdapter(self.test_config)
+        self.filters = [
+            QueryFilters(),
+            QueryFilters(name='set 1'),
+            QueryFilters(url='SITE2'),
+            QueryFilters(has_key=['odd']),
+            QueryFilters(has_key=['odd', 'i'], search='yes'),
+            QueryFilters(name='1', url='site', search='3'),
+            QueryFilters(search='nothing'),
+            QueryFilters(has_key=['missing'], search='set')
+        ]
+
+    def tearDown(self):
+        if os.path.exists(self.test_config.json_storage_path):
+            shutil.rmtree(self.test_config.json_storage_path)
+
+    def test_native_same_as_scan(self):
+        for filters in self.filters:
+            self.assertEqual(self.store.query(LocationDataType.DATASET, filters),
+                             self.scanning.query(LocationDataType.DATASET, filters), f"{filters}")
+
+    def test_count(self):
+        for filters in self.filters:
+            expected = len(self.store.query(LocationDataType.DATASET, filters))
+            self.assertEqual(self.store.count(LocationDataType.DATASET, filters), expected, f"{filters}")
+            self.assertEqual(self.scanning.count(LocationDataType.DATASET, filters), expected, f"{filters}")
+        self.assertEqual(self.store.count(LocationDataType.TEMPLATE), 0)
+
+    def test_facets(self):
+        for filters in self.filters:
+            self.assertEqual(self.store.get_facets(LocationDataType.DATASET, ['i', 'odd', 'missing'], filters),
+                             self.scanning.get_facets(LocationDataType.DATASET, ['i', 'odd', 'missing'], filters), f"{filters}")
+        self.assertEqual(self.store.get_facets(LocationDataType.DATASET, ['odd']), {'odd': {'Yes': 8}})
+        self.assertEqual(self.store.get_facets(LocationDataType.DATASET, ['i'], QueryFilters(url='site2')), {'i': {'2': 4}})
+
+    def test_single_pass(self):
+        self.scanning.query(LocationDataType.DATASET, QueryFilters(url='site', has_key=['i'], search='set'))
+        self.assertEqual(len(self.scanning.loaded), 16)
+        self.assertEqual(max(self.scanning.loaded.values()), 1)
+
+        # name is checked on the listing, only the matching objects are loaded
+        self.scanning.loaded.clear()
+        self.scanning.query(LocationDataType.DATASET, QueryFilters(name='set 2', search='site'))
+        self.assertEqual(sum(self.scanning.loaded.values()), 4)
+
+    def test_sorted_pages(self):
+        everything = self.store.query(LocationDataType.DATASET)
+        self.assertEqual(everything, sorted(everything))
+        self.assertEqual(everything[0][0], 'Set 0 0')
+
+        page = self.store.query(LocationDataType.DATASET, page=QueryPage(number=2, size=5))
+        self.assertEqual(page, everything[5:10])
+        page = self.store.query(LocationDataType.DATASET, page=QueryPage(number=4, size=5))
+        self.assertEqual(page, everything[15:])
+        page = self.store.query(LocationDataType.DATASET, page=QueryPage(number=5, size=5))
+        self.assertEqual(page, [])
+
+    def test_keyset_pages(self):
+        everything = self.store.query(LocationDataType.DATASET)
+        for store in (self.store, self.scanning):
+            page = store.query(LocationDataType.DATASET, page=QueryPage(size=3, after=everything[4]))
+            self.assertEqual(page, everything[5:8])
+            page = store.query(LocationDataType.DATASET, page=QueryPage(number=2, size=3, after=everything[4]))
+            self.assertEqual(page, everything[8:11])
+            page = store.query(LocationDataType.DATASET, QueryFilters(has_key=['odd']), page=QueryPage(size=3, after=everything[4]))
+            self.assertEqual(page, [entry for entry in everything[5:] if entry[0][-1] in '13'][:3])
+            self.assertEqual(store.list_sorted(LocationDataType.DATASET, everything[-1]), [])
+            self.assertEqual(store.list_sorted(LocationDataType.DATASET, limit=2), everything[:2])
@@ -0,0 +1,233 @@
+import os
+import pathlib
+import shutil
+import threading
+import unittest
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from cryptography.fernet import Fernet
+from fastapi.exceptions import HTTPException
+
+from apiserver.storage import BatchOperation, LocationData, LocationDataType, QueryFilters
+from apiserver.storage.SegmentStorageAdapter import EncryptedSegmentStorageAdapter, SegmentStorageAdapter
+
+
+class SegmentTests(unittest.TestCase):
+    def setUp(self):
+        Settings = namedtuple('Settings', ['json_storage_path', 'segment_size', 'compaction_interval', 'encryption_key'])
+        self.test_config = Settings('/tmp/json_test/', 1024, 0, Fernet.generate_key())
+        pathlib.Path(self.test_config.json_storage_path).mkdir(
+            parents=True, exist_ok=True)
+        self.store = SegmentStorageAdapter(self.test_config)
+        self.segment_dir = os.path.join(self.test_config.json_storage_path, '_segments')
+
+    def tearDown(self):
+        self.store.close()
+        if os.path.exists(self.test_config.json_storage_path):
+            shutil.rmtree(self.test_config.json_storage_path)
+
+    def reopen(self):
+        self.store.close()
+        self.store = SegmentStorageAdapter(self.test_config)
+
+    def test_not_path(self):
+        Settings = namedtuple('Settings', ['json_storage_path', 'segment_path'])
+        self.assertRaises(Exception, SegmentStorageAdapter, Settings('/tmp/json_test/', '/tmp/json_test/blah/segments'))
+
+    def test_add_get_update_delete(self):
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [])
+        l_data = LocationData(name='test1', url='http://n.go', metadata={'key': 'value'})
+        (oid, data) = self.store.add_new(LocationDataType.DATASET, l_data, 'test_user')
+        self.assertEqual(l_data, data)
+        self.assertEqual(self.store.get_details(LocationDataType.DATASET, oid), l_data)
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [('test1', oid)])
+        version = self.store.get_version(LocationDataType.DATASET, oid)
+
+        new_data = LocationData(name='test2', url='http://go.n')
+        self.assertEqual(self.store.update_details(LocationDataType.DATASET, oid, new_data, 'tst2'), (oid, new_data))
+        self.assertEqual(self.store.get_details(LocationDataType.DATASET, oid), new_data)
+        self.assertNotEqual(self.store.get_version(LocationDataType.DATASET, oid), version)
+
+        self.store.delete(LocationDataType.DATASET, oid, 'test_user')
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [])
+        self.assertRaises(FileNotFoundError, self.store.get_details, LocationDataType.DATASET, oid)
+        self.assertRaises(FileNotFoundError, self.store.delete, LocationDataType.DATASET, oid, 'test_user')
+        self.assertRaises(FileNotFoundError, self.store.update_details, LocationDataType.DATASET, oid, new_data, 'test_user')
+
+    def test_secrets(self):
+        (oid, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name='secrets_test', url='secrets_url'), '')
+        self.assertEqual(self.store.list_secrets(LocationDataType.DATASET, oid, ''), [])
+        self.store.add_update_secret(LocationDataType.DATASET, oid, 'key', 'val', '')
+        self.store.add_update_secret(LocationDataType.DATASET, oid, 'key', 'val2', '')
+        self.assertEqual(self.store.get_secret_values(LocationDataType.DATASET, oid, ''), {'key': 'val2'})
+        self.reopen()
+        self.assertEqual(self.store.get_secret(LocationDataType.DATASET, oid, 'key', ''), 'val2')
+        self.assertEqual(self.store.delete_secret(LocationDataType.DATASET, oid, 'key', ''), 'val2')
+        self.assertRaises(HTTPException, self.store.delete_secret, LocationDataType.DATASET, oid, 'key', '')
+        self.assertRaises(FileNotFoundError, self.store.add_update_secret, LocationDataType.DATASET, 'missing', 'key', 'val', '')
+
+        self.store.delete(LocationDataType.DATASET, oid, '')
+        self.assertRaises(FileNotFoundError, self.store.list_secrets, LocationDataType.DATASET, oid, '')
+
+    def test_encrypted_secrets(self):
+        self.store.close()
+        self.store = EncryptedSegmentStorageAdapter(self.test_config)
+        (oid, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name='secrets_test', url='secrets_url'), '')
+        self.store.add_update_secret(LocationDataType.DATASET, oid, 'foo', 'bar', '')
+        self.assertEqual(self.store.get_secret(LocationDataType.DATASET, oid, 'foo', ''), 'bar')
+        self.assertNotEqual(self.store.get_secret_values(LocationDataType.DATASET, oid, '')['foo'], b'bar')
+
+    def test_export_import(self):
+        (oid, data) = self.store.add_new(LocationDataType.DATASET, LocationData(name='exported', url='u'), 'owner')
+        self.store.add_update_secret(LocationDataType.DATASET, oid, 'key', 'value', 'owner')
+        exported = self.store.export_object(LocationDataType.DATASET, oid)
+        self.assertEqual(exported, (data, ['owner'], {'key': 'value'}))
+
+        changed = LocationData(name='changed', url='v')
+        self.assertEqual(self.store.import_objects(LocationDataType.DATASET, [(oid, changed, ['other'], {}), ('new', *exported)]), 2)
+        self.reopen()
+        self.assertEqual(self.store.export_object(LocationDataType.DATASET, oid), (changed, ['other'], {}))
+        self.assertEqual(self.store.export_object(LocationDataType.DATASET, 'new'), exported)
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [('changed', oid), ('exported', 'new')])
+
+    def test_persistent_rotation(self):
+        oids = {}
+        for i in range(30):
+            (oid, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name=f'set{i}', url='u'), 'test_user')
+            oids[oid] = i
+        for oid, i in list(oids.items())[:10]:
+            self.store.delete(LocationDataType.DATASET, oid, 'test_user')
+            del oids[oid]
+        self.assertGreater(len(os.listdir(self.segment_dir)), 1)
+
+        before = self.store.get_list(LocationDataType.DATASET)
+        self.reopen()
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), before)
+        for oid, i in oids.items():
+            self.assertEqual(self.store.get_details(LocationDataType.DATASET, oid).name, f'set{i}')
+
+    def test_torn_write(self):
+        (oid, data) = self.store.add_new(LocationDataType.DATASET, LocationData(name='kept', url='u'), 'test_user')
+        self.store.add_new(LocationDataType.DATASET, LocationData(name='torn', url='u'), 'test_user')
+        self.store.close()
+        active = os.path.join(self.segment_dir, sorted(os.listdir(self.segment_dir))[-1])
+        with open(active, 'r+b') as f:
+            f.truncate(os.path.getsize(active) - 5)
+
+        self.store = SegmentStorageAdapter(self.test_config)
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [('kept', oid)])
+        (oid2, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name='after', url='u'), 'test_user')
+        self.reopen()
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [('after', oid2), ('kept', oid)])
+
+    def test_compaction(self):
+        (kept, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name='kept', url='u'), 'test_user')
+        self.store.add_update_secret(LocationDataType.DATASET, kept, 'key', 'value', 'test_user')
+        for i in range(30):
+            (oid, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name=f'set{i}', url='u', metadata={'i': str(i)}), 'test_user')
+            self.store.delete(LocationDataType.DATASET, oid, 'test_user')
+        self.assertGreater(self.store.garbage_ratio(), 0.5)
+        files = len(os.listdir(self.segment_dir))
+
+        self.assertTrue(self.store.compact())
+        self.assertLess(len(os.listdir(self.segment_dir)), files)
+        self.assertLess(self.store.garbage_ratio(), 0.5)
+        self.assertFalse(self.store.compact())
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [('kept', kept)])
+        self.assertEqual(self.store.get_secret(LocationDataType.DATASET, kept, 'key', ''), 'value')
+
+        self.reopen()
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [('kept', kept)])
+        self.assertEqual(self.store.get_secret(LocationDataType.DATASET, kept, 'key', ''), 'value')
+
+    def test_read_during_compaction(self):
+        kept = [self.store.add_new(LocationDataType.DATASET, LocationData(name=f'kept{i}', url='u'), 'test_user')[0]
+                for i in range(20)]
+        for oid in kept:
+            self.store.add_update_secret(LocationDataType.DATASET, oid, 'key', 'value', 'test_user')
+        stop = threading.Event()
+
+        def read():
+            reads = 0
+            while not stop.is_set():
+                for oid in kept:
+                    self.assertEqual(self.store.get_details(LocationDataType.DATASET, oid).url, 'u')
+                    self.assertEqual(self.store.get_secret(LocationDataType.DATASET, oid, 'key', ''), 'value')
+                self.assertEqual(len(self.store.get_many(LocationDataType.DATASET, kept)), len(kept))
+                reads += 1
+            return reads
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            readers = [executor.submit(read) for _ in range(4)]
+            try:
+                for i in range(30):
+                    (oid, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name=f'set{i}', url='u'), 'test_user')
+                    self.store.delete(LocationDataType.DATASET, oid, 'test_user')
+                    self.store.update_details(LocationDataType.DATASET, kept[i % len(kept)],
+                                              LocationData(name=f'kept{i % len(kept)}', url='u'), 'test_user')
+                    self.store.compact(force=True)
+            finally:
+                stop.set()
+            for reader in readers:
+                self.assertGreater(reader.result(), 0)
+
+    def test_query(self):
+        for i in range(10):
+            self.store.add_new(LocationDataType.DATASET, LocationData(name=f'set{i}', url=f'http://site{i % 2}.eu/', metadata={'i': str(i)}), 'test_user')
+        result = self.store.query(LocationDataType.DATASET, QueryFilters(url='site1'))
+        self.assertEqual([name for name, _ in result], ['set1', 'set3', 'set5', 'set7', 'set9'])
+        self.assertEqual(self.store.get_key_counts(LocationDataType.DATASET), {'i': 10})
+        self.assertEqual(self.store.count(LocationDataType.DATASET), 10)
+        self.assertEqual(self.store.count(LocationDataType.DATASET, QueryFilters(url='site1', has_key=['i'])), 5)
+
+    def test_batch(self):
+        (oid, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name='old', url='u'), 'test_user')
+        results = self.store.apply_batch(LocationDataType.DATASET, [
+            BatchOperation(action='create', data=LocationData(name='new', url='u')),
+            BatchOperation(action='update', oid=oid, data=LocationData(name='renamed', url='u'))], 'test_user')
+        self.assertEqual(sorted(self.store.get_list(LocationDataType.DATASET)), [('new', results[0][0]), ('renamed', oid)])
+        self.reopen()
+        self.assertEqual(sorted(self.store.get_list(LocationDataType.DATASET)), [('new', results[0][0]), ('renamed', oid)])
+
+        # a torn batch is dropped as a whole
+        self.store.apply_batch(LocationDataType.DATASET, [
+            BatchOperation(action='create', data=LocationData(name='lost', url='u')),
+            BatchOperation(action='delete', oid=oid)], 'test_user')
+        self.store.close()
+        active = os.path.join(self.segment_dir, sorted(os.listdir(self.segment_dir))[-1])
+        with open(active, 'r+b') as f:
+            f.truncate(os.path.getsize(active) - 5)
+        self.store = SegmentStorageAdapter(self.test_config)
+        self.assertEqual(sorted(self.store.get_list(LocationDataType.DATASET)), [('new', results[0][0]), ('renamed', oid)])
+
+        self.assertRaises(HTTPException, self.store.apply_batch, LocationDataType.DATASET,
+                          [BatchOperation(action='delete', oid='missing')], 'test_user')
+
+    def test_fsync(self):
+        Settings = namedtuple('Settings', ['json_storage_path', 'segment_path', 'compaction_interval', 'segment_fsync'])
+        for fsync, expected in ((True, 2), (False, 0)):
+            store = SegmentStorageAdapter(Settings('/tmp/json_test/', f'/tmp/json_test/{fsync}', 0, fsync))
+            with mock.patch('apiserver.storage.SegmentStorageAdapter.os.fsync') as synced:
+                store.add_new(LocationDataType.DATASET, LocationData(name='single', url='u'), 'test_user')
+                # all records of a batch share one sync
+                store.apply_batch(LocationDataType.DATASET, [
+                    BatchOperation(action='create', data=LocationData(name=f'batch{i}', url='u')) for i in range(3)], 'test_user')
+            store.close()
+            self.assertEqual(synced.call_count, expected)
+
+    def test_delete_many(self):
+        oids = [self.store.add_new(LocationDataType.DATASET, LocationData(name=f'bulk{i}', url='u'), 'test_user')[0] for i in range(3)]
+        self.assertEqual(self.store.delete_many(LocationDataType.DATASET, [oids[0], 'missing', oids[1]], 'test_user'), oids[:2])
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [('bulk2', oids[2])])
+        self.store.close()
+        self.store = SegmentStorageAdapter(self.test_config)
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [('bulk2', oids[2])])
+
+    def test_get_many(self):
+        data = {}
+        for i in range(20):
+            (oid, d) = self.store.add_new(LocationDataType.DATASET, LocationData(name=f'set{i}', url='u'), 'test_user')
+            data[oid] = d
+        self.assertEqual(self.store.get_many(LocationDataType.DATASET, list(data) + ['missing']), data)
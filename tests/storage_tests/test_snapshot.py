@@ -0,0 +1,215 @@
+import asyncio
+import gzip
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from collections import namedtuple
+from unittest import mock
+
+from cryptography.fernet import Fernet
+from fastapi.exceptions import HTTPException
+
+from apiserver.storage import (AsyncStorageAdapter, ChangeLog, ChangesExpired, ChangeTrackingStorageAdapter,
+                               EncryptedJsonFileStorageAdapter, LocationData, LocationDataType,
+                               SnapshotStorageAdapter)
+from apiserver.storage.BulkTransfer import iter_gunzip, iter_lines, iter_snapshot, restore_lines
+from apiserver.storage.Snapshot import WriteGate
+
+
+async def chunks_of(body: bytes, size: int = 100):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+class SnapshotTests(unittest.TestCase):
+    def setUp(self):
+        self.base_dir = '/tmp/json_test/'
+        self.key = Fernet.generate_key()
+        self.source = self.stack('source')
+        self.dataset = LocationDataType.DATASET
+
+    def stack(self, name: str):
+        Settings = namedtuple('Settings', ['json_storage_path', 'encryption_key'])
+        config = Settings(json_storage_path=os.path.join(self.base_dir, name), encryption_key=self.key)
+        pathlib.Path(config.json_storage_path).mkdir(parents=True, exist_ok=True)
+        changelog = ChangeLog(os.path.join(config.json_storage_path, '_changes.log'))
+        backend = EncryptedJsonFileStorageAdapter(config)
+        return backend, changelog, SnapshotStorageAdapter(ChangeTrackingStorageAdapter(backend, changelog), changelog)
+
+    def tearDown(self):
+        self.source[1].close()
+        if os.path.exists(self.base_dir):
+            shutil.rmtree(self.base_dir)
+
+    def add(self, name: str, secret: str = None):
+        store = self.source[2]
+        (oid, _) = store.add_new(self.dataset, LocationData(name=name, url=f'u/{name}'), 'test_user')
+        if secret is not None:
+            store.add_update_secret(self.dataset, oid, 'key', secret, 'test_user')
+        return oid
+
+    def test_point_in_time(self):
+        store = self.source[2]
+        kept, changed, deleted = self.add('kept'), self.add('changed', 's1'), self.add('deleted')
+        snapshot = store.begin_snapshot()
+        records = snapshot.records()
+        header = next(records)
+        self.assertEqual(header['seq'], self.source[1].seq)
+        self.assertIsNone(header['since'])
+
+        store.update_details(self.dataset, changed, LocationData(name='changed', url='new'), 'test_user')
+        store.add_update_secret(self.dataset, changed, 'key', 's2', 'test_user')
+        store.delete(self.dataset, deleted, 'test_user')
+        self.add('new')
+
+        rest = list(records)
+        self.assertEqual(rest[-1], {'end': True, 'objects': 3, 'deleted': 0})
+        objects = {record['oid']: record for record in rest[:-1]}
+        self.assertEqual(set(objects), {kept, changed, deleted})
+        self.assertEqual(objects[changed]['data']['url'], 'u/changed')
+        self.assertEqual(objects[changed]['users'], ['test_user'])
+        # secrets are kept as stored
+        self.assertNotEqual(objects[changed]['secrets']['key'], 's1')
+        self.assertEqual(Fernet(self.key).decrypt(objects[changed]['secrets']['key'].encode()), b's1')
+        snapshot.close()
+
+    def test_preserved_spilled(self):
+        store = self.source[2]
+        oids = [self.add(f'obj{i}') for i in range(3)]
+        spills = []
+        create = tempfile.TemporaryFile
+
+        def temporary_file(*args, **kwargs):
+            spills.append(create(*args, **kwargs))
+            return spills[-1]
+
+        with mock.patch('apiserver.storage.Snapshot.tempfile.TemporaryFile', side_effect=temporary_file):
+            snapshot = store.begin_snapshot()
+            records = snapshot.records()
+            next(records)
+            for oid in oids:
+                store.update_details(self.dataset, oid, LocationData(name='changed', url='new'), 'test_user')
+            self.assertEqual(len(spills), 1)
+            self.assertEqual(sorted(record['data']['name'] for record in list(records)[:-1]), ['obj0', 'obj1', 'obj2'])
+            snapshot.close()
+            self.assertTrue(spills[0].closed)
+
+            # also dropped when the snapshot is abandoned
+            snapshot = store.begin_snapshot()
+            next(snapshot.records())
+            store.delete(self.dataset, oids[0], 'test_user')
+            snapshot.close()
+            snapshot.close()
+            self.assertTrue(spills[1].closed)
+            store.delete(self.dataset, oids[1], 'test_user')
+            self.assertEqual(len(spills), 2)
+
+    def test_incremental(self):
+        store = self.source[2]
+        kept, changed, deleted = self.add('kept'), self.add('changed'), self.add('deleted')
+        full = store.begin_snapshot()
+        self.assertEqual(len(list(full.records())), 5)
+        full.close()
+
+        store.update_details(self.dataset, changed, LocationData(name='changed', url='new'), 'test_user')
+        store.delete(self.dataset, deleted, 'test_user')
+        added = self.add('added')
+
+        incremental = store.begin_snapshot(since=full.seq)
+        records = list(incremental.records())
+        incremental.close()
+        self.assertEqual(records[0]['since'], full.seq)
+        self.assertEqual({record['oid'] for record in records[1:-1] if 'data' in record}, {changed, added})
+        self.assertEqual([record['oid'] for record in records[1:-1] if record.get('deleted')], [deleted])
+        self.assertEqual(records[-1], {'end': True, 'objects': 2, 'deleted': 1})
+
+        with self.assertRaises(ChangesExpired):
+            store.begin_snapshot(since=self.source[1].seq + 1)
+
+    def test_restore(self):
+        secret_oid = self.add('with secret', 'value')
+        self.add('plain')
+        full = self.source[2].begin_snapshot()
+        deleted = self.add('deleted later')
+        source = AsyncStorageAdapter(self.source[2], max_workers=2)
+        target_backend, target_log, target = self.stack('target')
+        restore = AsyncStorageAdapter(target, max_workers=2)
+
+        async def take(since=None):
+            snapshot = full if since is None else await source.begin_snapshot(since)
+            return b''.join([chunk async for chunk in iter_snapshot(source, snapshot, chunk_size=2)])
+
+        async def run():
+            body = await take()
+            self.assertEqual(json.loads(gzip.decompress(body).split(b'\n')[0])['seq'], full.seq)
+            result = await restore_lines(restore, iter_lines(iter_gunzip(chunks_of(body))), 'test_user', chunk_size=1)
+            self.assertEqual((result.restored, result.deleted, result.failed, result.complete, result.seq),
+                             (2, 0, 0, True, full.seq))
+
+            self.source[2].delete(self.dataset, deleted, 'test_user')
+            self.source[2].update_details(self.dataset, secret_oid, LocationData(name='with secret', url='new'), 'test_user')
+            body = await take(full.seq)
+            result = await restore_lines(restore, iter_lines(iter_gunzip(chunks_of(body))), 'test_user')
+            self.assertEqual((result.restored, result.deleted, result.complete), (1, 0, True))
+
+            # the restore is a change of the target
+            self.assertEqual(len(target_log.changes(self.dataset, 0).changes), 3)
+            self.assertEqual(target_backend.get_details(self.dataset, secret_oid).url, 'new')
+            self.assertEqual(target_backend.get_secret(self.dataset, secret_oid, 'key', 'test_user'), 'value')
+            self.assertEqual(target_backend.export_object(self.dataset, secret_oid),
+                             self.source[0].export_object(self.dataset, secret_oid))
+            self.assertEqual(sorted(target_backend.get_list(self.dataset)), sorted(self.source[0].get_list(self.dataset)))
+
+            # a truncated snapshot is restored as far as it goes
+            result = await restore_lines(restore, iter_lines(iter_gunzip(chunks_of(body[:-20]))), 'test_user')
+            self.assertFalse(result.complete)
+
+            with self.assertRaises(HTTPException):
+                await restore_lines(restore, iter_lines(iter_gunzip(chunks_of(gzip.compress(b'{"name": "x"}\n')))), 'test_user')
+            with self.assertRaises(HTTPException):
+                await restore_lines(restore, iter_lines(iter_gunzip(chunks_of(b'not compressed'))), 'test_user')
+
+            header = json.dumps({'format': 1, 'seq': 1, 'created': 0})
+            invalid = "\n".join([header, '{"type": "dataset", "oid": "x", "data": {"name": "a", "url": "b"}}', 'no json',
+                                 '{"end": true, "objects": 1, "deleted": 0}', ''])
+            result = await restore_lines(restore, iter_lines(iter_gunzip(chunks_of(gzip.compress(invalid.encode())))), 'test_user')
+            self.assertEqual([error.line for error in result.errors], [2, 3])
+            self.assertFalse(result.complete)
+
+        try:
+            asyncio.run(run())
+        finally:
+            source.shutdown()
+            restore.shutdown()
+            target_log.close()
+
+    def test_write_gate(self):
+        gate = WriteGate()
+        events = []
+
+        def write():
+            with gate.shared():
+                events.append('write')
+
+        with gate.shared():
+            def snapshot():
+                with gate.exclusive():
+                    events.append('snapshot')
+                    time.sleep(0.1)
+            thread = threading.Thread(target=snapshot)
+            thread.start()
+            time.sleep(0.1)
+            # the exclusive section waits for the running write
+            self.assertEqual(events, [])
+        while not events:
+            time.sleep(0.01)
+        writer = threading.Thread(target=write)
+        writer.start()
+        thread.join()
+        writer.join()
+        self.assertEqual(events, ['snapshot', 'write'])
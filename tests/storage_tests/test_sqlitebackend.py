@@ -0,0 +1,237 @@
+import os
+import pathlib
+import shutil
+import sqlite3
+import unittest
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from cryptography.fernet import Fernet
+from fastapi.exceptions import HTTPException
+
+from apiserver.storage import BatchOperation, LocationData, LocationDataType, QueryFilters, QueryPage
+from apiserver.storage.JsonFileStorageAdapter import JsonFileStorageAdapter, iter_stored_objects
+from apiserver.storage.SqliteStorageAdapter import EncryptedSqliteStorageAdapter, SqliteStorageAdapter
+
+
+class SqliteTests(unittest.TestCase):
+    def setUp(self):
+        Settings = namedtuple('Settings', ['json_storage_path', 'sqlite_path', 'encryption_key'])
+        self.test_config = Settings('/tmp/json_test/', '/tmp/json_test/test.sqlite', Fernet.generate_key())
+        pathlib.Path(self.test_config.json_storage_path).mkdir(
+            parents=True, exist_ok=True)
+        self.store = SqliteStorageAdapter(self.test_config)
+
+    def tearDown(self):
+        if os.path.exists(self.test_config.json_storage_path):
+            shutil.rmtree(self.test_config.json_storage_path)
+
+    def test_not_path(self):
+        Settings = namedtuple('Settings', ['json_storage_path', 'sqlite_path'])
+        self.assertRaises(Exception, SqliteStorageAdapter, Settings('/tmp/json_test/', '/tmp/json_test/blah/test.sqlite'))
+
+    def test_add_get_update_delete(self):
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [])
+        l_data = LocationData(name='test1', url='http://n.go', metadata={'key': 'value'})
+        (oid, data) = self.store.add_new(LocationDataType.DATASET, l_data, 'test_user')
+        self.assertEqual(l_data, data)
+        self.assertEqual(self.store.get_details(LocationDataType.DATASET, oid), l_data)
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [('test1', oid)])
+        version = self.store.get_version(LocationDataType.DATASET, oid)
+
+        new_data = LocationData(name='test2', url='http://go.n')
+        self.assertEqual(self.store.update_details(LocationDataType.DATASET, oid, new_data, 'tst2'), (oid, new_data))
+        self.assertEqual(self.store.get_details(LocationDataType.DATASET, oid), new_data)
+        self.assertNotEqual(self.store.get_version(LocationDataType.DATASET, oid), version)
+        self.assertEqual(self.store.get_key_counts(LocationDataType.DATASET), {})
+
+        self.store.delete(LocationDataType.DATASET, oid, 'test_user')
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [])
+        self.assertRaises(FileNotFoundError, self.store.get_details, LocationDataType.DATASET, oid)
+        self.assertRaises(FileNotFoundError, self.store.delete, LocationDataType.DATASET, oid, 'test_user')
+        self.assertRaises(FileNotFoundError, self.store.update_details, LocationDataType.DATASET, oid, new_data, 'test_user')
+
+    def test_update_races_delete(self):
+        oids = [self.store.add_new(LocationDataType.DATASET, LocationData(name=f'race {i}', url='u'), 'test_user')[0]
+                for i in range(50)]
+
+        def update(oid):
+            for i in range(5):
+                try:
+                    self.store.update_details(LocationDataType.DATASET, oid, LocationData(name=f'updated {i}', url='u'), 'test_user')
+                    self.store.add_update_secret(LocationDataType.DATASET, oid, f'key {i}', 'value', 'test_user')
+                except FileNotFoundError:
+                    return
+
+        def delete(oid):
+            self.store.delete(LocationDataType.DATASET, oid, 'test_user')
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = [executor.submit(update, oid) for oid in oids] + [executor.submit(delete, oid) for oid in oids]
+            for future in futures:
+                future.result()
+        # an update that loses against the delete must not bring the object back
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [])
+        self.assertEqual(self.store.count(LocationDataType.DATASET), 0)
+        conn = sqlite3.connect(self.test_config.sqlite_path)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM "dataset_secrets"').fetchone()[0], 0)
+        conn.close()
+
+    def test_persistent(self):
+        (oid, data) = self.store.add_new(LocationDataType.STORAGETARGET, LocationData(name='t', url='u'), 'test_user')
+        reopened = SqliteStorageAdapter(self.test_config)
+        self.assertEqual(reopened.get_details(LocationDataType.STORAGETARGET, oid), data)
+
+    def test_secrets(self):
+        (oid, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name='secrets_test', url='secrets_url'), '')
+        self.assertEqual(self.store.list_secrets(LocationDataType.DATASET, oid, ''), [])
+        self.store.add_update_secret(LocationDataType.DATASET, oid, 'key', 'val', '')
+        self.store.add_update_secret(LocationDataType.DATASET, oid, 'key', 'val2', '')
+        self.assertEqual(self.store.get_secret_values(LocationDataType.DATASET, oid, ''), {'key': 'val2'})
+        self.assertEqual(self.store.get_secret(LocationDataType.DATASET, oid, 'key', ''), 'val2')
+        self.assertEqual(self.store.delete_secret(LocationDataType.DATASET, oid, 'key', ''), 'val2')
+        self.assertRaises(HTTPException, self.store.delete_secret, LocationDataType.DATASET, oid, 'key', '')
+        self.assertRaises(HTTPException, self.store.get_secret, LocationDataType.DATASET, oid, 'key', '')
+        self.assertRaises(FileNotFoundError, self.store.add_update_secret, LocationDataType.DATASET, 'missing', 'key', 'val', '')
+
+    def test_encrypted_secrets(self):
+        store = EncryptedSqliteStorageAdapter(self.test_config)
+        (oid, _) = store.add_new(LocationDataType.DATASET, LocationData(name='secrets_test', url='secrets_url'), '')
+        store.add_update_secret(LocationDataType.DATASET, oid, 'foo', 'bar', '')
+        self.assertEqual(store.get_secret(LocationDataType.DATASET, oid, 'foo', ''), 'bar')
+        self.assertNotEqual(self.store.get_secret(LocationDataType.DATASET, oid, 'foo', ''), 'bar')
+
+    def test_query_same_as_json(self):
+        json_store = JsonFileStorageAdapter(self.test_config)
+        for i in range(5):
+            for j in range(5):
+                data = LocationData(name=f'Set "{i}" {j}', url=f'http://SITE{i}.eu/',
+                                    metadata={'i': str(i), 'Straße': 'x'} if j % 2 else {'i': str(i)})
+                (oid, _) = json_store.add_new(LocationDataType.DATASET, data, 'test_user')
+                self.store.import_objects(LocationDataType.DATASET, [(oid, data, ['test_user'], {})])
+
+        for filters in [QueryFilters(), QueryFilters(name='"1"'), QueryFilters(url='site2'), QueryFilters(search='STRASSE'),
+                        QueryFilters(has_key=['Straße', 'i'], search='set'), QueryFilters(name='1', url='e', search='3'),
+                        QueryFilters(search='x'), QueryFilters(has_key=['missing'])]:
+            self.assertEqual(self.store.query(LocationDataType.DATASET, filters),
+                             json_store.query(LocationDataType.DATASET, filters), f"{filters}")
+        everything = json_store.query(LocationDataType.DATASET)
+        self.assertEqual(self.store.query(LocationDataType.DATASET, page=QueryPage(number=2, size=4, after=everything[3])), everything[8:12])
+        self.assertEqual(self.store.get_key_counts(LocationDataType.DATASET), json_store.get_key_counts(LocationDataType.DATASET))
+
+    def test_migration(self):
+        json_store = JsonFileStorageAdapter(self.test_config)
+        (oid, data) = json_store.add_new(LocationDataType.DATASET, LocationData(name='migrated', url='u', metadata={'k': 'v'}), 'owner')
+        json_store.add_update_secret(LocationDataType.DATASET, oid, 'secret', 'value', 'owner')
+        (oid2, _) = json_store.add_new(LocationDataType.TEMPLATE, LocationData(name='template', url='u'), 'owner')
+
+        for n_type in LocationDataType:
+            self.store.import_objects(n_type, iter_stored_objects(self.test_config.json_storage_path, n_type))
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [('migrated', oid)])
+        self.assertEqual(self.store.get_details(LocationDataType.DATASET, oid), data)
+        self.assertEqual(self.store.get_secret(LocationDataType.DATASET, oid, 'secret', ''), 'value')
+        self.assertEqual(self.store.get_list(LocationDataType.TEMPLATE), [('template', oid2)])
+        self.assertEqual(self.store.export_object(LocationDataType.DATASET, oid), (data, ['owner'], {'secret': 'value'}))
+
+        # a second import replaces the objects and their secrets
+        version = self.store.get_version(LocationDataType.DATASET, oid)
+        self.store.import_objects(LocationDataType.DATASET, [(oid, data, ['other'], {})])
+        self.assertEqual(self.store.export_object(LocationDataType.DATASET, oid), (data, ['other'], {}))
+        self.assertNotEqual(self.store.get_version(LocationDataType.DATASET, oid), version)
+        self.assertRaises(FileNotFoundError, self.store.export_object, LocationDataType.DATASET, 'missing')
+
+    def test_batch_rollback(self):
+        (oid, data) = self.store.add_new(LocationDataType.DATASET, LocationData(name='kept', url='u'), 'test_user')
+        self.assertRaises(HTTPException, self.store.apply_batch, LocationDataType.DATASET, [
+            BatchOperation(action='update', oid=oid, data=LocationData(name='changed', url='u')),
+            BatchOperation(action='delete', oid='missing')], 'test_user')
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [('kept', oid)])
+
+        results = self.store.apply_batch(LocationDataType.DATASET, [
+            BatchOperation(action='delete', oid=oid),
+            BatchOperation(action='create', data=data)], 'test_user')
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [('kept', results[1][0])])
+
+    def test_delete_many(self):
+        oids = [self.store.add_new(LocationDataType.DATASET, LocationData(name=f'bulk{i}', url='u', metadata={'k': 'v'}), 'test_user')[0] for i in range(3)]
+        self.store.add_update_secret(LocationDataType.DATASET, oids[0], 'key', 'value', 'test_user')
+        self.assertEqual(self.store.delete_many(LocationDataType.DATASET, [oids[0], 'missing', oids[1]], 'test_user'), oids[:2])
+        self.assertEqual(self.store.get_list(LocationDataType.DATASET), [('bulk2', oids[2])])
+        self.assertEqual(self.store.get_key_counts(LocationDataType.DATASET), {'k': 1})
+        self.assertRaises(FileNotFoundError, self.store.list_secrets, LocationDataType.DATASET, oids[0], 'test_user')
+
+    def test_count(self):
+        (oid, data) = self.store.add_new(LocationDataType.DATASET, LocationData(name='one', url='u', metadata={'k': 'v'}), 'test_user')
+        self.store.update_details(LocationDataType.DATASET, oid, data, 'test_user')
+        self.store.apply_batch(LocationDataType.DATASET, [BatchOperation(action='create', data=data),
+                                                          BatchOperation(action='update', oid=oid, data=data)], 'test_user')
+        self.assertEqual(self.store.count(LocationDataType.DATASET), 2)
+        self.assertEqual(self.store.count(LocationDataType.DATASET, QueryFilters(name='on', has_key=['k'])), 2)
+        self.store.delete(LocationDataType.DATASET, oid, 'test_user')
+        self.assertEqual(self.store.count(LocationDataType.DATASET), 1)
+        self.assertEqual(self.store.count(LocationDataType.TEMPLATE), 0)
+
+        # databases without the counts are counted once on startup
+        with sqlite3.connect(self.test_config.sqlite_path) as conn:
+            conn.execute('DROP TABLE "_counts"')
+        self.assertEqual(SqliteStorageAdapter(self.test_config).count(LocationDataType.DATASET), 1)
+
+    def test_facets(self):
+        (oid, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name='one', url='u', metadata={'site': 'jsc', 'format': 'nc'}), 'test_user')
+        self.store.add_new(LocationDataType.DATASET, LocationData(name='two', url='v', metadata={'site': 'jsc'}), 'test_user')
+        self.assertEqual(self.store.get_facets(LocationDataType.DATASET, ['site', 'format']),
+                         {'site': {'jsc': 2}, 'format': {'nc': 1}})
+        self.store.update_details(LocationDataType.DATASET, oid, LocationData(name='one', url='u', metadata={'site': 'bsc'}), 'test_user')
+        self.assertEqual(self.store.get_facets(LocationDataType.DATASET, ['site', 'format']),
+                         {'site': {'jsc': 1, 'bsc': 1}, 'format': {}})
+        self.assertEqual(self.store.get_facets(LocationDataType.DATASET, ['site'], QueryFilters(url='v')), {'site': {'jsc': 1}})
+        self.store.delete(LocationDataType.DATASET, oid, 'test_user')
+        self.assertEqual(self.store.get_facets(LocationDataType.DATASET, ['site']), {'site': {'jsc': 1}})
+
+        # databases without the facets are counted once on startup
+        with sqlite3.connect(self.test_config.sqlite_path) as conn:
+            conn.execute('DROP TABLE "dataset_facets"')
+        self.assertEqual(SqliteStorageAdapter(self.test_config).get_facets(LocationDataType.DATASET, ['site']), {'site': {'jsc': 1}})
+
+    def test_concurrent_facets(self):
+        oids = [self.store.add_new(LocationDataType.DATASET, LocationData(name=f'facet {i}', url='u', metadata={'site': 'S32'}),
+                                   'test_user')[0] for i in range(20)]
+
+        def change(thread):
+            for i in range(30):
+                oid = oids[(thread * 7 + i) % len(oids)]
+                data = LocationData(name='changed', url='u', metadata={'site': f'S{(thread + i) % 12}', 'thread': str(thread)})
+                try:
+                    if i % 10 == 9:
+                        self.store.delete(LocationDataType.DATASET, oid, 'test_user')
+                    elif i % 2:
+                        self.store.apply_batch(LocationDataType.DATASET, [BatchOperation(action='update', oid=oid, data=data)], 'test_user')
+                    else:
+                        self.store.update_details(LocationDataType.DATASET, oid, data, 'test_user')
+                except (FileNotFoundError, HTTPException):
+                    pass
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for future in [executor.submit(change, thread) for thread in range(8)]:
+                future.result()
+        # the maintained counts are the same as counting the stored objects again
+        conn = sqlite3.connect(self.test_config.sqlite_path)
+        facets = sorted(conn.execute('SELECT key, value, count FROM "dataset_facets"').fetchall())
+        recount = sorted(conn.execute('SELECT m.key, m.value, COUNT(*) FROM "dataset", json_each("dataset".metadata) AS m '
+                                      'GROUP BY m.key, m.value').fetchall())
+        stored = conn.execute('SELECT COUNT(*) FROM "dataset"').fetchone()[0]
+        conn.close()
+        self.assertEqual(facets, recount)
+        self.assertEqual(self.store.count(LocationDataType.DATASET), stored)
+        self.assertEqual(sum(self.store.get_facets(LocationDataType.DATASET, ['site'])['site'].values()), stored)
+
+    def test_generation(self):
+        generation = self.store.get_generation(LocationDataType.DATASET)
+        (oid, data) = self.store.add_new(LocationDataType.DATASET, LocationData(name='gen', url='u'), 'test_user')
+        self.assertNotEqual(self.store.get_generation(LocationDataType.DATASET), generation)
+        generation = self.store.get_generation(LocationDataType.DATASET)
+        self.store.add_update_secret(LocationDataType.DATASET, oid, 'key', 'value', 'test_user')
+        self.assertEqual(self.store.get_generation(LocationDataType.DATASET), generation)
+        self.assertEqual(self.store.get_generation(LocationDataType.TEMPLATE), 0)
+        self.store.delete(LocationDataType.DATASET, oid, 'test_user')
+        self.assertNotEqual(self.store.get_generation(LocationDataType.DATASET), generation)
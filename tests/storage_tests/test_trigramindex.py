@@ -0,0 +1,116 @@
+import os
+import pathlib
+import random
+import shutil
+import unittest
+from collections import namedtuple
+
+from apiserver.storage import LocationData, LocationDataType, QueryFilters, SearchField
+from apiserver.storage.JsonFileStorageAdapter import MIN_STALE_REBUILD, JsonFileStorageAdapter
+from apiserver.storage.LocationStorage import contains_term
+from apiserver.storage.TrigramIndex import TrigramIndex, trigrams
+
+
+class TrigramIndexTests(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(42)
+        letters = 'abcAB ßSS/İi'
+        def word():
+            return ''.join(rnd.choice(letters) for _ in range(rnd.randint(0, 8)))
+
+        self.objects = {
+            str(i): LocationData(name=word(), url=word(), metadata={word(): word() for _ in range(rnd.randint(0, 2))})
+            for i in range(200)
+        }
+        self.index = TrigramIndex()
+        for oid, data in self.objects.items():
+            self.index.add(oid, data)
+        self.terms = [word() for _ in range(100)] + ['ss', 'SS', 'ß', 'abc', 'İi', '/a']
+
+    def search(self, term, field):
+        candidates = self.index.query(term, field)
+        if candidates is None:
+            candidates = self.objects.keys()
+        return {oid for oid in candidates if contains_term(self.objects[oid], term, field)}
+
+    def test_trigrams(self):
+        self.assertEqual(trigrams('abcd'), {'abc', 'bcd'})
+        self.assertEqual(trigrams('ab'), set())
+
+    def test_same_as_scan(self):
+        for term in self.terms:
+            if not term:
+                continue
+            for field in SearchField:
+                expected = {oid for oid, data in self.objects.items() if contains_term(data, term, field)}
+                candidates = self.index.query(term, field)
+                if len(term) < 3:
+                    self.assertIsNone(candidates)
+                else:
+                    self.assertTrue(expected <= candidates, f"{term!r} {field}")
+                self.assertEqual(self.search(term, field), expected, f"{term!r} {field}")
+
+    def test_update_and_remove(self):
+        self.objects['0'] = LocationData(name='unique name', url='x')
+        self.index.add('0', self.objects['0'])
+        self.assertEqual(self.index.query('unique', SearchField.NAME), {'0'})
+        self.assertEqual(self.index.query('unique', SearchField.URL), set())
+        self.assertEqual(self.index.stale, 1)
+
+        self.objects['0'] = LocationData(name='other', url='x', metadata={'unique': 'v'})
+        self.index.add('0', self.objects['0'])
+        # the old name stays a candidate until the index is rebuilt
+        self.assertEqual(self.index.query('unique', SearchField.NAME), {'0'})
+        self.assertEqual(self.search('unique', SearchField.NAME), set())
+        self.assertEqual(self.search('unique', SearchField.ANY), {'0'})
+        self.assertEqual(self.index.query('unique', SearchField.ANY, within={'1'}), set())
+
+        self.index.remove('0')
+        self.assertEqual(self.index.query('unique', SearchField.ANY), set())
+        self.assertEqual(len(self.index), len(self.objects) - 1)
+        self.assertEqual(self.index.stale, 3)
+
+
+class JsonSearchTests(unittest.TestCase):
+    def setUp(self):
+        Settings = namedtuple('Settings', ['json_storage_path'])
+        self.test_config = Settings('/tmp/json_test/')
+        pathlib.Path(self.test_config.json_storage_path).mkdir(
+            parents=True, exist_ok=True)
+        self.store = JsonFileStorageAdapter(self.test_config)
+
+    def tearDown(self):
+        if os.path.exists(self.test_config.json_storage_path):
+            shutil.rmtree(self.test_config.json_storage_path)
+
+    def test_index_maintained_on_writes(self):
+        (oid1, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name='First', url='http://site.eu/1'), 'test_user')
+        self.assertEqual(self.store.match_substring(LocationDataType.DATASET, 'site', SearchField.URL), {oid1})
+
+        (oid2, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name='Second', url='http://other.eu/2', metadata={'Site': 'x'}), 'test_user')
+        self.assertEqual(self.store.match_substring(LocationDataType.DATASET, 'site', SearchField.URL), {oid1})
+        self.assertEqual(self.store.match_substring(LocationDataType.DATASET, 'SITE', SearchField.ANY), {oid1, oid2})
+
+        self.store.update_details(LocationDataType.DATASET, oid1, LocationData(name='First', url='http://moved.eu/1'), 'test_user')
+        self.assertEqual(self.store.match_substring(LocationDataType.DATASET, 'site', SearchField.ANY), {oid2})
+
+        self.store.delete(LocationDataType.DATASET, oid2, 'test_user')
+        self.assertEqual(self.store.match_substring(LocationDataType.DATASET, 'site', SearchField.ANY), set())
+        self.assertEqual(self.store.match_substring(LocationDataType.DATASET, 'f', SearchField.NAME), {oid1})
+
+    def test_build_skips_missing(self):
+        (oid1, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name='kept', url='http://site.eu/1'), 'test_user')
+        (oid2, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name='gone', url='http://site.eu/2'), 'test_user')
+        # as if a delete removed the file and waits to update the indexes
+        os.remove(os.path.join(self.test_config.json_storage_path, LocationDataType.DATASET.value, oid2))
+        self.assertEqual(self.store.match_substring(LocationDataType.DATASET, 'site', SearchField.URL), {oid1})
+        self.assertEqual(self.store.query(LocationDataType.DATASET, QueryFilters(url='site')), [('kept', oid1)])
+
+    def test_stale_index_rebuilt(self):
+        (oid, _) = self.store.add_new(LocationDataType.DATASET, LocationData(name='name 0', url='u'), 'test_user')
+        self.assertEqual(self.store.match_substring(LocationDataType.DATASET, 'name 0', SearchField.NAME), {oid})
+        for i in range(1, MIN_STALE_REBUILD + 2):
+            self.store.update_details(LocationDataType.DATASET, oid, LocationData(name=f'name {i}', url='u'), 'test_user')
+        self.assertEqual(self.store.query(LocationDataType.DATASET, QueryFilters(name='name 1')),
+                         [(f'name {MIN_STALE_REBUILD + 1}', oid)])
+        self.assertEqual(self.store.match_substring(LocationDataType.DATASET, 'name 0', SearchField.NAME), set())
@@ -0,0 +1,169 @@
+import json
+import os
+import pathlib
+import shutil
+import threading
+import time
+import unittest
+from collections import namedtuple
+from unittest import mock
+
+from apiserver.storage import LocationData, LocationDataType, QueryFilters
+from apiserver.storage.JsonFileStorageAdapter import INDEX_DIR, WAL_FILE, JsonFileStorageAdapter, StoredData
+from apiserver.storage.WriteAheadLog import WriteAheadLog, fsync_path
+
+
+class WriteAheadLogTests(unittest.TestCase):
+    def setUp(self):
+        self.base_dir = '/tmp/json_test/'
+        pathlib.Path(self.base_dir).mkdir(parents=True, exist_ok=True)
+        self.log_path = os.path.join(self.base_dir, 'test.wal')
+
+    def tearDown(self):
+        if os.path.exists(self.base_dir):
+            shutil.rmtree(self.base_dir)
+
+    def read(self, path):
+        with open(os.path.join(self.base_dir, path), 'r') as f:
+            return f.read()
+
+    def test_commit(self):
+        wal = WriteAheadLog(self.log_path, self.base_dir)
+        wal.commit([('a/one', 'first'), ('two', 'second')])
+        self.assertEqual(self.read('a/one'), 'first')
+        self.assertEqual(self.read('two'), 'second')
+        wal.commit([('a/one', None), ('two', 'changed'), ('missing', None)])
+        self.assertFalse(os.path.exists(os.path.join(self.base_dir, 'a/one')))
+        self.assertEqual(self.read('two'), 'changed')
+        self.assertEqual(wal.syncs, 2)
+        self.assertFalse(os.path.exists(os.path.join(self.base_dir, 'two.tmp')))
+
+    def test_recover(self):
+        with open(self.log_path, 'w') as f:
+            f.write(json.dumps({'seq': 1, 'ops': [['one', 'first'], ['two', 'second']]}) + "\n")
+            f.write(json.dumps({'seq': 2, 'ops': [['one', None]]}) + "\n")
+            f.write('{"seq": 3, "ops": [["three", "thi')
+
+        wal = WriteAheadLog(self.log_path, self.base_dir)
+        self.assertEqual(wal.recovered, {'one', 'two'})
+        self.assertFalse(os.path.exists(os.path.join(self.base_dir, 'one')))
+        self.assertEqual(self.read('two'), 'second')
+        self.assertFalse(os.path.exists(os.path.join(self.base_dir, 'three')))
+        # the replayed records are kept until the next checkpoint, the torn one is cut off
+        with open(self.log_path, 'r') as f:
+            self.assertEqual([json.loads(line)['seq'] for line in f], [1, 2])
+        wal.commit([('four', 'fourth')])
+        wal.checkpoint()
+        self.assertEqual(os.path.getsize(self.log_path), 0)
+        self.assertEqual(self.read('four'), 'fourth')
+
+    def test_checkpoint(self):
+        wal = WriteAheadLog(self.log_path, self.base_dir, checkpoint_size=100)
+        wal.commit([('one', 'x' * 10)])
+        self.assertGreater(os.path.getsize(self.log_path), 0)
+        wal.commit([('two', 'x' * 100)])
+        self.assertEqual(os.path.getsize(self.log_path), 0)
+        self.assertEqual(self.read('two'), 'x' * 100)
+
+    def test_before_checkpoint(self):
+        sizes = []
+        wal = WriteAheadLog(self.log_path, self.base_dir, checkpoint_size=100,
+                            before_checkpoint=lambda: sizes.append(os.path.getsize(self.log_path)))
+        wal.commit([('one', 'x' * 10)])
+        self.assertEqual(sizes, [])
+        wal.commit([('two', 'x' * 100)])
+        # called once, while the log still holds the records
+        self.assertEqual(len(sizes), 1)
+        self.assertGreater(sizes[0], 100)
+        self.assertEqual(os.path.getsize(self.log_path), 0)
+
+    def test_checkpoint_waits_for_block(self):
+        wal = WriteAheadLog(self.log_path, self.base_dir, checkpoint_size=1)
+        with wal.committed([('one', 'first')]):
+            # the record stays in the log while the block runs
+            self.assertGreater(os.path.getsize(self.log_path), 0)
+            self.assertEqual(self.read('one'), 'first')
+        self.assertEqual(os.path.getsize(self.log_path), 0)
+
+    def test_group_commit(self):
+        wal = WriteAheadLog(self.log_path, self.base_dir)
+        real_fsync = os.fsync
+
+        def slow_fsync(fd):
+            time.sleep(0.05)
+            real_fsync(fd)
+
+        with mock.patch('apiserver.storage.WriteAheadLog.os.fsync', side_effect=slow_fsync):
+            threads = [threading.Thread(target=wal.commit, args=([(f'file{i}', str(i))],)) for i in range(20)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        for i in range(20):
+            self.assertEqual(self.read(f'file{i}'), str(i))
+        self.assertLess(wal.syncs, 20)
+
+    def test_adapter_recovery(self):
+        Settings = namedtuple('Settings', ['json_storage_path'])
+        store = JsonFileStorageAdapter(Settings(self.base_dir))
+        (oid, _) = store.add_new(LocationDataType.DATASET, LocationData(name='kept', url='u'), 'test_user')
+        store.add_update_secret(LocationDataType.DATASET, oid, 'key', 'value', 'test_user')
+
+        # crash after the record was logged, before it was applied
+        data = StoredData(users=['test_user'], actualData=LocationData(name='logged', url='u'))
+        with open(os.path.join(self.base_dir, WAL_FILE), 'a') as f:
+            f.write(json.dumps({'seq': 99, 'ops': [['dataset/logged-oid', json.dumps(data.dict())],
+                                                   [f'dataset/{oid}', None], [f'dataset/{oid}.secrets', None]]}) + "\n")
+
+        store = JsonFileStorageAdapter(Settings(self.base_dir))
+        self.assertEqual(store.get_list(LocationDataType.DATASET), [('logged', 'logged-oid')])
+        self.assertFalse(os.path.exists(os.path.join(self.base_dir, 'dataset', oid + '.secrets')))
+
+    def test_adapter_journal_tail_lost(self):
+        Settings = namedtuple('Settings', ['json_storage_path', 'wal_checkpoint_size'])
+        settings = Settings(self.base_dir, 1)
+        index_dir = os.path.join(self.base_dir, INDEX_DIR)
+        synced = {}
+
+        def remember(path):
+            if path.endswith('.journal'):
+                with open(path, 'r') as f:
+                    synced[path] = f.read()
+            fsync_path(path)
+
+        # a checkpoint after every commit
+        with mock.patch('apiserver.storage.NameIndex.fsync_path', side_effect=remember):
+            store = JsonFileStorageAdapter(settings)
+            (oid, _) = store.add_new(LocationDataType.DATASET, LocationData(name='old', url='u'), 'test_user')
+            store.update_details(LocationDataType.DATASET, oid, LocationData(name='new', url='u'), 'test_user')
+        self.assertEqual(os.path.getsize(os.path.join(self.base_dir, WAL_FILE)), 0)
+
+        # power loss, only what has been synced of the journals is left
+        for name in os.listdir(index_dir):
+            if name.endswith('.journal'):
+                path = os.path.join(index_dir, name)
+                with open(path, 'w') as f:
+                    f.write(synced.get(path, ''))
+
+        store = JsonFileStorageAdapter(settings)
+        self.assertEqual(store.get_list(LocationDataType.DATASET), [('new', oid)])
+
+    def test_adapter_recovery_rename(self):
+        Settings = namedtuple('Settings', ['json_storage_path'])
+        store = JsonFileStorageAdapter(Settings(self.base_dir))
+        (oid, _) = store.add_new(LocationDataType.DATASET, LocationData(name='old', url='u'), 'test_user')
+        generation = store.get_generation(LocationDataType.DATASET)
+
+        # crash after the rename was logged, before the name index was told
+        data = StoredData(users=['test_user'], actualData=LocationData(name='new', url='u'))
+        with open(os.path.join(self.base_dir, WAL_FILE), 'a') as f:
+            f.write(json.dumps({'seq': 99, 'ops': [[f'dataset/{oid}', json.dumps(data.dict())]]}) + "\n")
+
+        store = JsonFileStorageAdapter(Settings(self.base_dir))
+        self.assertEqual(store.get_list(LocationDataType.DATASET), [('new', oid)])
+        self.assertEqual(store.query(LocationDataType.DATASET, QueryFilters(name='new')), [('new', oid)])
+        self.assertEqual(store.query(LocationDataType.DATASET, QueryFilters(name='old')), [])
+        self.assertNotEqual(store.get_generation(LocationDataType.DATASET), generation)
+        # the index has been persisted
+        store = JsonFileStorageAdapter(Settings(self.base_dir))
+        self.assertEqual(store.get_list(LocationDataType.DATASET), [('new', oid)])